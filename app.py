@@ -0,0 +1,821 @@
+import tkinter as tk
+from tkinter import ttk, scrolledtext, filedialog
+import argparse
+import queue
+import threading
+import time
+from bisect import bisect_right
+import metrics
+from audio_cache import AudioCache
+from audio_export import DEFAULT_VBR_QUALITY, format_for_path
+from backends import BACKENDS, DEFAULT_SETTINGS, VOICE_TYPES, available_backends, choose_backend, create_backend
+from dialog import ScriptRenderer, is_script
+from segments import SegmentTimeline
+from synthesis_worker import BACKGROUND, INTERACTIVE, SynthesisWorker
+from text_processing import split_into_chunks
+from timing import locate_chunks
+
+# The playhead, level meter and spectrogram are updated about 30 times a second
+FRAME_MS = 33
+
+# The audio output, matplotlib, numpy/scipy and pydub are imported on first
+# use, or in the background once the window is up, so the window appears quickly
+
+
+def preload_modules():
+    """Import the heavy playback and audio modules ahead of the first click"""
+    import audio_buffer  # noqa: F401
+    import playback  # noqa: F401
+    import streaming  # noqa: F401
+
+    # Sets up the scratch area, which deletes files left by runs that crashed
+    import scratch
+    scratch.default_area()
+
+
+class TextToSpeechApp:
+    def __init__(self, root, backend_name=None):
+        self.root = root
+        self.root.title("Text to Speech Converter")
+        self.root.geometry("800x650")
+
+        # The audio player is created on first use
+        self.player = None
+        self.waveform = None
+
+        # The level meter and spectrogram are redrawn on a timer while playing
+        self.blitter = None
+        self.level_meter = None
+        self.spectrogram = None
+        self.live_job = None
+
+        # Per-sentence audio of the last text played, at the engine's normal
+        # speed and pitch; edits re-synthesize only the sentences that changed
+        self.timeline = None
+        self.play_speed = 1.0
+        self.segment_total = 0
+        self.playing_note = ""
+
+        # When Play was pressed, until the first audio is heard
+        self.requested_at = None
+
+        # Where the text being played is in the text box, for highlighting and click-to-seek
+        self.timing = None
+        self.chunk_spans = None
+        self.text_offset = 0
+        self.highlighted = (None, None)
+
+        # Cache of synthesized audio shared by Play and Save across all engines
+        self.cache = AudioCache()
+        self.backend_name = backend_name or choose_backend()
+        self.worker = None
+
+        # Scripts with [speaker] tags get an engine per voice, created on first use
+        self.script_renderer = None
+
+        # Track if audio is currently playing
+        self.is_playing = False
+        self.streamer = None
+
+        self.create_widgets()
+        self.switch_backend(self.backend_name)
+
+        # Load the rest once the window has been drawn
+        self.root.after(50, self.finish_startup)
+
+    def finish_startup(self):
+        threading.Thread(target=preload_modules, daemon=True).start()
+        self.create_waveform_view()
+
+    def get_player(self):
+        """The audio player, created on first use; its events are handed to the Tk thread"""
+        if self.player is None:
+            from playback import Player
+            self.player = Player(
+                on_position=lambda seconds: self.root.after(0, self.on_position, seconds),
+                on_segment=lambda index, count: self.root.after(0, self.on_segment, index),
+                on_finished=lambda: self.root.after(0, self.on_playback_finished),
+                position_interval=0.1)
+        return self.player
+
+    def create_widgets(self):
+        # Text input area
+        input_frame = ttk.LabelFrame(self.root, text="Enter Text")
+        input_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        self.text_input = scrolledtext.ScrolledText(input_frame, wrap=tk.WORD, width=70, height=10)
+        self.text_input.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        # The sentence and word being spoken are highlighted; Ctrl+click jumps to a sentence
+        self.text_input.tag_config("sentence", background="#fff3b0")
+        self.text_input.tag_config("word", background="#ffc857")
+        self.text_input.bind("<Control-Button-1>", self.on_text_click)
+
+        # Controls frame
+        controls_frame = ttk.LabelFrame(self.root, text="Voice Controls")
+        controls_frame.pack(padx=10, pady=10, fill=tk.X)
+
+        # Voice selection
+        ttk.Label(controls_frame, text="Voice Type:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.voice_type = ttk.Combobox(controls_frame, values=VOICE_TYPES, state="readonly")
+        self.voice_type.current(1)
+        self.voice_type.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+
+        # Speed control
+        ttk.Label(controls_frame, text="Speech Speed:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        self.speed_scale = ttk.Scale(controls_frame, from_=50, to=200, length=200, orient=tk.HORIZONTAL, value=100)
+        self.speed_scale.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        self.speed_label = ttk.Label(controls_frame, text="100%")
+        self.speed_label.grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
+        self.speed_scale.bind("<Motion>",
+                              lambda e: self.speed_label.configure(text=f"{int(self.speed_scale.get())}%"))
+        self.speed_scale.bind("<ButtonRelease-1>", lambda e: self.apply_settings())
+
+        # Pitch control
+        ttk.Label(controls_frame, text="Pitch:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.pitch_scale = ttk.Scale(controls_frame, from_=50, to=200, length=200, orient=tk.HORIZONTAL, value=100)
+        self.pitch_scale.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
+        self.pitch_label = ttk.Label(controls_frame, text="100%")
+        self.pitch_label.grid(row=2, column=2, padx=5, pady=5, sticky=tk.W)
+        self.pitch_scale.bind("<Motion>",
+                              lambda e: self.pitch_label.configure(text=f"{int(self.pitch_scale.get())}%"))
+        self.pitch_scale.bind("<ButtonRelease-1>", lambda e: self.apply_settings())
+
+        # Engine selection, limited to the engines installed on this host
+        ttk.Label(controls_frame, text="Engine:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
+        self.backend_choice = ttk.Combobox(controls_frame, values=available_backends(), state="readonly")
+        self.backend_choice.set(self.backend_name)
+        self.backend_choice.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        self.backend_choice.bind("<<ComboboxSelected>>",
+                                 lambda e: self.switch_backend(self.backend_choice.get()))
+
+        # Silence after each sentence, and loudness normalization of the output
+        ttk.Label(controls_frame, text="Sentence Pause:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+        self.pause_spinbox = ttk.Spinbox(controls_frame, from_=0, to=2000, increment=50, width=6)
+        self.pause_spinbox.set(DEFAULT_SETTINGS["pause_ms"])
+        self.pause_spinbox.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(controls_frame, text="ms").grid(row=4, column=2, padx=5, pady=5, sticky=tk.W)
+        self.normalize_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls_frame, text="Even loudness", variable=self.normalize_var,
+                        command=self.apply_settings).grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
+
+        # Spectrogram of the last few seconds under the waveform; off by default
+        self.spectrogram_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls_frame, text="Spectrogram", variable=self.spectrogram_var,
+                        command=self.layout_plots).grid(row=5, column=2, padx=5, pady=5, sticky=tk.W)
+
+        # Buttons frame
+        buttons_frame = ttk.Frame(self.root)
+        buttons_frame.pack(padx=10, pady=10, fill=tk.X)
+
+        self.play_button = ttk.Button(buttons_frame, text="Play", command=self.play_text)
+        self.play_button.grid(row=0, column=0, padx=5, pady=5)
+
+        self.save_button = ttk.Button(buttons_frame, text="Save as MP3", command=self.save_as_mp3)  # Updated to MP3
+        self.save_button.grid(row=0, column=1, padx=5, pady=5)
+
+        self.stop_button = ttk.Button(buttons_frame, text="Stop", command=self.stop_playback, state=tk.DISABLED)
+        self.stop_button.grid(row=0, column=2, padx=5, pady=5)
+
+        self.pause_button = ttk.Button(buttons_frame, text="Pause", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.grid(row=0, column=3, padx=5, pady=5)
+
+        # Jump between sentences while playing
+        self.previous_button = ttk.Button(buttons_frame, text="<<", width=3, state=tk.DISABLED,
+                                          command=lambda: self.skip_sentence(-1))
+        self.previous_button.grid(row=0, column=4, padx=2, pady=5)
+        self.next_button = ttk.Button(buttons_frame, text=">>", width=3, state=tk.DISABLED,
+                                      command=lambda: self.skip_sentence(1))
+        self.next_button.grid(row=0, column=5, padx=2, pady=5)
+
+        # Export quality: a constant bitrate or VBR
+        ttk.Label(buttons_frame, text="Quality:").grid(row=0, column=7, padx=5, pady=5)
+        self.quality = ttk.Combobox(buttons_frame, values=["128k", "192k", "256k", "320k", "VBR"],
+                                    state="readonly", width=6)
+        self.quality.set("192k")
+        self.quality.grid(row=0, column=8, padx=5, pady=5)
+
+        # Subtitles use the sentence timings, so the audio isn't synthesized again
+        self.subtitles_button = ttk.Button(buttons_frame, text="Save Subtitles", command=self.save_subtitles)
+        self.subtitles_button.grid(row=0, column=9, padx=5, pady=5)
+
+        # Streaming mode starts playback after the first sentence is synthesized
+        self.stream_var = tk.BooleanVar(value=True)
+        self.stream_check = ttk.Checkbutton(buttons_frame, text="Stream playback", variable=self.stream_var)
+        self.stream_check.grid(row=0, column=6, padx=5, pady=5)
+
+        # Waveform display, filled in by create_waveform_view
+        self.waveform_frame = ttk.Frame(self.root, height=300)
+        self.waveform_frame.pack(padx=10, pady=10, fill=tk.BOTH)
+
+        # Status label
+        self.status_label = ttk.Label(self.root, text="Ready")
+        self.status_label.pack(pady=5)
+
+        # Stop playback on exit
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def create_waveform_view(self):
+        """Create the waveform, meter and spectrogram plots; deferred because matplotlib is slow to import"""
+        if self.waveform is not None:
+            return
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from live_view import Blitter, LevelMeter, SpectrogramView
+        from waveform import WaveformView
+
+        self.fig = plt.figure(figsize=(7, 3))
+        self.ax = self.fig.add_subplot()
+        self.meter_ax = self.fig.add_subplot()
+        self.spectrogram_ax = self.fig.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.waveform_frame)
+        self.canvas_widget = self.canvas.get_tk_widget()
+        self.canvas_widget.pack(fill=tk.BOTH)
+
+        # The playhead, meter bars and spectrogram image are blitted, not redrawn with the figure
+        self.blitter = Blitter(self.canvas)
+        self.waveform = WaveformView(self.ax, self.canvas, on_seek=self.seek, blitter=self.blitter)
+        self.level_meter = LevelMeter(self.meter_ax)
+        self.spectrogram = SpectrogramView(self.spectrogram_ax)
+        self.blitter.add(*self.level_meter.artists, *self.spectrogram.artists)
+        self.layout_plots()
+        self.canvas.draw()
+
+    def layout_plots(self):
+        """The waveform with the meter beside it, and the spectrogram below if it is switched on"""
+        if self.waveform is None:
+            return
+        show = self.spectrogram_var.get()
+        grid = self.fig.add_gridspec(2 if show else 1, 2, width_ratios=(12, 1.5))
+        self.ax.set_subplotspec(grid[0, 0])
+        self.meter_ax.set_subplotspec(grid[:, 1])
+        self.spectrogram_ax.set_subplotspec(grid[-1, 0])
+        self.spectrogram_ax.set_visible(show)
+        if show and self.player is not None and self.player.sample_rate:
+            self.spectrogram.reset(self.player.sample_rate)
+        self.fig.tight_layout()
+        self.canvas.draw_idle()
+
+    def switch_backend(self, name):
+        """Start a synthesis worker for another TTS engine"""
+        if self.worker is not None:
+            self.stop_playback()
+            self.worker.stop()
+
+        # The worker creates the engine on its own thread
+        self.backend_name = name
+        self.worker = SynthesisWorker(lambda: create_backend(name, cache=self.cache), self.root).start()
+        self.status_label.config(text=f"Ready ({name})")
+
+        # Start the engine, voice catalog and audio modules before the first click
+        self.worker.submit(lambda backend, job: backend.warm_up(), BACKGROUND)
+
+    def voice_settings(self):
+        """Current synthesis parameters, used as part of the cache key"""
+        return {
+            "voice_type": self.voice_type.get(),
+            "rate": int(self.speed_scale.get()),
+            "pitch": int(self.pitch_scale.get()),
+            "pause_ms": self.pause_ms(),
+            "loudness": DEFAULT_SETTINGS["loudness"] if self.normalize_var.get() else None,
+        }
+
+    def pause_ms(self):
+        """The sentence pause from the spinbox, in milliseconds"""
+        try:
+            return min(max(0, int(self.pause_spinbox.get())), 2000)
+        except ValueError:
+            return DEFAULT_SETTINGS["pause_ms"]
+
+    def text_to_audio(self, text, settings=None, priority=INTERACTIVE, on_done=None, on_error=None,
+                      block=False):
+        """Queue text for synthesis on the current engine; the job's result() is an AudioBuffer"""
+        if not text:
+            return None
+
+        # Settings are read from the widgets here, on the Tk thread
+        if settings is None:
+            settings = self.voice_settings()
+
+        # Served from the cache if this text was already rendered with the same settings
+        return self.worker.submit(lambda backend, job: backend.synthesize(text, settings),
+                                  priority, on_done=on_done, on_error=on_error, block=block)
+
+    def reset_buttons(self):
+        self.play_button.config(state=tk.NORMAL)
+        self.save_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.DISABLED)
+        self.set_transport_state(tk.DISABLED)
+
+    def set_transport_state(self, state):
+        self.pause_button.config(text="Pause", state=state)
+        self.previous_button.config(state=state)
+        self.next_button.config(state=state)
+
+    def input_text(self):
+        """The text box contents without surrounding whitespace"""
+        return self.text_input.get("1.0", tk.END).strip()
+
+    def timeline_for(self, settings):
+        """The segment timeline for the current engine and voice, reused when they are unchanged"""
+        if self.timeline is None or not self.timeline.matches(self.backend_name, settings["voice_type"],
+                                                              settings["pause_ms"]):
+            self.timeline = SegmentTimeline(self.backend_name, settings["voice_type"], settings["pause_ms"])
+        return self.timeline
+
+    def play_text(self):
+        """Process text and play the resulting audio"""
+        text = self.input_text()
+        if not text:
+            self.status_label.config(text="Please enter some text first")
+            return
+
+        # Disable buttons during processing
+        self.play_button.config(state=tk.DISABLED)
+        self.save_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Processing...")
+
+        settings = self.voice_settings()
+        self.requested_at = time.perf_counter()
+        raw_text = self.text_input.get("1.0", "end-1c")
+        self.text_offset = len(raw_text) - len(raw_text.lstrip())
+        self.timing = self.chunk_spans = None
+        if is_script(text):
+            self.play_script(text, settings)
+            return
+        if self.stream_var.get():
+            self.play_streaming(text, settings)
+            return
+
+        def on_error(e):
+            metrics.count("tts_errors_total", stage="play")
+            self.status_label.config(text=f"Error: {str(e)}")
+            self.reset_buttons()
+
+        # Synthesis and effects run on the worker; playback starts on the Tk thread when done
+        timeline = self.timeline_for(settings)
+
+        def synthesize(backend, job):
+            with metrics.span("timeline_update"):
+                changed = timeline.update(text, lambda pieces: backend.synthesize_batch(
+                    [(piece, settings) for piece in pieces], effects=False))
+            segments = [len(buffer.samples) for buffer in timeline.buffers]
+            return changed, backend.apply_effects(timeline.audio, settings, segments)
+
+        def on_done(result):
+            changed, buffer = result
+            self.playing_note = f" ({changed} re-synthesized)" if changed < len(timeline.segments) else ""
+            self.start_playback(buffer, speed=settings["rate"] / 100)
+
+        try:
+            self.worker.submit(synthesize, INTERACTIVE, on_done=on_done, on_error=on_error)
+        except queue.Full:
+            self.status_label.config(text="Busy, please try again")
+            self.reset_buttons()
+            return
+
+        # Stop also cancels synthesis that hasn't finished yet
+        self.stop_button.config(state=tk.NORMAL)
+
+    def rendered_for(self, text, settings):
+        """The remembered rendering of text and its segment lengths, if the text, engine and voice are unchanged"""
+        if (self.timeline is not None and self.timeline.text == text
+                and self.timeline.matches(self.backend_name, settings["voice_type"], settings["pause_ms"])):
+            return self.timeline.audio, [len(buffer.samples) for buffer in self.timeline.buffers]
+        return None, None
+
+    def apply_settings(self):
+        """Reprocess the last rendering with the current sliders, without the engine
+
+        If it is playing, playback carries on from the same point in the text.
+        """
+        text = self.input_text()
+        settings = self.voice_settings()
+        raw, segments = self.rendered_for(text, settings)
+        if raw is None or (self.is_playing and self.streamer is not None):
+            return  # Nothing rendered yet; streamed playback picks up new settings per sentence
+
+        position = None
+        if self.is_playing:
+            # Position in the unprocessed audio, in seconds
+            position = self.player.position * self.play_speed
+
+        def on_done(buffer):
+            if position is None:
+                self.display_waveform(buffer)
+            elif self.is_playing:
+                self.start_playback(buffer, speed=settings["rate"] / 100, offset=position)
+
+        self.worker.submit(lambda backend, job: backend.apply_effects(raw, settings, segments), INTERACTIVE,
+                           on_done=on_done)
+
+    def get_script_renderer(self):
+        if self.script_renderer is None:
+            self.script_renderer = ScriptRenderer(self.cache)
+        return self.script_renderer
+
+    def play_script(self, text, settings):
+        """Render a script with each speaker's voice, all voices at once, then play it
+
+        The sliders and voice box are the defaults for speakers whose tags
+        don't set their own.
+        """
+        renderer = self.get_script_renderer()
+        engine = self.backend_name
+
+        def on_done(result):
+            buffer, timing = result
+            self.playing_note = " (script)"
+            self.start_playback(buffer, timing=timing)
+
+        def on_error(e):
+            metrics.count("tts_errors_total", stage="play")
+            self.status_label.config(text=f"Error: {str(e)}")
+            self.reset_buttons()
+
+        # The worker only waits here while each voice renders on its own thread, except for an
+        # engine that isn't thread-safe, which the worker's own backend renders
+        def render(backend, job):
+            return renderer.render_script(text, settings, engine, backend=backend)
+
+        try:
+            self.worker.submit(render, INTERACTIVE, on_done=on_done, on_error=on_error)
+        except queue.Full:
+            self.status_label.config(text="Busy, please try again")
+            self.reset_buttons()
+            return
+        self.stop_button.config(state=tk.NORMAL)
+
+    def start_playback(self, buffer, speed=1.0, offset=0.0, timing=None):
+        """Show and play the whole-text AudioBuffer from the timeline, or a script's
+
+        speed is the rate the buffer was processed with and offset where to
+        start, in seconds of the unprocessed audio, so later slider changes
+        can resume from the same point. A script's timing comes with it.
+        """
+        try:
+            # Display waveform
+            self.display_waveform(buffer)
+
+            # Sentence and word times scale with the speed the audio was processed at
+            self.play_speed = speed
+            self.timing = timing if timing is not None else self.timeline.timing_index(speed)
+            starts = [sentence[0] for sentence in self.timing.sentences]
+            self.segment_total = len(starts)
+            player = self.get_player()
+            with metrics.span("player_load"):
+                player.load(buffer, segment_starts=starts)
+            player.seek(offset / speed)
+            player.play()
+        except Exception as e:
+            self.status_label.config(text=f"Error: {str(e)}")
+            self.reset_buttons()
+            return
+
+        # Update UI state
+        self.is_playing = True
+        self.stop_button.config(state=tk.NORMAL)
+        self.set_transport_state(tk.NORMAL)
+        self.start_live_view()
+
+    def start_live_view(self):
+        """Follow playback with the playhead, meter and spectrogram until it stops"""
+        if self.live_job is None and self.waveform is not None:
+            self.live_job = self.root.after(FRAME_MS, self.update_live_view)
+
+    def update_live_view(self):
+        """One frame: analyse the audio played since the last frame and blit the changed artists"""
+        self.live_job = None
+        if not self.is_playing or self.player is None:
+            return
+        started = time.perf_counter()
+        sample_rate = self.player.sample_rate
+        if sample_rate and not self.player.is_paused:
+            with metrics.span("live_view"):
+                playhead = self.player.playhead
+                if self.streamer is None:
+                    self.waveform.set_playhead(playhead / sample_rate, draw=False)
+                self.level_meter.update(self.player.read, playhead, sample_rate)
+                if self.spectrogram_var.get():
+                    self.spectrogram.update(self.player.read, playhead, sample_rate)
+                self.blitter.update()
+
+        # Keep to the frame rate however long this frame took
+        elapsed = int((time.perf_counter() - started) * 1000)
+        self.live_job = self.root.after(max(1, FRAME_MS - elapsed), self.update_live_view)
+
+    def clear_live_view(self):
+        if self.live_job is not None:
+            self.root.after_cancel(self.live_job)
+            self.live_job = None
+        if self.waveform is None:
+            return
+        self.waveform.set_playhead(None, draw=False)
+        self.level_meter.clear()
+        self.spectrogram.reset(self.spectrogram.sample_rate)
+        self.blitter.update()
+
+    def on_position(self, seconds):
+        if not self.is_playing or self.streamer is not None:
+            return
+        if self.timing is not None:
+            self.highlight(self.timing.sentence_at_time(seconds), self.timing.word_at_time(seconds))
+
+    def on_segment(self, index):
+        if self.requested_at is not None:
+            mode = "stream" if self.streamer is not None else "whole"
+            metrics.observe("tts_time_to_audio_seconds", time.perf_counter() - self.requested_at, mode=mode)
+            self.requested_at = None
+        if self.is_playing:
+            self.status_label.config(text=f"Playing {index + 1}/{self.segment_total}...{self.playing_note}")
+            if self.streamer is not None:
+                self.highlight(index, None)
+
+    def text_index(self, offset):
+        """Tk index of a character offset into the text being played"""
+        return f"1.0 + {self.text_offset + offset} chars"
+
+    def highlight(self, sentence, word):
+        """Highlight the sentence and word being spoken, only touching the tags when they change"""
+        if (sentence, word) == self.highlighted:
+            return
+        self.highlighted = (sentence, word)
+        self.text_input.tag_remove("sentence", "1.0", tk.END)
+        self.text_input.tag_remove("word", "1.0", tk.END)
+        if sentence is None:
+            return
+
+        if self.timing is not None:
+            start, end = self.timing.sentences[sentence][2:]
+        else:
+            start, end = self.chunk_spans[sentence][:2]
+        self.text_input.tag_add("sentence", self.text_index(start), self.text_index(end))
+        if word is not None:
+            _, start, end = self.timing.words[word]
+            self.text_input.tag_add("word", self.text_index(start), self.text_index(end))
+        self.text_input.see(self.text_index(start))
+
+    def on_text_click(self, event):
+        """Ctrl+click: jump playback to the clicked sentence"""
+        if self.player is None or not self.is_playing:
+            return None
+        clicked = self.text_input.index(f"@{event.x},{event.y}")
+        count = self.text_input.count("1.0", clicked, "chars")
+        offset = (count[0] if count else 0) - self.text_offset
+        if self.timing is not None:
+            self.player.seek_segment(self.timing.sentence_at_char(offset))
+        elif self.chunk_spans is not None:
+            starts = [span[0] for span in self.chunk_spans]
+            self.player.seek_segment(max(0, bisect_right(starts, offset) - 1))
+        return "break"
+
+    def on_playback_finished(self):
+        """Reset the UI once the player reports the end of the audio"""
+        if not self.is_playing:
+            return  # Manually stopped
+        self.is_playing = False
+        self.streamer = None
+        self.clear_live_view()
+        self.highlight(None, None)
+        self.reset_buttons()
+        self.status_label.config(text="Ready")
+
+    def toggle_pause(self):
+        if self.player is None or not self.is_playing:
+            return
+        if self.player.is_paused:
+            self.player.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.player.pause()
+            self.pause_button.config(text="Resume")
+            self.status_label.config(text="Paused")
+
+    def skip_sentence(self, step):
+        if self.player is not None and self.is_playing:
+            self.player.seek_segment(self.player.current_segment + step)
+
+    def seek(self, seconds):
+        """Seek within the whole-text audio shown in the waveform"""
+        if self.player is not None and self.is_playing and self.streamer is None:
+            self.player.seek(seconds)
+
+    def play_streaming(self, text, settings):
+        """Synthesize and play the text sentence by sentence"""
+        from streaming import ChunkStreamer
+        chunks = split_into_chunks(text)
+
+        def synthesize(chunk):
+            # Wait for a free queue slot rather than failing while the worker is busy
+            return self.text_to_audio(chunk, settings, block=True).result()
+
+        def on_error(error):
+            def show():
+                metrics.count("tts_errors_total", stage="play")
+                self.is_playing = False
+                self.streamer = None
+                self.clear_live_view()
+                self.reset_buttons()
+                self.status_label.config(text=f"Error: {str(error)}")
+            self.root.after(0, show)
+
+        self.segment_total = len(chunks)
+        self.playing_note = ""
+        self.chunk_spans = locate_chunks(text, chunks)
+        self.streamer = ChunkStreamer(synthesize, chunks, self.get_player(), on_error=on_error)
+        self.is_playing = True
+        self.stop_button.config(state=tk.NORMAL)
+        self.set_transport_state(tk.NORMAL)
+        self.streamer.start()
+        self.start_live_view()
+
+    def stop_playback(self):
+        """Stop audio playback and cancel pending synthesis for it"""
+        self.is_playing = False
+        self.requested_at = None
+        if self.streamer is not None:
+            self.streamer.stop()
+            self.streamer = None
+
+        # Background exports keep running
+        self.worker.cancel_all(INTERACTIVE)
+        if self.script_renderer is not None:
+            self.script_renderer.cancel(INTERACTIVE)
+        if self.player is not None:
+            self.player.stop()
+        self.clear_live_view()
+        self.highlight(None, None)
+        self.reset_buttons()
+        self.status_label.config(text="Stopped")
+
+    def display_waveform(self, buffer):
+        """Display the waveform of an AudioBuffer"""
+        try:
+            # Draw the min/max envelope of the clip
+            with metrics.span("waveform"):
+                self.create_waveform_view()
+                self.waveform.set_audio(buffer.samples, buffer.sample_rate)
+
+        except Exception as e:
+            # Playback carries on without the plot
+            metrics.count("tts_errors_total", stage="waveform")
+            self.status_label.config(text=f"Could not draw the waveform: {str(e)}")
+
+    def save_subtitles(self):
+        """Save SRT or WebVTT subtitles with one cue per sentence"""
+        text = self.input_text()
+        if not text:
+            self.status_label.config(text="Please enter some text first")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".srt",
+            filetypes=[("SubRip subtitles", "*.srt"), ("WebVTT subtitles", "*.vtt"), ("All files", "*.*")]
+        )
+        if not file_path:
+            self.status_label.config(text="Save cancelled")
+            return
+
+        settings = self.voice_settings()
+        timeline = self.timeline_for(settings)
+        renderer = self.get_script_renderer() if is_script(text) else None
+        engine = self.backend_name
+
+        def build(backend, job):
+            if renderer is not None:
+                _, timing = renderer.render_script(text, settings, engine, BACKGROUND, backend)
+                return timing.save_subtitles(file_path)
+
+            # Only sentences that were never rendered with this voice are synthesized
+            timeline.update(text, lambda pieces: backend.synthesize_batch(
+                [(piece, settings) for piece in pieces], effects=False))
+            return timeline.timing_index(settings["rate"] / 100).save_subtitles(file_path)
+
+        try:
+            self.worker.submit(build, BACKGROUND,
+                               on_done=lambda path: self.status_label.config(text=f"Subtitles saved to {path}"),
+                               on_error=lambda e: self.status_label.config(text=f"Error saving subtitles: {e}"))
+        except queue.Full:
+            self.status_label.config(text="Busy, please try again")
+
+    def save_as_mp3(self):
+        """Save speech as an MP3 (or Opus, OGG, FLAC) file"""
+        text = self.input_text()
+        if not text:
+            self.status_label.config(text="Please enter some text first")
+            return
+
+        # Get the file save location
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".mp3",
+            filetypes=[("MP3 files", "*.mp3"), ("Opus files", "*.opus"), ("OGG files", "*.ogg"),
+                       ("FLAC files", "*.flac"), ("All files", "*.*")]
+        )
+
+        if not file_path:
+            self.status_label.config(text="Save cancelled")
+            return
+
+        # Disable buttons during processing
+        self.play_button.config(state=tk.DISABLED)
+        self.save_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Processing and saving...")
+        self.root.update()
+
+        settings = self.voice_settings()
+        chunks = split_into_chunks(text)
+        export_format = format_for_path(file_path)
+        quality = self.quality.get()
+        if quality == "VBR":
+            bitrate, vbr_quality = "192k", DEFAULT_VBR_QUALITY.get(export_format)
+        else:
+            bitrate, vbr_quality = quality, None
+
+        def synthesize_and_export(backend, job):
+            from audio_buffer import AudioBuffer
+            from audio_export import ChunkedExporter
+
+            # Encode each sentence in the background while the next one is synthesized
+            exporter = ChunkedExporter(file_path, export_format, bitrate=bitrate, vbr_quality=vbr_quality)
+            buffers = []
+            try:
+                for index, chunk in enumerate(chunks):
+                    if job.cancelled:
+                        return None
+                    job.report_progress(f"Synthesizing {index + 1}/{len(chunks)}...")
+                    buffer = backend.synthesize(chunk, settings)
+                    if len(buffer.samples):
+                        exporter.add(buffer)
+                    buffers.append(buffer)
+
+                job.report_progress(f"Encoding {export_format.upper()}...")
+                with metrics.span("export_finish", format=export_format):
+                    exporter.finish()
+            finally:
+                exporter.close()
+            return AudioBuffer.concatenate(buffers)
+
+        renderer = self.get_script_renderer() if is_script(text) else None
+        engine = self.backend_name
+
+        def render_script_and_export(backend, job):
+            job.report_progress("Synthesizing the voices...")
+            buffer, _ = renderer.render_script(text, settings, engine, BACKGROUND, backend)
+            job.report_progress(f"Encoding {export_format.upper()}...")
+            with metrics.span("export_finish", format=export_format):
+                buffer.export(file_path, export_format, bitrate=bitrate, vbr_quality=vbr_quality)
+            return buffer
+
+        def on_saved(buffer):
+            # Display the waveform from the same buffer
+            self.display_waveform(buffer)
+            self.status_label.config(text=f"Saved to {file_path}")
+            self.reset_buttons()
+
+        def on_error(e):
+            metrics.count("tts_errors_total", stage="save")
+            self.status_label.config(text=f"Error saving file: {str(e)}")
+            self.reset_buttons()
+
+        # Exports queue behind interactive playback on the synthesis worker
+        try:
+            self.worker.submit(synthesize_and_export if renderer is None else render_script_and_export, BACKGROUND,
+                               on_done=on_saved, on_error=on_error,
+                               on_progress=lambda message: self.status_label.config(text=message))
+        except queue.Full:
+            self.status_label.config(text="Busy, please try again")
+            self.reset_buttons()
+
+    def on_closing(self):
+        """Stop playback and close the application"""
+        # Stop any playback and the synthesis worker
+        if self.streamer is not None:
+            self.streamer.stop()
+        self.worker.stop()
+        if self.script_renderer is not None:
+            self.script_renderer.stop()
+        if self.player is not None:
+            self.player.close()
+
+        # Close the window
+        self.root.destroy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Text to Speech Converter")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="TTS engine (default: the first one available on this host)")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help=f"Write Prometheus metrics to FILE (default: ${metrics.METRICS_FILE_ENV})")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help=f"Append a Chrome trace of every stage to FILE (default: ${metrics.TRACE_FILE_ENV})")
+    args = parser.parse_args(argv)
+    metrics.configure(args.metrics, args.trace)
+
+    root = tk.Tk()
+    app = TextToSpeechApp(root, backend_name=args.backend)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy.io import wavfile
+
+# Samples processed at a time, which bounds the memory used by analysis
+BLOCK_SAMPLES = 1 << 18
+
+
+def read_wav(wav_file):
+    """Read a WAV file memory-mapped, so samples are paged in only when used"""
+    try:
+        return wavfile.read(wav_file, mmap=True)
+    except ValueError:
+        # Formats scipy can't map (e.g. 24-bit) fall back to a normal read
+        return wavfile.read(wav_file)
+
+
+def to_mono(block):
+    """Convert a block of samples to mono float32"""
+    if block.ndim > 1:
+        return block.mean(axis=1, dtype=np.float32)
+    return block.astype(np.float32)
+
+
+def iter_blocks(data, block_samples=BLOCK_SAMPLES):
+    """Yield consecutive mono float32 blocks of the samples"""
+    for start in range(0, len(data), block_samples):
+        yield to_mono(data[start:start + block_samples])
+
+
+def peak_and_rms(data, block_samples=BLOCK_SAMPLES):
+    """Peak absolute amplitude and RMS level, computed block by block"""
+    peak = 0.0
+    sum_squares = 0.0
+    for block in iter_blocks(data, block_samples):
+        if len(block):
+            peak = max(peak, float(np.max(np.abs(block))))
+            sum_squares += float(np.dot(block.astype(np.float64), block))
+    rms = (sum_squares / len(data)) ** 0.5 if len(data) else 0.0
+    return peak, rms
+
+
+def min_max_envelope(data, columns, block_samples=BLOCK_SAMPLES):
+    """Per-column (min, max) pairs, computed a few thousand columns at a time"""
+    n = len(data)
+    columns = max(1, min(columns, n))
+    step = -(-n // columns)  # Samples per column, rounded up
+    columns = -(-n // step)
+
+    low = np.empty(columns, dtype=np.float32)
+    high = np.empty(columns, dtype=np.float32)
+
+    columns_per_block = max(1, block_samples // step)
+    for first in range(0, columns, columns_per_block):
+        last = min(columns, first + columns_per_block)
+        block = to_mono(data[first * step:last * step])
+
+        # Whole columns reduce with a reshape; only the final column can be partial
+        whole = len(block) // step
+        if whole:
+            grid = block[:whole * step].reshape(whole, step)
+            low[first:first + whole] = grid.min(axis=1)
+            high[first:first + whole] = grid.max(axis=1)
+        if first + whole < last:
+            rest = block[whole * step:]
+            low[first + whole] = rest.min()
+            high[first + whole] = rest.max()
+
+    return low, high, step
@@ -0,0 +1,88 @@
+import io
+
+import numpy as np
+from pydub import AudioSegment
+
+from audio_analysis import read_wav
+from audio_export import export_buffer
+from scratch import refs
+
+# numpy dtype for each PCM sample width pydub understands
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class AudioBuffer:
+    """PCM samples plus sample rate, shared by playback, waveform display and export"""
+
+    def __init__(self, samples, sample_rate, words=None):
+        # samples has shape (frames,) for mono or (frames, channels)
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+        # Start frame of each word of the text that was synthesized, or None
+        self.words = words
+
+    @classmethod
+    def from_wav_file(cls, wav_file, in_memory=False):
+        """Memory-map a WAV file, or copy it into memory so the file can be deleted
+
+        A mapped file counts as in use (see scratch.refs) until the samples,
+        and every view of them, are gone.
+        """
+        sample_rate, samples = read_wav(wav_file)
+        if in_memory:
+            samples = np.array(samples)
+        else:
+            refs.hold(samples, wav_file)
+        return cls(samples, sample_rate)
+
+    @classmethod
+    def from_segment(cls, segment):
+        """Build a buffer from a decoded pydub AudioSegment"""
+        samples = np.frombuffer(segment.raw_data, dtype=SAMPLE_DTYPES[segment.sample_width])
+        if segment.channels > 1:
+            samples = samples.reshape(-1, segment.channels)
+        return cls(samples, segment.frame_rate)
+
+    @classmethod
+    def from_encoded(cls, data, format):
+        """Decode compressed audio (e.g. MP3 bytes) without touching the disk"""
+        return cls.from_segment(AudioSegment.from_file(io.BytesIO(data), format=format))
+
+    @classmethod
+    def concatenate(cls, buffers):
+        """Join buffers with the same sample rate into one in-memory buffer"""
+        if not buffers:
+            raise ValueError("No audio to join")
+        # Empty buffers (text with nothing to say) may not know the engine's rate
+        sample_rate = next((b.sample_rate for b in buffers if len(b.samples)), buffers[0].sample_rate)
+        if any(len(b.samples) and b.sample_rate != sample_rate for b in buffers):
+            raise ValueError("Cannot join audio with different sample rates")
+        return cls(np.concatenate([b.samples for b in buffers]), sample_rate)
+
+    @property
+    def channels(self):
+        return 1 if self.samples.ndim == 1 else self.samples.shape[1]
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    def pcm16(self):
+        """Samples as 16-bit integers, converting float audio if needed"""
+        if self.samples.dtype == np.int16:
+            return self.samples
+        if np.issubdtype(self.samples.dtype, np.floating):
+            return (np.clip(self.samples, -1.0, 1.0) * 32767).astype(np.int16)
+        if self.samples.dtype == np.uint8:
+            return ((self.samples.astype(np.int16) - 128) << 8).astype(np.int16)
+        return (self.samples >> 16).astype(np.int16)
+
+    def to_segment(self):
+        """Wrap the samples in a pydub AudioSegment for export"""
+        return AudioSegment(data=np.ascontiguousarray(self.pcm16()).tobytes(), sample_width=2,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+    def export(self, file_path, format="mp3", bitrate="192k", vbr_quality=None):
+        """Encode the buffer to file_path with pydub/ffmpeg"""
+        return export_buffer(self, file_path, format, bitrate, vbr_quality)
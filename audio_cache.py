@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from scratch import refs
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "text_to_speech")
+DEFAULT_MAX_MB = 500
+
+# Entries are named key + suffix; other files in the directory (the voice catalog) aren't entries
+ENTRY_NAME = re.compile(r'([0-9a-f]{64})(\..+)')
+
+
+def normalize_text(text):
+    """Collapse whitespace so formatting-only edits hit the same cache entry"""
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AudioCache:
+    """On-disk LRU cache of synthesized audio keyed on text, backend and voice settings"""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        # Both settings can be overridden from the environment
+        if cache_dir is None:
+            cache_dir = os.environ.get("TTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("TTS_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Running total so eviction doesn't need to rescan the directory on every put
+        self.total_bytes = sum(os.path.getsize(path) for key, path in self._entries())
+
+    def make_key(self, text, backend, **params):
+        """Hash the normalized text together with every synthesis parameter"""
+        payload = json.dumps({"text": normalize_text(text), "backend": backend, "params": params},
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def get(self, key, suffix=".wav"):
+        """Return the cached file for key, or None on a miss"""
+        path = self.path_for(key, suffix)
+        try:
+            # Touch the entry so eviction treats it as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, source_file, suffix=".wav", move=False):
+        """Store source_file in the cache under key and return the cached path
+
+        With move=True the file is moved rather than copied, so a freshly
+        synthesized file is written to disk only once.
+        """
+        # Stage under a temp name first so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
+        if move:
+            shutil.move(source_file, temp_path)
+        else:
+            shutil.copyfile(source_file, temp_path)
+        return self._commit(key, temp_path, suffix)
+
+    def put_bytes(self, key, data, suffix=".wav"):
+        """Store already-encoded audio bytes under key and return the cached path"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self._commit(key, temp_path, suffix)
+
+    def _commit(self, key, temp_path, suffix):
+        path = self.path_for(key, suffix)
+        with self.lock:
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.total_bytes += os.path.getsize(path)
+            self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used keys until the cache fits its size cap
+
+        All files of a key (the audio and a word-timing sidecar) are
+        evicted together, as of the last time any of them was used.
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        groups = {}
+        for key, path in self._entries():
+            groups.setdefault(key, []).append(path)
+        for paths in sorted(groups.values(), key=lambda paths: max(map(os.path.getmtime, paths))):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if any(refs.in_use(path) for path in paths):
+                continue  # Memory-mapped by a buffer that is playing or being exported
+            for path in paths:
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self.total_bytes -= size
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self.lock:
+            for key, path in self._entries():
+                refs.remove_when_unused(path)
+            self.total_bytes = 0
+
+    def _entries(self):
+        """(key, path) of every cached file"""
+        for name in os.listdir(self.cache_dir):
+            match = ENTRY_NAME.fullmatch(name)
+            if match:
+                yield match.group(1), os.path.join(self.cache_dir, name)
@@ -0,0 +1,124 @@
+from fractions import Fraction
+
+import numpy as np
+from scipy.signal import lfilter, resample_poly
+
+# WSOLA analysis frame and how far each frame may move to line up with the last one
+FRAME_SECONDS = 0.03
+TOLERANCE_SECONDS = 0.008
+
+# Robotic voice: ring modulation plus a short metallic echo
+ROBOT_FREQUENCY = 50.0
+ROBOT_ECHO_SECONDS = 0.006
+ROBOT_ECHO_GAIN = 0.45
+
+
+def to_float(samples):
+    """PCM samples as float32 in [-1, 1], shaped (frames, channels)"""
+    if np.issubdtype(samples.dtype, np.floating):
+        data = samples.astype(np.float32)
+    elif samples.dtype == np.uint8:
+        data = (samples.astype(np.float32) - 128) / 128
+    else:
+        data = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+    return data.reshape(len(data), samples.shape[1] if samples.ndim > 1 else 1)
+
+
+def to_pcm16(data, channels):
+    pcm = (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+    return pcm[:, 0] if channels == 1 else pcm
+
+
+def time_stretch(data, speed, sample_rate):
+    """Change the duration of (frames, channels) float audio by 1/speed without changing pitch
+
+    WSOLA: frames are taken every speed * hop samples from the input and
+    overlap-added every hop samples, each shifted by up to the tolerance so
+    its waveform lines up with the natural continuation of the previous one.
+    """
+    if speed == 1 or len(data) == 0:
+        return data
+    frame = max(64, int(sample_rate * FRAME_SECONDS) // 2 * 2)
+    hop = frame // 2
+    tolerance = int(sample_rate * TOLERANCE_SECONDS)
+
+    # Search on mono; pad so every search region and frame stays in range
+    pad = frame + tolerance
+    padded = np.pad(data, ((pad, pad + frame + int(2 * hop * speed)), (0, 0)))
+    mono = padded.mean(axis=1)
+
+    # The first frame starts hop samples early, so its fade-in covers padding
+    count = int(len(data) / (hop * speed)) + 2
+    nominal = pad - hop + (np.arange(count) * hop * speed).astype(np.int64)
+    starts = np.empty(count, dtype=np.int64)
+    starts[0] = nominal[0]
+    for k in range(1, count):
+        # The samples that would have followed the previous frame
+        target = mono[starts[k - 1] + hop:starts[k - 1] + hop + frame]
+        low = nominal[k] - tolerance
+        region = mono[low:nominal[k] + tolerance + frame]
+        starts[k] = low + int(np.argmax(np.correlate(region, target, mode="valid")))
+
+    # Gather all frames at once and overlap-add them with a Hann window (50% overlap sums to 1)
+    window = np.hanning(frame + 1)[:frame].astype(np.float32)[:, None]
+    frames = padded[starts[:, None] + np.arange(frame)] * window
+    output = np.zeros(((count + 1) * hop, data.shape[1]), dtype=np.float32)
+    output.reshape(count + 1, hop, -1)[:-1] += frames[:, :hop]
+    output.reshape(count + 1, hop, -1)[1:] += frames[:, hop:]
+
+    # Drop the fade-in of the first frame
+    length = int(round(len(data) / speed))
+    return output[hop:hop + length]
+
+
+def resample(data, factor):
+    """Resample (frames, channels) audio to len(data) / factor frames"""
+    ratio = Fraction(factor).limit_denominator(64)
+    return resample_poly(data, ratio.denominator, ratio.numerator, axis=0).astype(np.float32)
+
+
+def change_speed_and_pitch(data, speed, pitch, sample_rate):
+    """Time-stretch and pitch-shift in one pass
+
+    Pitch is shifted by stretching the audio to pitch times its length and
+    resampling it back, so both changes share a single WSOLA run.
+    """
+    if pitch == 1:
+        return time_stretch(data, speed, sample_rate)
+    return resample(time_stretch(data, speed / pitch, sample_rate), pitch)
+
+
+def robotize(data, sample_rate):
+    """Ring-modulate the voice and add a short comb-filter echo"""
+    t = np.arange(len(data), dtype=np.float32) / sample_rate
+    modulated = data * np.sin(2 * np.pi * ROBOT_FREQUENCY * t)[:, None]
+    delay = int(sample_rate * ROBOT_ECHO_SECONDS)
+    feedback = np.zeros(delay + 1, dtype=np.float32)
+    feedback[0], feedback[-1] = 1.0, -ROBOT_ECHO_GAIN
+    echoed = lfilter([1.0 - ROBOT_ECHO_GAIN], feedback, modulated, axis=0).astype(np.float32)
+    return echoed * 1.5
+
+
+def apply_effects(buffer, rate=100, pitch=100, robotic=False):
+    """Return an AudioBuffer with speed and pitch (percent) and the robotic effect applied
+
+    Runs on the synthesized PCM, so changing the settings doesn't need the
+    engine again. The buffer itself is returned when there is nothing to do.
+    """
+    from audio_buffer import AudioBuffer
+
+    speed = (rate or 100) / 100
+    pitch = (pitch or 100) / 100
+    if (speed == 1 and pitch == 1 and not robotic) or len(buffer.samples) == 0:
+        return buffer
+
+    data = to_float(buffer.samples)
+    data = change_speed_and_pitch(data, speed, pitch, buffer.sample_rate)
+    if robotic:
+        data = robotize(data, buffer.sample_rate)
+
+    # Word timings move with the change in speed
+    words = buffer.words
+    if words is not None and speed != 1:
+        words = [int(frame / speed) for frame in words]
+    return AudioBuffer(to_pcm16(data, buffer.channels), buffer.sample_rate, words)
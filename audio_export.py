@@ -0,0 +1,241 @@
+import os
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import scratch
+
+# Export formats: file extension, ffmpeg muxer and encoder
+FORMATS = {
+    "mp3": (".mp3", "mp3", "libmp3lame"),
+    "ogg": (".ogg", "ogg", "libvorbis"),
+    "opus": (".opus", "opus", "libopus"),
+    "flac": (".flac", "flac", "flac"),
+    "wav": (".wav", "wav", "pcm_s16le"),
+    "m4b": (".m4b", "ipod", "aac"),
+}
+
+# Formats whose encoded files can be joined by copying frames; FLAC's
+# header would keep the first file's length, so lossless formats are
+# re-encoded while joining, which is cheap
+STREAM_COPY_FORMATS = {"mp3", "ogg", "opus", "m4b"}
+
+# A sensible VBR setting for each lossy format (see encoder_options)
+DEFAULT_VBR_QUALITY = {"mp3": 2, "ogg": 6, "opus": 0}
+
+
+def format_for_path(file_path, default="mp3"):
+    """Pick the export format from a file extension"""
+    extension = os.path.splitext(file_path)[1].lower()
+    for name, (ext, _, _) in FORMATS.items():
+        if ext == extension:
+            return name
+    return default
+
+
+def encoder_options(format="mp3", bitrate="192k", vbr_quality=None):
+    """pydub export keyword arguments for a format, bitrate or VBR quality
+
+    vbr_quality uses each encoder's own scale: 0 (best) to 9 for MP3,
+    -1 to 10 (best) for Vorbis. For Opus it just switches on VBR.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unsupported format: {format}")
+    _, muxer, codec = FORMATS[format]
+    options = {"format": muxer, "codec": codec}
+
+    if format in ("flac", "wav"):
+        return options  # Lossless, no bitrate
+    if vbr_quality is None:
+        options["bitrate"] = bitrate
+        if format == "opus":
+            options["parameters"] = ["-vbr", "off"]
+    elif format == "opus":
+        options["bitrate"] = bitrate
+        options["parameters"] = ["-vbr", "on"]
+    else:
+        options["parameters"] = ["-q:a", str(vbr_quality)]
+    return options
+
+
+def export_buffer(buffer, file_path, format="mp3", bitrate="192k", vbr_quality=None):
+    """Encode a whole AudioBuffer in one ffmpeg run"""
+    with metrics.span("encode", format=format):
+        buffer.to_segment().export(file_path, **encoder_options(format, bitrate, vbr_quality))
+    return file_path
+
+
+def ffmpeg_arguments(options):
+    """ffmpeg output arguments for encoder_options()"""
+    arguments = ["-c:a", options["codec"]]
+    if "bitrate" in options:
+        arguments += ["-b:a", options["bitrate"]]
+    return arguments + options.get("parameters", []) + ["-f", options["format"]]
+
+
+def run_ffmpeg(arguments, action):
+    from pydub import AudioSegment
+    result = subprocess.run([AudioSegment.converter, "-y", "-loglevel", "error"] + arguments,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to {action}: {result.stderr.decode(errors='replace')}")
+
+
+class StreamEncoder:
+    """Encode AudioBuffers one after another into a single file without keeping them
+
+    PCM is piped into one ffmpeg process (WAV is written directly), so memory
+    use doesn't depend on the length of the audio. The format is taken from
+    the first buffer; finish() returns the duration in seconds.
+    """
+
+    def __init__(self, file_path, format="mp3", bitrate="192k", vbr_quality=None):
+        self.file_path = file_path
+        self.format = format
+        self.options = encoder_options(format, bitrate, vbr_quality)
+        self.output = None
+        self.process = None
+        self.frames = 0
+        self.sample_rate = None
+
+    def _open(self, sample_rate, channels):
+        from pydub import AudioSegment
+        self.sample_rate = sample_rate
+        if self.format == "wav":
+            self.output = wave.open(self.file_path, "wb")
+            self.output.setnchannels(channels)
+            self.output.setsampwidth(2)
+            self.output.setframerate(sample_rate)
+            return
+        self.process = subprocess.Popen(
+            [AudioSegment.converter, "-y", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate),
+             "-ac", str(channels), "-i", "pipe:0"] + ffmpeg_arguments(self.options) + [self.file_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def write(self, buffer):
+        if not len(buffer.samples):
+            return
+        if self.sample_rate is None:
+            self._open(buffer.sample_rate, buffer.channels)
+        elif buffer.sample_rate != self.sample_rate:
+            raise ValueError("Cannot join buffers with different sample rates")
+        data = buffer.pcm16().tobytes()
+        if self.process is not None:
+            self.process.stdin.write(data)
+        else:
+            self.output.writeframesraw(data)
+        self.frames += len(buffer.samples)
+
+    def finish(self):
+        """Close the file and return its duration in seconds"""
+        if self.sample_rate is None:
+            raise ValueError("Nothing to export")
+        if self.process is None:
+            self.output.close()
+        else:
+            self.process.stdin.close()
+            error = self.process.stderr.read()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to encode: {error.decode(errors='replace')}")
+        return self.frames / self.sample_rate
+
+    def abort(self):
+        """Stop encoding and remove the partial file"""
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+        elif self.output is not None:
+            self.output.close()
+        try:
+            os.remove(self.file_path)
+        except OSError:
+            pass
+
+
+def escape_metadata(value):
+    """Escape a value for an ffmetadata file"""
+    for character in "\\=;#\n":
+        value = value.replace(character, "\\" + character)
+    return value
+
+
+def join_with_chapters(chapter_files, titles, durations, file_path, format="mp3"):
+    """Join encoded chapter files into one file with a chapter marker at the start of each
+
+    The frames are copied, not re-encoded, for the lossy formats. Chapters
+    become ID3 CHAP frames in MP3 and a chapter track in M4B.
+    """
+    work_dir = scratch.default_area().new_dir(prefix="chapters_")
+    try:
+        list_file = os.path.join(work_dir, "chapters.txt")
+        with open(list_file, "w", encoding="utf-8") as f:
+            for path in chapter_files:
+                f.write("file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")))
+
+        metadata_file = os.path.join(work_dir, "metadata.txt")
+        start = 0
+        with open(metadata_file, "w", encoding="utf-8") as f:
+            f.write(";FFMETADATA1\n")
+            for title, seconds in zip(titles, durations):
+                end = start + int(round(seconds * 1000))
+                f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={start}\nEND={end}\ntitle={escape_metadata(title)}\n")
+                start = end
+
+        codec = ["-c:a", "copy", "-f", FORMATS[format][1]] if format in STREAM_COPY_FORMATS \
+            else ffmpeg_arguments(encoder_options(format))
+        id3 = ["-id3v2_version", "3"] if format == "mp3" else []
+        with metrics.span("join_chapters", format=format):
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_file, "-i", metadata_file,
+                        "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1"] + codec + id3 + [file_path],
+                       "join chapters")
+    finally:
+        scratch.default_area().discard(work_dir)
+    return file_path
+
+
+class ChunkedExporter:
+    """Encode audio chunks in the background as they are synthesized
+
+    Chunks are piped in order into one StreamEncoder by a background thread,
+    so encoding overlaps synthesis but the output is a single encode of the
+    joined audio. (Encoding chunks separately and joining the files would
+    keep each chunk's encoder delay and padding, a gap at every join.)
+    """
+
+    def __init__(self, file_path, format="mp3", bitrate="192k", vbr_quality=None):
+        self.file_path = file_path
+        self.format = format
+        self.encoder = StreamEncoder(file_path, format, bitrate, vbr_quality)
+        self.finished = False
+
+        # One thread keeps the chunks in order; it only waits on ffmpeg's input pipe
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+
+    def add(self, buffer):
+        """Queue the next chunk for encoding"""
+        self.futures.append(self.pool.submit(self._encode, buffer))
+
+    def _encode(self, buffer):
+        with metrics.span("encode_chunk", format=self.format):
+            self.encoder.write(buffer)
+
+    def finish(self):
+        """Wait for all chunks and close the output file"""
+        try:
+            for future in self.futures:
+                future.result()
+            self.encoder.finish()
+            self.finished = True
+            return self.file_path
+        finally:
+            self.close()
+
+    def close(self):
+        """Drop any pending work; the output file is removed unless finish() succeeded"""
+        for future in self.futures:
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        if not self.finished:
+            self.encoder.abort()
@@ -0,0 +1,205 @@
+import itertools
+
+import numpy as np
+from scipy.signal import lfilter
+
+from audio_effects import to_float, to_pcm16
+
+# Silence detection: RMS level of 10 ms frames, and how much quiet is kept
+# around the speech so soft onsets and releases aren't clipped
+FRAME_SECONDS = 0.01
+SILENCE_DB = -50.0
+KEEP_SECONDS = 0.03
+
+# Audio is processed this many seconds at a time, so memory use is bounded
+BLOCK_SECONDS = 10.0
+
+# Loudness (ITU-R BS.1770): 400 ms gating blocks overlapping by 75%, built
+# from 100 ms sub-blocks, with the absolute and relative gates
+SUB_BLOCK_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+DEFAULT_LOUDNESS = -16.0  # LUFS, the usual target for spoken word
+PEAK_CEILING_DB = -1.0
+
+
+def frame_levels(data, frame):
+    """RMS level in dBFS of each frame of (frames, channels) float audio; the last frame may be short"""
+    mono = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    count = -(-len(mono) // frame)
+    padded = np.zeros(count * frame, dtype=np.float32)
+    padded[:len(mono)] = mono
+    power = np.mean(padded.reshape(count, frame) ** 2, axis=1)
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def speech_bounds(samples, sample_rate, threshold_db=SILENCE_DB):
+    """(start, end) frames of the audio between the leading and trailing silence
+
+    Only the blocks at each end are examined until speech is found, so the
+    cost doesn't depend on the length of the audio. (0, 0) if it is all silent.
+    """
+    frame = max(1, int(sample_rate * FRAME_SECONDS))
+    block = frame * max(1, int(BLOCK_SECONDS / FRAME_SECONDS))
+    total = len(samples)
+
+    start = None
+    for offset in range(0, total, block):
+        loud = np.flatnonzero(frame_levels(to_float(samples[offset:offset + block]), frame) > threshold_db)
+        if len(loud):
+            start = offset + loud[0] * frame
+            break
+    if start is None:
+        return 0, 0
+
+    # Backwards in blocks ending at the end of the audio, so frames line up with it
+    end = start
+    stop = total
+    while stop > start:
+        low = max(start, stop - block)
+        levels = frame_levels(to_float(samples[low:stop][::-1]), frame)
+        loud = np.flatnonzero(levels > threshold_db)
+        if len(loud):
+            end = stop - loud[0] * frame
+            break
+        stop = low
+    return int(start), int(max(end, start + 1))
+
+
+def trim_silence(buffer, threshold_db=SILENCE_DB, keep_seconds=KEEP_SECONDS):
+    """The buffer without its leading and trailing silence; samples are a view, not a copy"""
+    from audio_buffer import AudioBuffer
+    if len(buffer.samples) == 0:
+        return buffer
+    start, end = speech_bounds(buffer.samples, buffer.sample_rate, threshold_db)
+    keep = int(keep_seconds * buffer.sample_rate)
+    start, end = max(0, start - keep), min(len(buffer.samples), end + keep)
+    if (start, end) == (0, len(buffer.samples)):
+        return buffer
+
+    words = buffer.words
+    if words is not None:
+        words = [int(min(max(0, frame - start), end - start)) for frame in words]
+    return AudioBuffer(buffer.samples[start:end], buffer.sample_rate, words)
+
+
+def add_pause(buffer, seconds):
+    """The buffer followed by seconds of silence"""
+    from audio_buffer import AudioBuffer
+    frames = int(seconds * buffer.sample_rate)
+    if frames <= 0 or len(buffer.samples) == 0:
+        return buffer
+    silence = np.full((frames,) + buffer.samples.shape[1:], 128 if buffer.samples.dtype == np.uint8 else 0,
+                      dtype=buffer.samples.dtype)
+    return AudioBuffer(np.concatenate([buffer.samples, silence]), buffer.sample_rate, buffer.words)
+
+
+def k_weighting(sample_rate):
+    """The two biquads of the BS.1770 K-weighting filter, designed for sample_rate
+
+    A +4 dB high shelf (the head) followed by a high-pass at 38 Hz (RLB).
+    """
+    # High shelf
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    cos = np.cos(w0)
+    root = 2 * np.sqrt(gain) * alpha
+    shelf_b = [gain * ((gain + 1) + (gain - 1) * cos + root), -2 * gain * ((gain - 1) + (gain + 1) * cos),
+               gain * ((gain + 1) + (gain - 1) * cos - root)]
+    shelf_a = [(gain + 1) - (gain - 1) * cos + root, 2 * ((gain - 1) - (gain + 1) * cos),
+               (gain + 1) - (gain - 1) * cos - root]
+
+    # High-pass
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    cos = np.cos(w0)
+    highpass_b = [(1 + cos) / 2, -(1 + cos), (1 + cos) / 2]
+    highpass_a = [1 + alpha, -2 * cos, 1 - alpha]
+    return (np.array(shelf_b) / shelf_a[0], np.array(shelf_a) / shelf_a[0]), \
+        (np.array(highpass_b) / highpass_a[0], np.array(highpass_a) / highpass_a[0])
+
+
+def integrated_loudness(samples, sample_rate):
+    """Gated integrated loudness of PCM samples in LUFS (-inf for silence)
+
+    The K-weighted signal is filtered one block at a time, carrying the
+    filter state across, and reduced to the energy of each 100 ms sub-block.
+    """
+    (shelf_b, shelf_a), (highpass_b, highpass_a) = k_weighting(sample_rate)
+    sub_block = max(1, int(sample_rate * SUB_BLOCK_SECONDS))
+    block = sub_block * max(1, int(BLOCK_SECONDS / SUB_BLOCK_SECONDS))
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    shelf_state = np.zeros((2, channels))
+    highpass_state = np.zeros((2, channels))
+
+    energies = []
+    for offset in range(0, len(samples), block):
+        data = to_float(samples[offset:offset + block]).astype(np.float64)
+        data, shelf_state = lfilter(shelf_b, shelf_a, data, axis=0, zi=shelf_state)
+        data, highpass_state = lfilter(highpass_b, highpass_a, data, axis=0, zi=highpass_state)
+        count = len(data) // sub_block
+        if count:
+            energies.append((data[:count * sub_block] ** 2).reshape(count, sub_block, channels)
+                            .mean(axis=1).sum(axis=1))
+        elif not energies:
+            energies.append([(data ** 2).mean(axis=0).sum()])  # Shorter than one sub-block
+
+    energies = np.concatenate(energies) if energies else np.zeros(0)
+    if len(energies) >= 4:
+        # Each 400 ms gating block is four consecutive sub-blocks
+        blocks = np.convolve(energies, np.full(4, 0.25), mode="valid")
+    else:
+        blocks = np.array([energies.mean()]) if len(energies) else np.zeros(0)
+
+    with np.errstate(divide="ignore"):
+        levels = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if not len(gated):
+        return float("-inf")
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = blocks[(levels > ABSOLUTE_GATE) & (levels > relative)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def normalize_loudness(buffer, target=DEFAULT_LOUDNESS, peak_ceiling_db=PEAK_CEILING_DB):
+    """The buffer with its gain set so its integrated loudness is target LUFS
+
+    The gain is lowered if it would push the peak above peak_ceiling_db,
+    so the result never clips.
+    """
+    from audio_buffer import AudioBuffer
+    if len(buffer.samples) == 0:
+        return buffer
+    loudness = integrated_loudness(buffer.samples, buffer.sample_rate)
+    if loudness == float("-inf"):
+        return buffer
+
+    block = max(1, int(buffer.sample_rate * BLOCK_SECONDS))
+    peak = max(float(np.abs(to_float(buffer.samples[offset:offset + block])).max())
+               for offset in range(0, len(buffer.samples), block))
+    gain_db = min(target - loudness, peak_ceiling_db - 20 * np.log10(max(peak, 1e-9)))
+    if abs(gain_db) < 0.1:
+        return buffer
+
+    gain = np.float32(10 ** (gain_db / 20))
+    output = np.empty((len(buffer.samples),) + buffer.samples.shape[1:], dtype=np.int16)
+    for offset in range(0, len(buffer.samples), block):
+        output[offset:offset + block] = to_pcm16(to_float(buffer.samples[offset:offset + block]) * gain,
+                                                 buffer.channels)
+    return AudioBuffer(output, buffer.sample_rate, buffer.words)
+
+
+def normalize_segments(buffer, bounds, target=DEFAULT_LOUDNESS, peak_ceiling_db=PEAK_CEILING_DB):
+    """normalize_loudness for each segment on its own, with segments split at the frames in bounds
+
+    A spliced timeline of sentences is then as loud as the same sentences
+    normalized one at a time.
+    """
+    from audio_buffer import AudioBuffer
+    bounds = [min(max(0, bound), len(buffer.samples)) for bound in itertools.accumulate(bounds, max)]
+    pieces = np.split(buffer.samples, bounds)
+    samples = [normalize_loudness(AudioBuffer(piece, buffer.sample_rate), target, peak_ceiling_db).samples
+               for piece in pieces]
+    return AudioBuffer(np.concatenate(samples), buffer.sample_rate, buffer.words)
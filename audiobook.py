@@ -0,0 +1,315 @@
+"""Convert a book-length text or Markdown file into a chaptered audiobook.
+
+Usage:
+    python audiobook.py book.txt --output-dir book_audio/ [--workers 4]
+    python audiobook.py book.md --output-dir book_audio/ --single book.m4b
+
+The book is read line by line and split into chapters at Markdown headings
+("# ..." and "## ...") and at lines such as "Chapter 12" or "PART TWO". Each
+chapter's text is saved in the output directory, then chapters are
+synthesized and encoded in parallel worker processes. Each worker streams
+sentence by sentence into its encoder, so memory use doesn't grow with the
+book.
+
+Finished chapters are recorded in a progress log. Running the same command
+again after an interruption only converts the chapters that are missing.
+Paths in the manifest and the log are relative to the output directory, so
+a run can be resumed from any working directory.
+Sentences of an interrupted chapter are served from the synthesis cache.
+With --single, the chapter files are joined into one MP3 or M4B with a
+chapter marker for each.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import batch_convert
+import metrics
+from audio_cache import DEFAULT_CACHE_DIR
+from audio_export import FORMATS, StreamEncoder, format_for_path, join_with_chapters
+from backends import BACKENDS, DEFAULT_SETTINGS, VOICE_TYPES, choose_backend
+from text_processing import split_into_chunks
+
+WORK_DIR = ".audiobook"
+MANIFEST_FILE = "manifest.json"
+PROGRESS_FILE = "progress.jsonl"
+
+# Markdown headings of the top two levels, or a line that is only a chapter title
+MARKDOWN_HEADING = re.compile(r'^\s{0,3}#{1,2}\s+(.+?)\s*#*\s*$')
+CHAPTER_LINE = re.compile(
+    r'^\s*(?:(?i:chapter|part|book)\s+(?:\d+|[IVXLCDM]+\b|[A-Z][a-z]+|[A-Z]+)'
+    r'|(?i:prologue|epilogue|preface|introduction|afterword)\b)[^\n]{0,60}$')
+
+UNSAFE_FILENAME = re.compile(r'[^\w\- ]+')
+
+
+def chapter_title(line):
+    """The chapter title if line is a chapter heading, else None"""
+    if len(line) > 100:
+        return None
+    match = MARKDOWN_HEADING.match(line)
+    if match:
+        return match.group(1).strip("*_ ")
+    if CHAPTER_LINE.match(line):
+        return line.strip()
+    return None
+
+
+def split_book(source, chapters_dir):
+    """Split the book into one text file per chapter, reading it line by line
+
+    Returns a list of {"number", "title", "text_file"}. Text before the first
+    heading becomes a chapter named after the file. A heading directly
+    followed by another (a part title, then its first chapter) is joined
+    with it rather than becoming a chapter of its own.
+    """
+    os.makedirs(chapters_dir, exist_ok=True)
+    chapters = []
+    current = None
+    pending_titles = []
+
+    def close_current():
+        if current is not None:
+            current["file"].close()
+            del current["file"]
+
+    def start(title):
+        nonlocal current
+        close_current()
+        number = len(chapters) + 1
+        text_file = os.path.join(chapters_dir, f"{number:04d}.txt")
+        current = {"number": number, "title": title, "text_file": text_file,
+                   "file": open(text_file, "w", encoding="utf-8")}
+        chapters.append(current)
+
+        # The title is read out at the start of the chapter
+        current["file"].write(title + ".\n\n")
+
+    with open(source, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            title = chapter_title(line)
+            if title is not None:
+                pending_titles.append(title)
+                continue
+            if not line.strip() and (pending_titles or current is None):
+                continue
+
+            if pending_titles:
+                start(": ".join(pending_titles))
+                pending_titles = []
+            elif current is None:
+                start(os.path.splitext(os.path.basename(source))[0])
+            current["file"].write(line)
+
+    if pending_titles:
+        start(": ".join(pending_titles))
+    close_current()
+    return chapters
+
+
+def read_paragraphs(text_file):
+    """Paragraphs of a chapter file, one at a time"""
+    lines = []
+    with open(text_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            elif lines:
+                yield "".join(lines)
+                lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def convert_chapter(text_file, output_file, settings, export_options):
+    """Synthesize and encode one chapter, in a worker process"""
+    started = time.time()
+    partial_file = output_file + ".part"
+    chars = 0
+    synthesis_seconds = 0.0
+    try:
+        with metrics.span("chapter"):
+            encoder = StreamEncoder(partial_file, **export_options)
+            try:
+                for paragraph in read_paragraphs(text_file):
+                    requests = [(chunk, settings) for chunk in split_into_chunks(paragraph)]
+                    synthesis_started = time.time()
+                    buffers = batch_convert.worker_backend.synthesize_batch(requests)
+                    synthesis_seconds += time.time() - synthesis_started
+                    chars += len(paragraph)
+                    for buffer in buffers:
+                        encoder.write(buffer)
+                duration = encoder.finish()
+            except BaseException:
+                encoder.abort()
+                raise
+        os.replace(partial_file, output_file)
+        return {"input": text_file, "output": output_file, "ok": True, "error": None,
+                "seconds": round(time.time() - started, 3), "chars": chars,
+                "synthesis_seconds": round(synthesis_seconds, 3), "audio_seconds": round(duration, 3),
+                "duration": duration}
+    except Exception as e:
+        return {"input": text_file, "output": output_file, "ok": False, "error": str(e),
+                "seconds": round(time.time() - started, 3)}
+
+
+def load_finished(progress_file, output_dir):
+    """The last successful result for each chapter, by chapter text file relative to output_dir"""
+    finished = {}
+    if not os.path.exists(progress_file):
+        return finished
+    with open(progress_file, encoding="utf-8") as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Truncated line from an interrupted run
+            if entry.get("ok") and os.path.exists(os.path.join(output_dir, entry["output"])):
+                finished[entry["input"]] = entry
+            else:
+                finished.pop(entry["input"], None)
+    return finished
+
+
+def fingerprint(source, settings, export_options):
+    """Changes when the book or anything affecting the audio changes, which restarts the conversion"""
+    stat = os.stat(source)
+    payload = json.dumps({"source": os.path.abspath(source), "size": stat.st_size, "mtime": stat.st_mtime,
+                          "settings": settings, "export": export_options}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prepare(source, output_dir, settings, export_options):
+    """Split the book, or reuse the split from an interrupted run of the same conversion"""
+    work_dir = os.path.join(output_dir, WORK_DIR)
+    manifest_file = os.path.join(work_dir, MANIFEST_FILE)
+    key = fingerprint(source, settings, export_options)
+    try:
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["fingerprint"] == key:
+            return manifest["chapters"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Something changed: start over
+    os.makedirs(work_dir, exist_ok=True)
+    progress_file = os.path.join(work_dir, PROGRESS_FILE)
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
+    with metrics.span("split_book"):
+        chapters = split_book(source, os.path.join(work_dir, "chapters"))
+    for chapter in chapters:
+        chapter["text_file"] = os.path.relpath(chapter["text_file"], output_dir)
+    partial = manifest_file + ".part"
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": key, "source": os.path.abspath(source), "chapters": chapters}, f, indent=2)
+    os.replace(partial, manifest_file)
+    return chapters
+
+
+def chapter_filename(chapter, extension):
+    title = UNSAFE_FILENAME.sub("", chapter["title"]).strip()[:60] or "Chapter"
+    return f"{chapter['number']:03d} - {title}{extension}"
+
+
+def convert_book(source, output_dir, settings, export_options, workers=None, cache_dir=None,
+                 backend_name=None, single=None):
+    """Convert every chapter not already done; returns (chapters, results of this run)"""
+    backend_name = backend_name or choose_backend()
+    extension = FORMATS[export_options["format"]][0]
+    chapters = prepare(source, output_dir, settings, export_options)
+    progress_file = os.path.join(output_dir, WORK_DIR, PROGRESS_FILE)
+    finished = load_finished(progress_file, output_dir)
+    pending = [c for c in chapters if c["text_file"] not in finished]
+    trace_file = metrics.trace.path if metrics.trace is not None else None
+
+    print(f"{len(chapters)} chapters, {len(chapters) - len(pending)} already done, {len(pending)} to convert")
+
+    results = []
+    if pending:
+        with open(progress_file, "a", encoding="utf-8") as log, \
+                ProcessPoolExecutor(max_workers=workers, initializer=batch_convert.init_worker,
+                                    initargs=(backend_name, cache_dir, trace_file)) as pool:
+            futures = {pool.submit(convert_chapter, os.path.join(output_dir, c["text_file"]),
+                                   os.path.join(output_dir, chapter_filename(c, extension)),
+                                   settings, export_options): c
+                       for c in pending}
+            for count, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                result["input"] = os.path.relpath(result["input"], output_dir)
+                result["output"] = os.path.relpath(result["output"], output_dir)
+                results.append(result)
+                batch_convert.record_metrics(result)
+
+                # One line per finished chapter is the checkpoint
+                log.write(json.dumps(result) + "\n")
+                log.flush()
+                if result["ok"]:
+                    finished[result["input"]] = result
+
+                status = "ok" if result["ok"] else f"FAILED: {result['error']}"
+                print(f"[{count}/{len(pending)}] {futures[future]['title']} {status}")
+
+    if single and len(finished) == len(chapters):
+        entries = [finished[c["text_file"]] for c in chapters]
+        join_with_chapters([os.path.join(output_dir, entry["output"]) for entry in entries],
+                           [c["title"] for c in chapters], [entry["duration"] for entry in entries],
+                           single, export_options["format"])
+        print(f"Wrote {single}")
+    return chapters, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a long text or Markdown file into a chaptered audiobook")
+    parser.add_argument("source", help="Text or Markdown file")
+    parser.add_argument("-o", "--output-dir", required=True, help="Where to write the chapter files")
+    parser.add_argument("--single", default=None, metavar="FILE",
+                        help="Also join the chapters into one .mp3 or .m4b with chapter markers")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Chapters converted at once (default: CPU count)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="TTS engine (default: the first one available on this host)")
+    parser.add_argument("--voice", default="Female", choices=VOICE_TYPES)
+    parser.add_argument("--rate", type=int, default=100, help="Speech speed in percent (50-200)")
+    parser.add_argument("--pitch", type=int, default=100, help="Pitch in percent (50-200)")
+    parser.add_argument("--pause-ms", type=int, default=DEFAULT_SETTINGS["pause_ms"],
+                        help="Silence after each sentence (default: %(default)s)")
+    parser.add_argument("--format", default=None, choices=sorted(FORMATS),
+                        help="Format of the chapter files (default: the format of --single, else mp3); "
+                             "with --single it must match that file's format")
+    parser.add_argument("--bitrate", default="128k", help="Bitrate for lossy formats")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Synthesis cache, which makes resuming an interrupted chapter fast")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help=f"Write Prometheus metrics to FILE (default: ${metrics.METRICS_FILE_ENV})")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help=f"Append a Chrome trace of every stage to FILE (default: ${metrics.TRACE_FILE_ENV})")
+    args = parser.parse_args(argv)
+    metrics.configure(args.metrics, args.trace)
+
+    export_format = format_for_path(args.single) if args.single else args.format or "mp3"
+    if args.single and export_format not in ("mp3", "m4b"):
+        parser.error("--single must be an .mp3 or .m4b file")
+    if args.single and args.format and args.format != export_format:
+        parser.error(f"--format {args.format} doesn't match --single, which is {export_format}")
+    settings = {"voice_type": args.voice, "rate": args.rate, "pitch": args.pitch, "pause_ms": args.pause_ms}
+    export_options = {"format": export_format, "bitrate": args.bitrate}
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    chapters, results = convert_book(args.source, args.output_dir, settings, export_options,
+                                     workers=args.workers, cache_dir=args.cache_dir, backend_name=args.backend,
+                                     single=args.single)
+    failed = [r for r in results if not r["ok"]]
+    if failed:
+        print(f"{len(failed)} chapters failed; run the same command again to retry them")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
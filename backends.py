@@ -0,0 +1,551 @@
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+import weakref
+import zlib
+from contextlib import ExitStack
+
+import metrics
+import scratch
+from text_normalization import normalize
+from timing import words_from_events
+from voice_catalog import Voice, get_voices
+
+# Voice types offered in the UI; each backend maps them onto its own voices
+VOICE_TYPES = ["Male", "Female", "Robotic"]
+
+# pause_ms is the silence after each sentence and loudness the LUFS target
+# (None leaves the level alone); both are applied after synthesis
+DEFAULT_SETTINGS = {"voice_type": "Female", "rate": 100, "pitch": 100, "pause_ms": 250, "loudness": -16.0}
+POSTPROCESS_SETTINGS = ("pause_ms", "loudness")
+
+# Cache suffix of the word timings stored next to an engine's audio
+WORDS_SUFFIX = ".words.json"
+
+
+class TTSBackend:
+    """Base class for TTS engines
+
+    A backend turns text plus settings into an AudioBuffer. Settings are a
+    dict with voice_type (one of VOICE_TYPES), rate and pitch (percent of
+    the engine's normal value). Subclasses implement render(), which writes
+    the engine's native audio format to a file, and optionally list_voices().
+
+    The engine always renders at its normal rate and pitch; speed, pitch and
+    the robotic voice are applied to the PCM afterwards by audio_effects, so
+    the cached rendering can be reused for any slider position.
+    """
+
+    name = None
+    audio_suffix = ".wav"
+    supports_pitch = False
+    supports_rate = True
+    requires_network = False
+    # Whether the engine has its own robotic voice; otherwise it is an effect
+    robotic_voice = False
+    # Whether instances in one process can render at the same time
+    thread_safe = True
+
+    def __init__(self, cache=None):
+        self.cache = cache
+
+        # Word timings recorded by render_batch(), keyed by output file, as
+        # (char_start, char_end, fraction of the audio) for engines with word events
+        self.word_events = {}
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @classmethod
+    def capabilities(cls):
+        return {"pitch": cls.supports_pitch, "rate": cls.supports_rate, "network": cls.requires_network}
+
+    @classmethod
+    def catalog_key(cls):
+        return cls.name
+
+    def list_voices(self):
+        return []
+
+    def voices(self):
+        """Voices from the on-disk catalog, enumerated from the engine only when stale"""
+        return get_voices(self.catalog_key(), self.list_voices, self.capabilities())
+
+    def warm_up(self):
+        """Load the voice catalog and render a short phrase, so the first real request is fast"""
+        self.voices()
+        if self.requires_network:
+            return
+
+        # Rendered directly rather than through the cache, which would skip the engine next time
+        with scratch.default_area().temporary_file(self.audio_suffix) as path:
+            try:
+                self.render("Ready.", self.engine_settings(DEFAULT_SETTINGS), path)
+                self.load(path, in_memory=True)
+            finally:
+                self.word_events.pop(path, None)
+
+    def render(self, text, settings, output_file):
+        raise NotImplementedError
+
+    def cache_key(self, text, settings):
+        return self.cache.make_key(text, self.name, **settings)
+
+    def lookup(self, text, settings):
+        """Return a cached audio file for this text and settings, or None"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache_key(text, settings), suffix=self.audio_suffix)
+
+    def load(self, audio_file, in_memory=False):
+        """Decode a rendered file: WAV is memory-mapped, anything else decoded by pydub"""
+        # Imported here so listing backends at startup doesn't load numpy and scipy
+        from audio_buffer import AudioBuffer
+        with metrics.span("decode", backend=self.name):
+            if self.audio_suffix == ".wav":
+                return AudioBuffer.from_wav_file(audio_file, in_memory=in_memory)
+            with open(audio_file, "rb") as f:
+                return AudioBuffer.from_encoded(f.read(), self.audio_suffix[1:])
+
+    def render_batch(self, items):
+        """Render several (text, settings, output_file) items; engines with
+        per-call overhead override this to render them in one go"""
+        for text, settings, output_file in items:
+            self.render(text, settings, output_file)
+
+    def engine_settings(self, settings):
+        """The settings the engine renders with, which make up the cache key; the rest is done afterwards"""
+        settings = {key: value for key, value in settings.items() if key not in POSTPROCESS_SETTINGS}
+        return dict(settings, rate=100, pitch=100)
+
+    def finish_sentence(self, buffer, settings):
+        """Trim the engine's leading and trailing silence from a sentence and add the pause after it"""
+        from audio_postprocess import add_pause, trim_silence
+        with metrics.span("trim"):
+            return add_pause(trim_silence(buffer), settings["pause_ms"] / 1000)
+
+    def apply_effects(self, buffer, settings, segments=None):
+        """Apply speed, pitch, the robotic voice and loudness normalization to sentences from synthesize_batch()
+
+        For several sentences joined into one buffer, segments is the length
+        of each in frames, so loudness is still normalized per sentence.
+        """
+        from audio_effects import apply_effects
+        from audio_postprocess import normalize_loudness, normalize_segments
+        settings = dict(DEFAULT_SETTINGS, **settings)
+        robotic = settings["voice_type"] == "Robotic" and not self.robotic_voice
+        with metrics.span("effects"):
+            buffer = apply_effects(buffer, settings["rate"], settings["pitch"], robotic)
+        if settings["loudness"] is None:
+            return buffer
+        with metrics.span("loudness"):
+            if not segments:
+                return normalize_loudness(buffer, settings["loudness"])
+            # Split halfway through the pause ending each segment, so the speed change
+            # smearing a boundary can't carry speech into the neighbouring segment
+            speed = (settings["rate"] or 100) / 100
+            margin = int(settings["pause_ms"] / 2000 * buffer.sample_rate)
+            bounds = [int(max(0, end - margin) / speed) for end in itertools.accumulate(segments[:-1])]
+            return normalize_segments(buffer, bounds, settings["loudness"])
+
+    def synthesize(self, text, settings=None, effects=True):
+        """Synthesize text into an AudioBuffer, from the cache when possible"""
+        return self.synthesize_batch([(text, settings or {})], effects)[0]
+
+    def synthesize_batch(self, requests, effects=True):
+        """Synthesize a list of (text, settings) pairs into AudioBuffers
+
+        Text is normalized first (numbers, abbreviations, markup, the user's
+        lexicon; see text_normalization), and the normalized text is what the
+        cache is keyed on. Each sentence has its silence trimmed and is
+        followed by the pause. With effects=False the buffers are left at the
+        engine's normal speed, pitch and level, for callers that apply the
+        effects themselves.
+        """
+        with metrics.span("normalize"):
+            requests = [(normalize(text), dict(DEFAULT_SETTINGS, **settings)) for text, settings in requests]
+        spoken = [(text, self.engine_settings(settings)) for text, settings in requests if text]
+        rendered = iter(self.render_buffers(spoken) if spoken else [])
+        buffers = [self.finish_sentence(next(rendered), settings) if text else None for text, settings in requests]
+
+        # Text with nothing to say (only markup or symbols) becomes an empty buffer
+        if None in buffers:
+            from audio_buffer import AudioBuffer
+            sample_rate = next((b.sample_rate for b in buffers if b is not None), 22050)
+            buffers = [b if b is not None else AudioBuffer(_empty_samples(), sample_rate, []) for b in buffers]
+        if not effects:
+            return buffers
+        return [self.apply_effects(buffer, settings) for buffer, (_, settings) in zip(buffers, requests)]
+
+    def render_buffers(self, requests):
+        """Render (text, engine settings) pairs into AudioBuffers, through the cache"""
+        results = [None] * len(requests)
+        misses = []
+        for index, (text, settings) in enumerate(requests):
+            cached_file = self.lookup(text, settings)
+            if cached_file is not None:
+                results[index] = self.load(cached_file)
+                results[index].words = self.cached_words(text, settings)
+            else:
+                misses.append((index, text, settings))
+        metrics.count("tts_cache_requests_total", len(requests) - len(misses), result="hit")
+        metrics.count("tts_cache_requests_total", len(misses), result="miss")
+
+        if not misses:
+            return results
+        area = scratch.default_area()
+        with ExitStack() as stack:
+            # Rendered files are deleted on the way out, or once no buffer maps them
+            misses = [(index, text, settings, stack.enter_context(area.temporary_file(self.audio_suffix)))
+                      for index, text, settings in misses]
+            with metrics.span("engine", backend=self.name) as engine_time:
+                self.render_batch([(text, settings, path) for _, text, settings, path in misses])
+
+            for index, text, settings, path in misses:
+                events = self.word_events.pop(path, None)
+
+                # Move the rendered file into the cache and decode it from there; without a
+                # cache the buffer maps the scratch file, which outlives the with block
+                if self.cache is not None:
+                    cached_file = self.cache.put(self.cache_key(text, settings), path,
+                                                 suffix=self.audio_suffix, move=True)
+                    results[index] = self.load(cached_file)
+                else:
+                    results[index] = self.load(path)
+
+                if events is not None:
+                    results[index].words = words_from_events(text, len(results[index].samples), events)
+                    if self.cache is not None:
+                        self.cache.put_bytes(self.cache_key(text, settings),
+                                             json.dumps(results[index].words).encode(), suffix=WORDS_SUFFIX)
+
+        if metrics.enabled and engine_time.elapsed > 0:
+            chars = sum(len(text) for _, text, _, _ in misses)
+            audio_seconds = sum(results[index].duration for index, _, _, _ in misses)
+            metrics.count("tts_synthesized_chars_total", chars, backend=self.name)
+            metrics.observe("tts_synthesis_chars_per_second", chars / engine_time.elapsed, backend=self.name)
+            if audio_seconds > 0:
+                metrics.observe("tts_synthesis_realtime_factor", engine_time.elapsed / audio_seconds,
+                                backend=self.name)
+        return results
+
+    def cached_words(self, text, settings):
+        """Word timings stored next to the cached audio, or None"""
+        path = self.cache.get(self.cache_key(text, settings), suffix=WORDS_SUFFIX)
+        if path is None:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _empty_samples():
+    import numpy as np
+    return np.zeros(0, dtype=np.int16)
+
+
+class Pyttsx3Backend(TTSBackend):
+    """Offline system voices through pyttsx3 (SAPI5, NSSpeechSynthesizer, espeak)
+
+    pyttsx3.init() returns the same engine to every caller in a process, so
+    all instances share it and two of them must never render at once (its
+    run loop refuses to start twice). The engine's state is shared too: see
+    shared_state().
+    """
+
+    name = "pyttsx3"
+    # Most drivers ignore the pitch property, so pitch is always an effect
+    supports_pitch = False
+    thread_safe = False
+
+    # Per engine: its normal rate, the properties last sent to it and the
+    # instance that queued each utterance, for routing word events
+    engines = weakref.WeakKeyDictionary()
+    engines_lock = threading.Lock()
+
+    def __init__(self, cache=None):
+        super().__init__(cache)
+        import pyttsx3
+
+        self.engine = pyttsx3.init()
+        self.shared = self.shared_state(self.engine)
+        self.normal_rate = self.shared["normal_rate"]
+        self.voice_ids = {}
+
+        # Word events arrive while each file is written; utterances are named by output file
+        self.utterances = {}
+
+    @classmethod
+    def shared_state(cls, engine):
+        """The state kept for an engine, connecting its events to the owners the first time"""
+        with cls.engines_lock:
+            if engine not in cls.engines:
+                owners = {}
+
+                def route(handler):
+                    # pyttsx3 passes the event's fields as keyword arguments
+                    def callback(name, **event):
+                        owner = owners.get(name)
+                        if owner is not None:
+                            getattr(owner, handler)(name, **event)
+                    return callback
+
+                engine.connect('started-utterance', route("on_utterance_started"))
+                engine.connect('started-word', route("on_word"))
+                engine.connect('finished-utterance', route("on_utterance_finished"))
+                cls.engines[engine] = {"normal_rate": engine.getProperty('rate'), "properties": {},
+                                       "owners": owners}
+            return cls.engines[engine]
+
+    @classmethod
+    def is_available(cls):
+        return importlib.util.find_spec("pyttsx3") is not None
+
+    def list_voices(self):
+        return [Voice(v.id, v.name, getattr(v, "gender", None), (v.languages or [None])[0])
+                for v in self.engine.getProperty('voices')]
+
+    def voice_id(self, voice_type):
+        """Pick the engine voice for a voice type, by gender where the driver reports it"""
+        if voice_type not in self.voice_ids:
+            voices = self.voices()
+            gender = "female" if voice_type == "Female" else "male"  # Default to male for robotic
+            matches = [v for v in voices if v.gender and v.gender.lower() == gender]
+            if matches:
+                self.voice_ids[voice_type] = matches[0].id
+            else:
+                # Drivers without gender info usually list a male voice, then a female one
+                index = min(1, len(voices) - 1) if voice_type == "Female" else 0
+                self.voice_ids[voice_type] = voices[index].id
+        return self.voice_ids[voice_type]
+
+    def set_property(self, name, value):
+        # Unchanged properties aren't set again; another instance may have changed them
+        properties = self.shared["properties"]
+        if properties.get(name) != value:
+            self.engine.setProperty(name, value)
+            properties[name] = value
+
+    def set_voice_params(self, voice_type="Female", rate=100, pitch=100):
+        """Set voice parameters for pyttsx3"""
+        # Set voice type
+        self.set_property('voice', self.voice_id(voice_type))
+
+        # Set speed, as a percentage of the engine's normal words per minute
+        self.set_property('rate', int(self.normal_rate * rate / 100))
+
+    def on_utterance_started(self, name):
+        self.utterances[name] = (time.perf_counter(), [])
+
+    def on_word(self, name, location, length):
+        if name in self.utterances:
+            self.utterances[name][1].append((location, location + length, time.perf_counter()))
+
+    def on_utterance_finished(self, name, completed):
+        # The driver reports no audio positions, so each word's position is
+        # the share of the rendering time elapsed when its event arrived
+        started, words = self.utterances.pop(name, (None, []))
+        elapsed = time.perf_counter() - started if started is not None else 0
+        if completed and words and elapsed > 0:
+            self.word_events[name] = [(start, end, (at - started) / elapsed) for start, end, at in words]
+
+    def render(self, text, settings, output_file):
+        self.render_batch([(text, settings, output_file)])
+
+    def render_batch(self, items):
+        # Property changes and files are queued in order, then rendered by a
+        # single runAndWait, which saves the per-call event loop start-up
+        owners = self.shared["owners"]
+        try:
+            for text, settings, output_file in items:
+                self.set_voice_params(**settings)
+
+                # pyttsx3 can only write to a file, so this is the one disk write per synthesis
+                owners[output_file] = self
+                self.engine.save_to_file(text, output_file, name=output_file)
+            self.engine.runAndWait()
+        finally:
+            for _, _, output_file in items:
+                owners.pop(output_file, None)
+                self.utterances.pop(output_file, None)
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech; needs network access and has a single voice"""
+
+    name = "gtts"
+    audio_suffix = ".mp3"
+    supports_rate = False  # Only a "slow" flag, so rate is always an effect
+    requires_network = True
+
+    @classmethod
+    def is_available(cls):
+        return importlib.util.find_spec("gtts") is not None
+
+    def list_voices(self):
+        return [Voice("en", "Google English", None, "en")]
+
+    def render(self, text, settings, output_file):
+        from gtts import gTTS
+        tts = gTTS(text=text, lang="en")
+        tts.save(output_file)
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng command line synthesizer; offline, fast, with real pitch control"""
+
+    name = "espeak-ng"
+    supports_pitch = True
+    robotic_voice = True
+
+    # espeak-ng voice variants for each voice type
+    VARIANTS = {"Male": "en+m3", "Female": "en+f3", "Robotic": "en+robosoft"}
+    NORMAL_WPM = 175
+    NORMAL_PITCH = 50
+
+    @staticmethod
+    def executable():
+        return shutil.which("espeak-ng") or shutil.which("espeak")
+
+    @classmethod
+    def is_available(cls):
+        return cls.executable() is not None
+
+    def list_voices(self):
+        # Columns: Pty Language Age/Gender VoiceName File Other Languages
+        output = subprocess.run([self.executable(), "--voices"], stdout=subprocess.PIPE,
+                                text=True).stdout
+        voices = []
+        for line in output.splitlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 5:
+                gender = {"M": "male", "F": "female"}.get(fields[2][-1])
+                voices.append(Voice(fields[4], fields[3], gender, fields[1]))
+        return voices
+
+    def render(self, text, settings, output_file):
+        voice = self.VARIANTS.get(settings["voice_type"], "en")
+        wpm = int(self.NORMAL_WPM * settings["rate"] / 100)
+        pitch = min(99, max(0, int(self.NORMAL_PITCH * (settings["pitch"] or 100) / 100)))
+        subprocess.run([self.executable(), "-v", voice, "-s", str(wpm), "-p", str(pitch),
+                        "-w", output_file, "--stdin"],
+                       input=text.encode("utf-8"), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       check=True)
+
+
+class PiperBackend(TTSBackend):
+    """Piper local neural TTS; offline, voice chosen by the PIPER_MODEL .onnx file"""
+
+    name = "piper"
+
+    @staticmethod
+    def model():
+        return os.environ.get("PIPER_MODEL")
+
+    @classmethod
+    def catalog_key(cls):
+        return f"{cls.name}:{cls.model()}"
+
+    @classmethod
+    def is_available(cls):
+        model = cls.model()
+        return shutil.which("piper") is not None and model is not None and os.path.exists(model)
+
+    def list_voices(self):
+        name = os.path.splitext(os.path.basename(self.model()))[0]
+        return [Voice(self.model(), name, None, name.split("-")[0])]
+
+    def cache_key(self, text, settings):
+        # Different model files are different voices
+        return self.cache.make_key(text, self.name, model=self.model(), **settings)
+
+    def render(self, text, settings, output_file):
+        # length_scale > 1 speaks more slowly
+        length_scale = 100.0 / settings["rate"]
+        subprocess.run(["piper", "--model", self.model(), "--output_file", output_file,
+                        "--length_scale", f"{length_scale:.3f}"],
+                       input=text.encode("utf-8"), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       check=True)
+
+
+class FakeBackend(TTSBackend):
+    """Deterministic stand-in for a TTS engine, for benchmarks and headless runs
+
+    Produces a tone for each text at a realistic speaking rate, and sleeps to
+    mimic an engine that renders synthesis_speed characters per second.
+    """
+
+    name = "fake"
+    supports_pitch = True
+
+    def __init__(self, cache=None, sample_rate=22050, chars_per_second=15.0, synthesis_speed=2000.0):
+        super().__init__(cache)
+        self.sample_rate = sample_rate
+        self.chars_per_second = chars_per_second
+        self.synthesis_speed = synthesis_speed
+
+    def list_voices(self):
+        return [Voice("fake", "Fake voice", None, "en")]
+
+    def warm_up(self):
+        self.synthesize("Ready.")
+
+    def render_buffers(self, requests):
+        return [self.render_tone(text, settings) for text, settings in requests]
+
+    def render_tone(self, text, settings):
+        """Return an AudioBuffer of synthetic speech for text"""
+        import numpy as np
+        from audio_buffer import AudioBuffer
+
+        if self.synthesis_speed:
+            time.sleep(len(text) / self.synthesis_speed)
+
+        frames = int(len(text) / (self.chars_per_second * settings["rate"] / 100) * self.sample_rate)
+        t = np.arange(frames, dtype=np.float32) / self.sample_rate
+
+        # A pitch derived from the text keeps output deterministic but distinct
+        pitch = (110 + zlib.crc32(text.encode("utf-8")) % 120) * (settings["pitch"] or 100) / 100
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+        samples = np.sin(2 * np.pi * pitch * t) * syllables * 12000
+        return AudioBuffer(samples.astype(np.int16), self.sample_rate)
+
+
+BACKENDS = {backend.name: backend
+            for backend in [Pyttsx3Backend, GTTSBackend, EspeakBackend, PiperBackend, FakeBackend]}
+
+
+def default_preference():
+    """Backends to try in order: local engines first, network last"""
+    # pyttsx3 crashes on macOS, so it is only used there when asked for explicitly
+    if platform.system() == "Darwin":
+        return ["espeak-ng", "piper", "gtts"]
+    return ["pyttsx3", "espeak-ng", "piper", "gtts"]
+
+
+def available_backends():
+    """Names of the backends that can run on this host, fake excluded"""
+    return [name for name, backend in BACKENDS.items() if name != "fake" and backend.is_available()]
+
+
+def choose_backend(preferred=None):
+    """Name of the first available backend in preference order"""
+    for name in preferred or default_preference():
+        if name in BACKENDS and BACKENDS[name].is_available():
+            return name
+    raise RuntimeError("No text-to-speech backend available; install pyttsx3, gTTS or espeak-ng")
+
+
+def create_backend(name, cache=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}")
+    return BACKENDS[name](cache=cache)
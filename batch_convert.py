@@ -0,0 +1,206 @@
+"""Headless bulk conversion of text files to MP3 (or Opus, OGG, FLAC).
+
+Usage:
+    python batch_convert.py INPUT [INPUT ...] --output-dir out/ [--workers 4]
+
+Each INPUT is a text file, a directory (searched recursively for *.txt) or a
+manifest (.lst) listing one text file per line. Progress is appended to a
+JSON-lines log in the output directory, so re-running the same command skips
+files that already converted successfully.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+from audio_cache import AudioCache
+from audio_export import FORMATS
+from backends import BACKENDS, DEFAULT_SETTINGS, VOICE_TYPES, choose_backend, create_backend
+
+PROGRESS_FILE = ".batch_progress.jsonl"
+
+# One TTS engine per worker process, created by init_worker
+worker_backend = None
+
+
+def collect_inputs(inputs, pattern=".txt"):
+    """Expand files, directories and manifests into a sorted list of text files"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, _, names in os.walk(item):
+                files.extend(os.path.join(dirpath, n) for n in names if n.endswith(pattern))
+        elif item.endswith(".lst"):
+            base = os.path.dirname(os.path.abspath(item))
+            with open(item, encoding="utf-8") as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        files.append(os.path.join(base, line))
+        else:
+            files.append(item)
+    return sorted(set(os.path.abspath(f) for f in files))
+
+
+def output_path_for(input_file, output_dir, common_root, extension=".mp3"):
+    """Mirror the input directory layout under output_dir"""
+    relative = os.path.relpath(input_file, common_root)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + extension)
+
+
+def load_progress(progress_file):
+    """Return the set of inputs that already converted successfully"""
+    done = set()
+    if not os.path.exists(progress_file):
+        return done
+    with open(progress_file, encoding="utf-8") as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Truncated line from an interrupted run
+            if entry.get("ok"):
+                done.add(entry["input"])
+            else:
+                done.discard(entry["input"])
+    return done
+
+
+def init_worker(backend_name, cache_dir, trace_file=None):
+    """Create this worker's own engine; pyttsx3 in particular isn't thread-safe"""
+    global worker_backend
+    # Workers add their stages to the shared trace; metrics are kept by the parent
+    metrics.configure(trace_path=trace_file, environment=False)
+    worker_backend = create_backend(backend_name, cache=AudioCache(cache_dir) if cache_dir else None)
+
+
+def convert_file(input_file, output_file, settings, export_options):
+    """Synthesize one text file and export it, in a worker process"""
+    started = time.time()
+    partial_file = output_file + ".part"
+    try:
+        with open(input_file, encoding="utf-8") as f:
+            text = f.read().strip()
+        if not text:
+            raise ValueError("Input file is empty")
+
+        synthesis_started = time.time()
+        buffer = worker_backend.synthesize(text, settings)
+        synthesis_seconds = time.time() - synthesis_started
+
+        # Export to a temp name so an interrupted run never leaves a partial file
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        buffer.export(partial_file, **export_options)
+        os.replace(partial_file, output_file)
+
+        return {"input": input_file, "output": output_file, "ok": True, "error": None,
+                "seconds": round(time.time() - started, 3), "chars": len(text),
+                "synthesis_seconds": round(synthesis_seconds, 3), "audio_seconds": round(buffer.duration, 3)}
+    except Exception as e:
+        # Don't leave a half-written file behind
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        return {"input": input_file, "output": output_file, "ok": False, "error": str(e),
+                "seconds": round(time.time() - started, 3)}
+
+
+def record_metrics(result):
+    """Per-file timings, from the result a worker sent back"""
+    metrics.observe("tts_stage_seconds", result["seconds"], stage="convert_file")
+    if not result["ok"]:
+        metrics.count("tts_errors_total", stage="convert_file")
+    elif result["synthesis_seconds"] > 0:
+        metrics.observe("tts_synthesis_chars_per_second", result["chars"] / result["synthesis_seconds"])
+        if result["audio_seconds"] > 0:
+            metrics.observe("tts_synthesis_realtime_factor", result["synthesis_seconds"] / result["audio_seconds"])
+
+
+def run_batch(files, output_dir, settings, workers=None, export_options=None, cache_dir=None,
+              backend_name=None):
+    """Convert files across a process pool and return the per-file results"""
+    export_options = export_options or {"format": "mp3", "bitrate": "192k"}
+    backend_name = backend_name or choose_backend()
+    extension = FORMATS[export_options["format"]][0]
+    os.makedirs(output_dir, exist_ok=True)
+    progress_file = os.path.join(output_dir, PROGRESS_FILE)
+    done = load_progress(progress_file)
+    trace_file = metrics.trace.path if metrics.trace is not None else None
+    pending = [f for f in files if f not in done]
+    common_root = os.path.commonpath([os.path.dirname(f) for f in files]) if files else ""
+
+    print(f"{len(files)} inputs, {len(files) - len(pending)} already done, {len(pending)} to convert")
+
+    results = []
+    with open(progress_file, "a", encoding="utf-8") as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(backend_name, cache_dir, trace_file)) as pool:
+        futures = [pool.submit(convert_file, f, output_path_for(f, output_dir, common_root, extension),
+                               settings, export_options)
+                   for f in pending]
+        for count, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            record_metrics(result)
+
+            # Flush after every file so progress survives a crash
+            log.write(json.dumps(result) + "\n")
+            log.flush()
+
+            status = "ok" if result["ok"] else f"FAILED: {result['error']}"
+            print(f"[{count}/{len(pending)}] {result['input']} {status}")
+    return results
+
+
+def write_report(results, report_file):
+    """Write the per-file results as JSON"""
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert text files to audio without the GUI")
+    parser.add_argument("inputs", nargs="+", help="Text files, directories or .lst manifests")
+    parser.add_argument("-o", "--output-dir", required=True, help="Where to write the audio files")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="TTS engine (default: the first one available on this host)")
+    parser.add_argument("--voice", default="Female", choices=VOICE_TYPES)
+    parser.add_argument("--rate", type=int, default=100, help="Speech speed in percent (50-200)")
+    parser.add_argument("--pitch", type=int, default=100, help="Pitch in percent (50-200)")
+    parser.add_argument("--loudness", type=float, default=DEFAULT_SETTINGS["loudness"],
+                        help="Loudness to normalize to, in LUFS (default: %(default)s)")
+    parser.add_argument("--no-loudness", action="store_true", help="Keep the engine's own level")
+    parser.add_argument("--format", default="mp3", choices=sorted(FORMATS), help="Output format")
+    parser.add_argument("--bitrate", default="192k", help="Constant bitrate for lossy formats")
+    parser.add_argument("--vbr", type=int, default=None,
+                        help="VBR quality instead of a constant bitrate (MP3: 0-9, OGG: -1-10)")
+    parser.add_argument("--cache-dir", default=None, help="Synthesis cache directory (default: no cache)")
+    parser.add_argument("--report", default=None, help="Write a JSON report of this run to this file")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help=f"Write Prometheus metrics to FILE (default: ${metrics.METRICS_FILE_ENV})")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help=f"Append a Chrome trace of every stage to FILE (default: ${metrics.TRACE_FILE_ENV})")
+    args = parser.parse_args(argv)
+    metrics.configure(args.metrics, args.trace)
+
+    files = collect_inputs(args.inputs)
+    settings = {"voice_type": args.voice, "rate": args.rate, "pitch": args.pitch,
+                "loudness": None if args.no_loudness else args.loudness}
+    export_options = {"format": args.format, "bitrate": args.bitrate, "vbr_quality": args.vbr}
+    results = run_batch(files, args.output_dir, settings, workers=args.workers,
+                        export_options=export_options, cache_dir=args.cache_dir, backend_name=args.backend)
+
+    if args.report:
+        write_report(results, args.report)
+
+    failed = [r for r in results if not r["ok"]]
+    print(f"Converted {len(results) - len(failed)} files, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
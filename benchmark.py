@@ -0,0 +1,327 @@
+"""Headless benchmarks for the synthesis, analysis and export paths.
+
+Usage:
+    python benchmark.py                   # run and compare with the baseline
+    python benchmark.py --save-baseline   # run and store the results as the new baseline
+
+Synthesis uses FakeBackend, so results don't depend on the installed TTS
+engine. Export benchmarks are skipped when ffmpeg is not available. A metric
+is reported as a regression when it is more than --tolerance worse than the
+stored baseline, and the script then exits with status 1.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.io import wavfile
+
+import metrics
+from audio_analysis import min_max_envelope, peak_and_rms, read_wav
+from audio_export import ChunkedExporter, export_buffer
+from backends import FakeBackend
+from synthesis_worker import SynthesisWorker
+from text_normalization import normalize
+from text_processing import split_into_chunks
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+SAMPLE_TEXT = ("The quick brown fox jumps over the lazy dog. "
+               "Pack my box with five dozen liquor jugs, then send it along. "
+               "How vexingly quick daft zebras jump! ")
+
+# Numbers, dates, currency, abbreviations, markup and a URL, for the normalizer. This is
+# the worst case, something to spell out every few words: each kind of number is its own
+# regex pass, and plain prose skips them all, so it runs about 7x slower than plain text.
+# At under 1 MB/s a 300-page book (about 600 KB) still normalizes in under a second,
+# against hours of synthesis.
+MIXED_TEXT = ("Dr. Smith paid $1,234.50 on 2024-03-15 for **3** items (approx. 12.5% off). "
+              "See [the notes](https://example.com/notes) or call 555-0100 before the 21st. "
+              "<b>Version 2.4.1</b> shipped in 1999; Mr. Jones read ch. 7 at 10:30. ")
+
+
+def make_text(chars):
+    return (SAMPLE_TEXT * (chars // len(SAMPLE_TEXT) + 1))[:chars]
+
+
+def measure(func, repeat=3):
+    """Median wall-clock time of func over repeat runs"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def bench_startup(results):
+    # A fresh interpreter each time, so nothing is already imported
+    here = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, "-c", "import app"]
+    results["startup_import_app"] = (measure(lambda: subprocess.run(command, cwd=here, check=True)),
+                                     "s", False)
+
+
+def bench_normalization(results, chars):
+    for name, sample in (("mixed", MIXED_TEXT), ("plain", SAMPLE_TEXT)):
+        text = (sample * (chars // len(sample) + 1))[:chars]
+        megabytes = len(text.encode()) / 1e6
+        results[f"normalization_{name}_throughput"] = (megabytes / measure(lambda: normalize(text)), "MB/s", True)
+
+
+def bench_metrics_overhead(results, calls=200000):
+    # Instrumentation left in the code must cost next to nothing while metrics are off
+    def spans():
+        for _ in range(calls):
+            with metrics.span("bench"):
+                pass
+
+    results["metrics_disabled_span_overhead"] = (measure(spans) / calls * 1e9, "ns", False)
+
+
+def bench_time_to_first_audio(results, chars):
+    backend = FakeBackend()
+    text = make_text(chars)
+
+    def first_chunk():
+        chunks = split_into_chunks(text)
+        backend.synthesize(chunks[0])
+
+    results["time_to_first_audio_streaming"] = (measure(first_chunk), "s", False)
+    results["time_to_first_audio_whole_text"] = (measure(lambda: backend.synthesize(text), repeat=1),
+                                                 "s", False)
+
+
+def bench_throughput(results, chars):
+    worker = SynthesisWorker(FakeBackend).start()
+    chunks = split_into_chunks(make_text(chars))
+
+    def run():
+        jobs = [worker.submit(lambda s, j, c=c: s.synthesize(c), block=True) for c in chunks]
+        for job in jobs:
+            job.result()
+
+    elapsed = measure(run, repeat=1)
+    worker.stop()
+    results["synthesis_throughput"] = (chars / elapsed, "chars/s", True)
+
+
+def bench_script(results, lines):
+    from dialog import ScriptRenderer, parse_script
+
+    # A dialog between three voices, rendered with an engine per voice and then one line at a time
+    speakers = ["[Alice voice=Female]", "[Bob voice=Male]", "[Robot voice=Robotic]"]
+    script = "\n".join(f"{speakers[i % 3]} {make_text(120)}" for i in range(lines))
+    renderer = ScriptRenderer()
+    results[f"script_{lines}_lines_concurrent"] = (
+        measure(lambda: renderer.render_script(script, engine="fake"), repeat=1), "s", False)
+    renderer.stop()
+
+    backend = FakeBackend()
+
+    def one_at_a_time():
+        for segment in parse_script(script, engine="fake"):
+            backend.synthesize_batch([(chunk, segment["settings"]) for chunk in split_into_chunks(segment["text"])])
+
+    results[f"script_{lines}_lines_sequential"] = (measure(one_at_a_time, repeat=1), "s", False)
+
+
+def bench_effects(results, seconds):
+    from audio_effects import apply_effects
+    buffer = FakeBackend(synthesis_speed=0).synthesize(make_text(int(seconds * 15)))
+
+    # How many times faster than real time speed and pitch changes run
+    for name, rate, pitch in [("speed", 150, 100), ("pitch", 100, 130), ("speed_and_pitch", 80, 120)]:
+        elapsed = measure(lambda: apply_effects(buffer, rate, pitch))
+        results[f"effects_{name}_realtime_factor"] = (buffer.duration / elapsed, "x", True)
+
+
+def bench_postprocess(results, seconds):
+    from audio_postprocess import normalize_loudness, trim_silence
+    buffer = FakeBackend(synthesis_speed=0).synthesize(make_text(int(seconds * 15)), {"loudness": None})
+
+    # Loudness has to read all the audio; trimming only the silent ends
+    for name, process in [("loudness", lambda: normalize_loudness(buffer, -16.0)),
+                          ("trim", lambda: trim_silence(buffer))]:
+        results[f"postprocess_{name}_realtime_factor"] = (buffer.duration / measure(process), "x", True)
+
+
+def bench_waveform(results, durations):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from waveform import WaveformView
+
+    fig, ax = plt.subplots(figsize=(7, 3))
+    view = WaveformView(ax, fig.canvas)
+    for seconds in durations:
+        data = (np.random.default_rng(0).standard_normal(22050 * seconds) * 8000).astype(np.int16)
+
+        def render():
+            view.set_audio(data, 22050)
+            fig.canvas.draw()
+
+        results[f"waveform_render_{seconds}s"] = (measure(render), "s", False)
+    plt.close(fig)
+
+
+def bench_live_view(results):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from live_view import Blitter, LevelMeter, SpectrogramView
+
+    fig = plt.figure(figsize=(7, 3))
+    grid = fig.add_gridspec(2, 2, width_ratios=(12, 1.5))
+    blitter = Blitter(fig.canvas)
+    meter = LevelMeter(fig.add_subplot(grid[:, 1]))
+    spectrogram = SpectrogramView(fig.add_subplot(grid[1, 0]))
+    blitter.add(*meter.artists, *spectrogram.artists)
+    fig.canvas.draw()
+
+    data = (np.random.default_rng(0).standard_normal((22050 * 30, 1)) * 0.1).astype(np.float32)
+    step = 22050 * 33 // 1000
+    frames = iter(range(step, len(data), step))
+
+    def frame():
+        # What the app does for each frame at 30 fps
+        playhead = next(frames)
+        meter.update(lambda start, end: data[max(0, start):end], playhead, 22050)
+        spectrogram.update(lambda start, end: data[max(0, start):end], playhead, 22050)
+        blitter.update()
+
+    results["live_view_frame"] = (measure(frame, repeat=50), "s", False)
+    results["live_view_full_redraw"] = (measure(fig.canvas.draw), "s", False)
+    plt.close(fig)
+
+
+def bench_analysis_memory(results, seconds, temp_dir):
+    wav_file = os.path.join(temp_dir, "long.wav")
+    data = (np.random.default_rng(1).standard_normal((22050 * seconds, 2)) * 8000).astype(np.int16)
+    wavfile.write(wav_file, 22050, data)
+    file_mb = os.path.getsize(wav_file) / 1e6
+    del data
+
+    def analyse():
+        sample_rate, samples = read_wav(wav_file)
+        peak_and_rms(samples)
+        min_max_envelope(samples, 1000)
+
+    tracemalloc.start()
+    elapsed = measure(analyse, repeat=1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results[f"analysis_{seconds}s_time"] = (elapsed, "s", False)
+    results[f"analysis_{seconds}s_peak_memory"] = (peak / 1e6, "MB", False)
+    print(f"  (analysed a {file_mb:.0f} MB WAV file)")
+
+
+def bench_export(results, chars, temp_dir):
+    from pydub import AudioSegment
+    if shutil.which(AudioSegment.converter) is None:
+        print("  ffmpeg not found, skipping export benchmarks")
+        return
+
+    backend = FakeBackend(synthesis_speed=0)
+    buffers = [backend.synthesize(c) for c in split_into_chunks(make_text(chars))]
+    whole = buffers[0].concatenate(buffers)
+
+    def export_whole():
+        export_buffer(whole, os.path.join(temp_dir, "whole.mp3"))
+
+    def export_chunked():
+        exporter = ChunkedExporter(os.path.join(temp_dir, "chunked.mp3"))
+        for buffer in buffers:
+            exporter.add(buffer)
+        exporter.finish()
+
+    results["export_mp3_whole"] = (measure(export_whole, repeat=1), "s", False)
+    results["export_mp3_chunked"] = (measure(export_chunked, repeat=1), "s", False)
+
+
+def run_benchmarks(quick=False):
+    """Run every benchmark; returns {name: (value, unit, higher_is_better)}"""
+    results = {}
+    chars = 5000 if quick else 50000
+    temp_dir = tempfile.mkdtemp(prefix="tts_bench_")
+    try:
+        steps = [
+            ("startup", lambda: bench_startup(results)),
+            ("text normalization", lambda: bench_normalization(results, chars * 20)),
+            ("metrics overhead", lambda: bench_metrics_overhead(results)),
+            ("time to first audio", lambda: bench_time_to_first_audio(results, chars)),
+            ("synthesis throughput", lambda: bench_throughput(results, chars)),
+            ("multi-voice script", lambda: bench_script(results, 50)),
+            ("speed and pitch effects", lambda: bench_effects(results, 60 if quick else 600)),
+            ("loudness and trimming", lambda: bench_postprocess(results, 60 if quick else 600)),
+            ("waveform rendering", lambda: bench_waveform(results, [10, 60] if quick else [10, 60, 600])),
+            ("live spectrogram and meter", lambda: bench_live_view(results)),
+            ("analysis memory", lambda: bench_analysis_memory(results, 60 if quick else 600, temp_dir)),
+            ("export", lambda: bench_export(results, chars // 5, temp_dir)),
+        ]
+        for title, step in steps:
+            print(f"Running {title}...")
+            step()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each metric next to its baseline; return the names that regressed"""
+    regressions = []
+    for name, (value, unit, higher_is_better) in results.items():
+        line = f"{name:40s} {value:12.4f} {unit}"
+        if name in baseline:
+            base = baseline[name]["value"]
+            change = (value - base) / base if base else 0.0
+            worse = -change if higher_is_better else change
+            line += f"   baseline {base:.4f} ({change:+.1%})"
+            if worse > tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark synthesis, analysis and export")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown before reporting a regression (default: 0.2 = 20%%)")
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs for a fast check")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print()
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({name: {"value": value, "unit": unit, "higher_is_better": higher}
+                       for name, (value, unit, higher) in results.items()}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
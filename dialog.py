@@ -0,0 +1,364 @@
+"""Render scripts with several speakers, each with their own voice, engine, rate, pitch and pauses.
+
+A script is text with speaker tags in square brackets:
+
+    [Narrator voice=Male rate=90] It was late when the phone rang.
+    [Alice voice=Female pitch=115] Hello? Who is this?
+    [pause 800ms]
+    [Bob engine=espeak-ng voice=Male] It's me.
+    [Alice] Bob! Where are you?
+
+A tag at the start of a line switches to that speaker for the text after
+it; brackets elsewhere, such as [laughs] or [sic], are read as text. Text
+counts as a script when it has tags for at least two speakers, or a tag
+with settings, so a lone "[x] done" line is not one. Settings given in a
+tag stay with the speaker for the rest of the script: voice (Male, Female or
+Robotic), rate and pitch (percent), pause (the silence after each sentence)
+and engine. A speaker whose voice isn't set gets the next of the
+Female and Male voices; text before the first tag is read with the default
+settings. [pause 500], [pause 500ms] or [pause 1.5s] adds silence.
+
+Usage:
+    python dialog.py script.txt -o dialog.mp3 [--subtitles dialog.srt]
+
+Each voice has its own engine on its own synthesis thread, which renders
+all of that voice's lines in one batch, so every voice renders at once and
+a script takes about as long as its busiest voice. Engines that can't be
+used from two threads (pyttsx3) render all their voices on one thread. The
+lines are then joined in script order.
+"""
+import argparse
+import re
+import sys
+from math import gcd
+
+import metrics
+from backends import BACKENDS, DEFAULT_SETTINGS, VOICE_TYPES, choose_backend, create_backend
+from synthesis_worker import INTERACTIVE, SynthesisWorker
+from text_processing import split_into_chunks
+from timing import TimingIndex
+
+# A tag is a name and/or key=value settings in square brackets at the start of a line;
+# "[text](url)" is a Markdown link
+TAG = re.compile(r'(?m)^[ \t]*\[([A-Za-z][^\[\]\n]{0,79})\](?!\()')
+DURATION = re.compile(r'(?i)^(\d+(?:\.\d+)?)\s*(ms|s)?$')
+
+SPEAKER_SETTINGS = ("voice", "rate", "pitch", "pause", "engine")
+
+
+def is_pause(body):
+    return body.lower().startswith("pause ") and "=" not in body
+
+
+def speaker_name(body):
+    """The name in a tag, without its key=value settings"""
+    return " ".join(token for token in body.split() if "=" not in token)
+
+
+def is_script(text):
+    """Whether text has tags for two or more speakers, or a tag with settings"""
+    names = set()
+    for match in TAG.finditer(text):
+        body = match.group(1)
+        if "=" in body:
+            return True
+        if not is_pause(body):
+            names.add(speaker_name(body).lower())
+            if len(names) > 1:
+                return True
+    return False
+
+
+def parse_duration(value, line):
+    """Milliseconds from a duration such as 500, 500ms or 1.5s"""
+    match = DURATION.match(value.strip())
+    if match is None:
+        raise ValueError(f"Line {line}: {value!r} is not a duration such as 500ms or 1.5s")
+    number, unit = float(match.group(1)), (match.group(2) or "ms").lower()
+    return int(number * 1000) if unit == "s" else int(number)
+
+
+def parse_setting(speaker, key, value, line):
+    """Apply one key=value from a tag to a speaker"""
+    key = key.lower()
+    if key == "voice":
+        voice = value.title()
+        if voice not in VOICE_TYPES:
+            raise ValueError(f"Line {line}: voice must be one of {', '.join(VOICE_TYPES)}, not {value!r}")
+        speaker["settings"]["voice_type"] = voice
+    elif key in ("rate", "pitch"):
+        try:
+            number = int(float(value.rstrip("%")))
+        except ValueError:
+            raise ValueError(f"Line {line}: {key} must be a percentage, not {value!r}") from None
+        speaker["settings"][key] = min(max(50, number), 200)
+    elif key == "pause":
+        speaker["settings"]["pause_ms"] = min(parse_duration(value, line), 5000)
+    elif key == "engine":
+        if value not in BACKENDS:
+            raise ValueError(f"Line {line}: unknown engine {value!r}")
+        speaker["engine"] = value
+    else:
+        raise ValueError(f"Line {line}: unknown setting {key!r} (use {', '.join(SPEAKER_SETTINGS)})")
+
+
+def parse_script(text, settings=None, engine=None):
+    """Split a script into segments, one for each run of text by one speaker
+
+    Returns a list of {"speaker", "engine", "settings", "text", "start",
+    "end", "gap_ms"} in script order, where start and end are the
+    segment's character offsets in text and gap_ms the silence added after
+    it by pause tags. Raises ValueError for a malformed tag.
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    engine = engine or choose_backend()
+    narrator = {"name": None, "engine": engine, "settings": dict(settings)}
+    speakers = {}
+    current = narrator
+
+    # Speakers without a voice take turns between the default voice and the others
+    voices = [settings["voice_type"]] + [v for v in ("Female", "Male") if v != settings["voice_type"]]
+    assigned = 0
+
+    segments = []
+
+    def add_segment(start, end, gap_ms=0):
+        if gap_ms or text[start:end].strip():
+            segments.append({"speaker": current["name"], "engine": current["engine"],
+                             "settings": dict(current["settings"]), "text": text[start:end],
+                             "start": start, "end": end, "gap_ms": gap_ms})
+
+    position = 0
+    for match in TAG.finditer(text):
+        add_segment(position, match.start())
+        position = match.end()
+        body = match.group(1).strip()
+        line = text.count("\n", 0, match.start()) + 1
+
+        if is_pause(body):
+            gap_ms = parse_duration(body[len("pause "):], line)
+            if segments:
+                segments[-1]["gap_ms"] += gap_ms
+            else:
+                add_segment(match.start(), match.start(), gap_ms)
+            continue
+
+        name = speaker_name(body)
+        if name and name.lower() not in speakers:
+            # A speaker named after a voice type speaks with it
+            if name.title() in VOICE_TYPES:
+                voice = name.title()
+            else:
+                voice = voices[assigned % len(voices)]
+                assigned += 1
+            speakers[name.lower()] = {"name": name, "engine": engine, "settings": dict(settings, voice_type=voice)}
+        if name:
+            current = speakers[name.lower()]
+        for token in body.split():
+            if "=" in token:
+                key, value = token.split("=", 1)
+                parse_setting(current, key, value, line)
+    add_segment(position, len(text))
+    return segments
+
+
+def conform(buffer, sample_rate, channels):
+    """The buffer at another sample rate and channel count, for joining audio from different engines"""
+    if buffer.sample_rate == sample_rate and buffer.channels == channels:
+        return buffer
+    from scipy.signal import resample_poly
+    from audio_buffer import AudioBuffer
+    from audio_effects import to_float, to_pcm16
+
+    data = to_float(buffer.samples)
+    if data.shape[1] != channels:
+        data = data.mean(axis=1, keepdims=True).repeat(channels, axis=1)
+    words = buffer.words
+    if buffer.sample_rate != sample_rate and len(data):
+        divisor = gcd(sample_rate, buffer.sample_rate)
+        data = resample_poly(data, sample_rate // divisor, buffer.sample_rate // divisor, axis=0)
+        if words is not None:
+            words = [int(frame * sample_rate / buffer.sample_rate) for frame in words]
+    return AudioBuffer(to_pcm16(data, channels), sample_rate, words)
+
+
+def stitch(text, segments, rendered):
+    """Join the rendered segments in script order; returns (AudioBuffer, TimingIndex)
+
+    rendered holds (chunks, buffers) for each segment. Audio from engines
+    with another sample rate or channel count is converted to that of the
+    first line, and the timing index has the sentence and word times with
+    offsets into the script text.
+    """
+    import numpy as np
+    from audio_buffer import AudioBuffer
+
+    spoken = [buffer for _, buffers in rendered for buffer in buffers if len(buffer.samples)]
+    if not spoken:
+        raise ValueError("The script has nothing to say")
+    sample_rate, channels = spoken[0].sample_rate, spoken[0].channels
+    dtype = spoken[0].samples.dtype
+
+    pieces = []
+    sentences = []
+    words = []
+    frames = 0
+    for segment, (chunks, buffers) in zip(segments, rendered):
+        buffers = [conform(buffer, sample_rate, channels) if len(buffer.samples) else buffer
+                   for buffer in buffers]
+        seconds = frames / sample_rate
+        timing = TimingIndex.build(segment["text"], chunks, buffers)
+        sentences.extend((start + seconds, end + seconds, char_start + segment["start"], char_end + segment["start"])
+                         for start, end, char_start, char_end in timing.sentences)
+        words.extend((start + seconds, char_start + segment["start"], char_end + segment["start"])
+                     for start, char_start, char_end in timing.words)
+        pieces.extend(buffer for buffer in buffers if len(buffer.samples))
+        frames += sum(len(buffer.samples) for buffer in buffers)
+
+        gap = int(segment["gap_ms"] * sample_rate / 1000)
+        if gap:
+            shape = (gap,) if channels == 1 else (gap, channels)
+            pieces.append(AudioBuffer(np.zeros(shape, dtype=dtype), sample_rate))
+            frames += gap
+    return AudioBuffer.concatenate(pieces), TimingIndex(text, sentences, words)
+
+
+class ScriptRenderer:
+    """Renders script segments with one synthesis worker, and so one engine, per voice
+
+    Workers are created the first time a voice is needed and kept for later
+    scripts. Each voice's lines go to its worker as one batch, and all the
+    batches run at the same time. An engine that isn't thread-safe (pyttsx3
+    shares one engine per process) gets a single worker for all its voices,
+    or renders on the calling thread when the caller passes its own backend
+    for it, so the engine is never used by two threads at once.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.workers = {}
+
+    def worker_for(self, engine, voice_type):
+        key = (engine, voice_type)
+        if key not in self.workers:
+            self.workers[key] = SynthesisWorker(lambda: create_backend(engine, cache=self.cache)).start()
+        return self.workers[key]
+
+    def render(self, segments, priority=INTERACTIVE, backend=None):
+        """Synthesize every segment; returns (chunks, buffers) for each, in script order
+
+        backend is the calling thread's own backend, if it has one; lines for
+        its engine are then rendered here when the engine isn't thread-safe.
+        """
+        batches = {}
+        for index, segment in enumerate(segments):
+            engine = segment["engine"]
+            # All voices of an engine that isn't thread-safe go in one batch, grouped by voice below
+            voice_type = segment["settings"]["voice_type"] if BACKENDS[engine].thread_safe else None
+            batches.setdefault((engine, voice_type), []).append((index, split_into_chunks(segment["text"])))
+        metrics.set_gauge("tts_queue_depth", len(batches), queue="script")
+
+        jobs = []
+        local = None
+        for (engine, voice_type), items in batches.items():
+            if voice_type is None:
+                # Fewer voice switches for the engine; the results are matched back by index
+                items.sort(key=lambda item: segments[item[0]]["settings"]["voice_type"])
+            requests = [(chunk, segments[index]["settings"]) for index, chunks in items for chunk in chunks]
+
+            def synthesize(backend, job, requests=requests, voice_type=voice_type):
+                with metrics.span("script_voice", voice=voice_type or "all"):
+                    return backend.synthesize_batch(requests)
+
+            if voice_type is None and backend is not None and backend.name == engine:
+                local = (items, synthesize)
+            else:
+                jobs.append((items, self.worker_for(engine, voice_type).submit(synthesize, priority, block=True)))
+
+        # Every other batch is already running while the caller renders its own
+        finished = []
+        if local is not None:
+            items, synthesize = local
+            finished.append((items, synthesize(backend, None)))
+        finished.extend((items, job.result()) for items, job in jobs)
+
+        # Collect them in script order
+        rendered = [None] * len(segments)
+        for items, buffers in finished:
+            buffers = iter(buffers)
+            for index, chunks in items:
+                rendered[index] = (chunks, [next(buffers) for _ in chunks])
+        return rendered
+
+    def render_script(self, text, settings=None, engine=None, priority=INTERACTIVE, backend=None):
+        """Parse, render and join a script; returns (AudioBuffer, TimingIndex)
+
+        backend is the calling thread's own backend, as for render().
+        """
+        segments = parse_script(text, settings, engine)
+        with metrics.span("script_render"):
+            rendered = self.render(segments, priority, backend)
+        return stitch(text, segments, rendered)
+
+    def cancel(self, priority=None):
+        """Cancel the batches being rendered, optionally only those of one priority"""
+        for worker in self.workers.values():
+            worker.cancel_all(priority)
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+
+
+def main(argv=None):
+    from audio_cache import AudioCache
+    from audio_export import StreamEncoder, format_for_path
+
+    parser = argparse.ArgumentParser(description="Render a script with several speakers to one audio file")
+    parser.add_argument("script", help="Text file with [speaker] tags")
+    parser.add_argument("-o", "--output", required=True, help="Audio file to write (.mp3, .opus, .ogg, .flac, .wav)")
+    parser.add_argument("--subtitles", default=None, metavar="FILE", help="Also write SRT or WebVTT subtitles")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="Engine for speakers without engine= (default: the first one available)")
+    parser.add_argument("--voice", default="Female", choices=VOICE_TYPES, help="Voice for text before any tag")
+    parser.add_argument("--rate", type=int, default=100, help="Default speech speed in percent (50-200)")
+    parser.add_argument("--pitch", type=int, default=100, help="Default pitch in percent (50-200)")
+    parser.add_argument("--pause-ms", type=int, default=DEFAULT_SETTINGS["pause_ms"],
+                        help="Default silence after each sentence (default: %(default)s)")
+    parser.add_argument("--bitrate", default="192k", help="Bitrate for lossy formats")
+    parser.add_argument("--cache-dir", default=None, help="Synthesis cache directory (default: no cache)")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help=f"Write Prometheus metrics to FILE (default: ${metrics.METRICS_FILE_ENV})")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help=f"Append a Chrome trace of every stage to FILE (default: ${metrics.TRACE_FILE_ENV})")
+    args = parser.parse_args(argv)
+    metrics.configure(args.metrics, args.trace)
+
+    with open(args.script, encoding="utf-8") as f:
+        text = f.read().strip()
+    settings = {"voice_type": args.voice, "rate": args.rate, "pitch": args.pitch, "pause_ms": args.pause_ms}
+    renderer = ScriptRenderer(AudioCache(args.cache_dir) if args.cache_dir else None)
+    try:
+        buffer, timing = renderer.render_script(text, settings, args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        renderer.stop()
+
+    encoder = StreamEncoder(args.output, format_for_path(args.output), bitrate=args.bitrate)
+    try:
+        encoder.write(buffer)
+        encoder.finish()
+    except BaseException:
+        encoder.abort()
+        raise
+    print(f"Wrote {args.output} ({buffer.duration:.1f} s, {len(timing.sentences)} sentences)")
+    if args.subtitles:
+        timing.save_subtitles(args.subtitles)
+        print(f"Wrote {args.subtitles}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""Views that follow playback: a scrolling spectrogram and an RMS/peak level meter.
+
+Both are fed the playhead frame and a read(start, end) function returning
+the audio (Player.read), and only analyse audio that was played since the
+last update. They are redrawn by a Blitter, which repaints just their
+animated artists over a saved background instead of drawing the figure.
+"""
+import numpy as np
+from matplotlib.patches import Rectangle
+
+SPECTROGRAM_SECONDS = 6.0
+SPECTROGRAM_COLUMNS = 300
+FFT_SIZE = 512
+MAX_FREQUENCY = 8000.0  # Hz; speech has little energy above this
+FLOOR_DB = -90.0
+
+METER_FLOOR_DB = -60.0
+METER_BLOCK_SECONDS = 0.05
+PEAK_HOLD_SECONDS = 1.0
+PEAK_FALL_DB_PER_SECOND = 20.0
+
+
+class Blitter:
+    """Redraws only the animated artists of a canvas, over a background saved after each full draw
+
+    Artists added here are animated, so full draws (resizes, zooming the
+    waveform) leave them out; the background is then grabbed again and the
+    artists are drawn on top.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        canvas.mpl_connect("draw_event", self.on_draw)
+
+    def add(self, *artists):
+        for artist in artists:
+            artist.set_animated(True)
+            self.artists.append(artist)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            if artist.axes.get_visible():
+                artist.axes.draw_artist(artist)
+
+    def update(self):
+        """Repaint the animated artists and copy only their axes to the screen"""
+        if self.background is None:
+            self.canvas.draw_idle()  # The draw event saves the background
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        for ax in {artist.axes for artist in self.artists}:
+            if ax.get_visible():
+                self.canvas.blit(ax.bbox)
+
+
+def mono(data):
+    return data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+
+
+class SpectrogramView:
+    """The last few seconds of playback as a spectrogram that scrolls left as audio plays
+
+    Each image column is one FFT_SIZE window, ending hop frames after the
+    previous one; update() computes the columns for newly played audio only,
+    all at once, and shifts them into the image.
+    """
+
+    def __init__(self, ax, seconds=SPECTROGRAM_SECONDS, columns=SPECTROGRAM_COLUMNS, fft_size=FFT_SIZE):
+        self.ax = ax
+        self.seconds = seconds
+        self.columns = columns
+        self.fft_size = fft_size
+        self.window = np.hanning(fft_size).astype(np.float32)
+        # A full-scale sine reads 0 dB
+        self.window_gain = 2.0 / self.window.sum()
+        self.sample_rate = None
+        self.hop = 1
+        self.bins = fft_size // 2 + 1
+        self.next_frame = None  # Where the next column's window ends
+
+        ax.set_title("Spectrogram", fontsize="small")
+        ax.set_xlabel("Seconds ago")
+        ax.set_ylabel("kHz")
+        self.pixels = np.full((self.bins, columns), FLOOR_DB, dtype=np.float32)
+        self.image = ax.imshow(self.pixels, origin="lower", aspect="auto", cmap="magma",
+                               vmin=FLOOR_DB, vmax=0, interpolation="nearest",
+                               extent=(-seconds, 0, 0, 1))
+
+    @property
+    def artists(self):
+        return [self.image]
+
+    def reset(self, sample_rate):
+        """Blank the image; the next update starts from the playhead"""
+        if sample_rate != self.sample_rate:
+            self.sample_rate = sample_rate
+            self.hop = max(1, int(sample_rate * self.seconds / self.columns))
+            nyquist = sample_rate / 2
+            top = min(MAX_FREQUENCY, nyquist)
+            self.bins = int(round((self.fft_size // 2) * top / nyquist)) + 1
+            self.pixels = np.empty((self.bins, self.columns), dtype=np.float32)
+            self.image.set_extent((-self.seconds, 0, 0, top / 1000))
+        self.pixels.fill(FLOOR_DB)
+        self.image.set_data(self.pixels)
+        self.next_frame = None
+
+    def update(self, read, playhead, sample_rate):
+        """Add the columns for audio played since the last update; returns whether the image changed"""
+        if sample_rate != self.sample_rate:
+            self.reset(sample_rate)
+
+        # After a seek, or the first time, start from one screen before the playhead
+        span = self.hop * self.columns
+        if self.next_frame is None or playhead < self.next_frame - self.hop or playhead - self.next_frame > span:
+            self.pixels.fill(FLOOR_DB)
+            self.next_frame = max(self.hop, playhead - span)
+            self.next_frame -= self.next_frame % self.hop
+
+        count = (playhead - self.next_frame) // self.hop + 1
+        if count <= 0:
+            return False
+        last = self.next_frame + (count - 1) * self.hop
+        start = self.next_frame - self.fft_size
+        samples = mono(read(start, last))
+        if start < 0 or len(samples) < last - start:
+            # Before the start or past the end of the audio: silence
+            padded = np.zeros(last - start, dtype=np.float32)
+            offset = max(0, -start)
+            padded[offset:offset + len(samples)] = samples
+            samples = padded
+
+        # Every window at once: one row per column
+        windows = np.lib.stride_tricks.sliding_window_view(samples, self.fft_size)[::self.hop]
+        spectra = np.abs(np.fft.rfft(windows * self.window, axis=1)[:, :self.bins]) * self.window_gain
+        levels = 20 * np.log10(np.maximum(spectra, 1e-9)).T
+
+        count = min(count, self.columns)
+        self.pixels[:, :-count] = self.pixels[:, count:]
+        self.pixels[:, -count:] = np.maximum(levels[:, -count:], FLOOR_DB)
+        self.image.set_data(self.pixels)
+        self.next_frame = last + self.hop
+        return True
+
+
+class LevelMeter:
+    """RMS and peak bars in dBFS for the audio just played, with a falling peak-hold line"""
+
+    def __init__(self, ax, floor_db=METER_FLOOR_DB):
+        self.ax = ax
+        self.floor_db = floor_db
+        self.held = self.held_peak = floor_db
+        self.held_frame = None
+
+        ax.set_xlim(0, 2)
+        ax.set_ylim(floor_db, 0)
+        ax.set_xticks([0.5, 1.5], ["RMS", "Pk"], fontsize="xx-small")
+        ax.yaxis.tick_right()
+        ax.tick_params(axis="y", labelsize="x-small")
+        ax.set_title("dBFS", fontsize="small")
+        self.rms_bar = ax.add_patch(Rectangle((0.1, floor_db), 0.8, 0, color="tab:green"))
+        self.peak_bar = ax.add_patch(Rectangle((1.1, floor_db), 0.8, 0, color="tab:orange"))
+        self.hold_line = ax.axhline(floor_db, color="red", linewidth=1.5)
+
+    @property
+    def artists(self):
+        return [self.rms_bar, self.peak_bar, self.hold_line]
+
+    def clear(self):
+        self.held = self.held_peak = self.floor_db
+        self.held_frame = None
+        self.set_levels(self.floor_db, self.floor_db)
+
+    def set_levels(self, rms_db, peak_db):
+        self.rms_bar.set_height(max(0.0, rms_db - self.floor_db))
+        self.peak_bar.set_height(max(0.0, peak_db - self.floor_db))
+        self.hold_line.set_ydata([self.held, self.held])
+
+    def update(self, read, playhead, sample_rate):
+        """Measure the block of audio that ends at the playhead"""
+        data = read(playhead - int(sample_rate * METER_BLOCK_SECONDS), playhead)
+        if len(data):
+            rms = float(np.sqrt(np.mean(data * data)))
+            peak = float(np.abs(data).max())
+        else:
+            rms = peak = 0.0
+        rms_db = max(self.floor_db, 20 * np.log10(max(rms, 1e-9)))
+        peak_db = max(self.floor_db, 20 * np.log10(max(peak, 1e-9)))
+
+        # The held peak stays put for a while, then falls at a steady rate
+        if self.held_frame is None or playhead < self.held_frame:
+            self.held_peak, self.held_frame = peak_db, playhead
+        late = max(0.0, (playhead - self.held_frame) / sample_rate - PEAK_HOLD_SECONDS)
+        self.held = self.held_peak - late * PEAK_FALL_DB_PER_SECOND
+        if peak_db >= self.held:
+            self.held = self.held_peak = peak_db
+            self.held_frame = playhead
+        self.set_levels(rms_db, peak_db)
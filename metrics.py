@@ -0,0 +1,258 @@
+"""Timing spans, counters and histograms for finding where time goes.
+
+Disabled by default, and then every call is a flag check: span() returns a
+shared do-nothing context manager and count()/observe()/set_gauge() return
+straight away. configure() turns collection on, with either or both of:
+
+    metrics_file   Prometheus text format, rewritten every few seconds and
+                   at exit (for node_exporter's textfile collector, or to read)
+    trace_file     one Chrome trace event per span, to open in Perfetto or
+                   chrome://tracing
+
+Both default to the TTS_METRICS_FILE and TTS_TRACE_FILE environment
+variables. tts_server.py also serves the same text at GET /metrics.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_FILE_ENV = "TTS_METRICS_FILE"
+TRACE_FILE_ENV = "TTS_TRACE_FILE"
+WRITE_INTERVAL = 10.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CHARS_PER_SECOND_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+REALTIME_FACTOR_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "tts_stage_seconds": ("histogram", "Time spent in each stage of synthesis, playback and export",
+                          LATENCY_BUCKETS),
+    "tts_stage_errors_total": ("counter", "Stages that ended with an exception", None),
+    "tts_time_to_audio_seconds": ("histogram", "Time from a request to the first audio being played or sent",
+                                  LATENCY_BUCKETS),
+    "tts_synthesis_chars_per_second": ("histogram", "Characters synthesized per second by the engine",
+                                       CHARS_PER_SECOND_BUCKETS),
+    "tts_synthesis_realtime_factor": ("histogram", "Engine seconds per second of audio (below 1 is faster "
+                                      "than realtime)", REALTIME_FACTOR_BUCKETS),
+    "tts_synthesized_chars_total": ("counter", "Characters sent to the engine", None),
+    "tts_cache_requests_total": ("counter", "Synthesis cache lookups, by result (hit or miss)", None),
+    "tts_queue_depth": ("gauge", "Jobs or sentences waiting to be synthesized", None),
+    "tts_queue_wait_seconds": ("histogram", "Time a job waited in the queue before it started", LATENCY_BUCKETS),
+    "tts_errors_total": ("counter", "Errors reported to the user, by where they happened", None),
+    "tts_scratch_bytes": ("gauge", "Bytes used by this process's scratch files", None),
+}
+
+enabled = False
+metrics_file = None
+trace = None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Current value of every metric, per set of labels"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda item: item[0])
+            lines = []
+            described = set()
+            for (name, labels), value in items:
+                kind, help_text, _ = METRICS[name]
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {value:g}")
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(value.buckets + ("+Inf",), value.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value.sum:g}")
+                lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+
+
+class Span:
+    """Times a block of code into tts_stage_seconds and the trace; elapsed is set on exit"""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.started
+        registry.observe("tts_stage_seconds", self.elapsed, stage=self.name, **self.labels)
+        if exc_type is not None:
+            registry.count("tts_stage_errors_total", stage=self.name, **self.labels)
+        if trace is not None:
+            trace.write(self.name, self.started, self.elapsed, self.labels)
+        return False
+
+
+class NullSpan:
+    elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name, **labels):
+    """Context manager timing one stage, e.g. with span("decode"): ..."""
+    return Span(name, labels) if enabled else NULL_SPAN
+
+
+def count(name, value=1, **labels):
+    if enabled:
+        registry.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if enabled:
+        registry.observe(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    if enabled:
+        registry.set(name, value, **labels)
+
+
+class TraceWriter:
+    """Appends complete ("X") events in the Chrome trace event format
+
+    The file is a JSON array whose closing bracket is optional in that
+    format, so events can be appended by several processes and an
+    interrupted run still loads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+        self.origin = time.perf_counter() - time.time()
+        if self.file.tell() == 0:
+            self.file.write("[\n")
+
+    def write(self, name, started, elapsed, labels):
+        # Wall-clock microseconds, so events from separate processes line up
+        event = {"name": name, "ph": "X", "ts": round((started - self.origin) * 1e6),
+                 "dur": round(elapsed * 1e6), "pid": os.getpid(), "tid": threading.get_ident(), "args": labels}
+        line = json.dumps(event) + ",\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def write_metrics(path=None):
+    """Write the Prometheus text to path (default: the configured file), atomically"""
+    path = path or metrics_file
+    if path is None:
+        return None
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(partial, path)
+    return path
+
+
+def _write_periodically():
+    while True:
+        time.sleep(WRITE_INTERVAL)
+        try:
+            write_metrics()
+        except OSError:
+            pass
+
+
+def configure(metrics_path=None, trace_path=None, collect=False, environment=True):
+    """Start collecting; paths not given are taken from the environment
+
+    collect=True enables collection without any file, for callers that
+    expose the metrics themselves. environment=False ignores the
+    environment variables, e.g. in worker processes that must not
+    overwrite their parent's file. Returns whether collection is on.
+    """
+    global enabled, metrics_file, trace
+    if environment:
+        metrics_path = metrics_path or os.environ.get(METRICS_FILE_ENV)
+        trace_path = trace_path or os.environ.get(TRACE_FILE_ENV)
+    if trace_path and trace is None:
+        trace = TraceWriter(trace_path)
+    if metrics_path and metrics_file is None:
+        metrics_file = metrics_path
+        threading.Thread(target=_write_periodically, daemon=True).start()
+        atexit.register(write_metrics)
+    enabled = enabled or collect or bool(metrics_path or trace_path)
+    return enabled
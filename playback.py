@@ -0,0 +1,413 @@
+import importlib.util
+import os
+import threading
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from audio_effects import to_float
+
+# Force an audio sink with TTS_AUDIO_SINK=sounddevice, pygame or null
+SINK_ENV = "TTS_AUDIO_SINK"
+
+
+class NullSink:
+    """Pulls audio at the pace a sound card would and discards it; for headless machines and tests"""
+
+    def __init__(self, realtime=True):
+        self.realtime = realtime
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def open(self, sample_rate, channels, block_frames, callback):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.callback = callback
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        out = np.zeros((self.block_frames, self.channels), dtype=np.float32)
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            self.callback(out)
+            if self.realtime:
+                deadline += self.block_frames / self.sample_rate
+                self.stopped.wait(max(0.0, deadline - time.monotonic()))
+
+
+class SoundDeviceSink:
+    """PortAudio output stream through the optional sounddevice package"""
+
+    def open(self, sample_rate, channels, block_frames, callback):
+        import sounddevice
+        self.stream = sounddevice.OutputStream(
+            samplerate=sample_rate, channels=channels, dtype="float32", blocksize=block_frames,
+            latency="low", callback=lambda outdata, frames, time_info, status: callback(outdata))
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def close(self):
+        self.stream.close()
+
+
+class PygameSink:
+    """SDL2 audio device through pygame, which is installed with the app anyway"""
+
+    def open(self, sample_rate, channels, block_frames, callback):
+        import pygame
+        from pygame._sdl2 import audio
+        pygame.init()
+
+        def fill(device, stream):
+            callback(np.frombuffer(stream, dtype=np.float32).reshape(-1, channels))
+
+        self.device = audio.AudioDevice(devicename=None, iscapture=False, frequency=sample_rate,
+                                        audioformat=audio.AUDIO_F32, numchannels=channels,
+                                        chunksize=block_frames, allowed_changes=0, callback=fill)
+
+    def start(self):
+        self.device.pause(0)
+
+    def stop(self):
+        self.device.pause(1)
+
+    def close(self):
+        self.device.close()
+
+
+SINKS = {"sounddevice": SoundDeviceSink, "pygame": PygameSink, "null": NullSink}
+
+
+def default_sink():
+    """sounddevice if installed, else pygame, else the null sink"""
+    name = os.environ.get(SINK_ENV)
+    if name:
+        return SINKS[name]()
+    for name in ("sounddevice", "pygame"):
+        if importlib.util.find_spec(name) is not None:
+            return SINKS[name]()
+    return NullSink()
+
+
+class RingBuffer:
+    """Fixed-size FIFO of sample frames between the feeder thread and the audio callback"""
+
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype=np.float32)
+        self.read_count = 0
+        self.write_count = 0
+
+    def available(self):
+        return self.write_count - self.read_count
+
+    def space(self):
+        return len(self.data) - self.available()
+
+    def write(self, block):
+        """Copy as much of block as fits; returns the number of frames written"""
+        count = min(len(block), self.space())
+        start = self.write_count % len(self.data)
+        first = min(count, len(self.data) - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:count - first] = block[first:count]
+        self.write_count += count
+        return count
+
+    def read(self, out):
+        """Fill out with the oldest frames, padding with silence; returns the frames read"""
+        count = min(len(out), self.available())
+        start = self.read_count % len(self.data)
+        first = min(count, len(self.data) - start)
+        out[:first] = self.data[start:start + first]
+        out[first:count] = self.data[:count - first]
+        out[count:] = 0
+        self.read_count += count
+        return count
+
+    def clear(self):
+        self.read_count = self.write_count
+
+
+class Player:
+    """Plays AudioBuffers from memory through a callback-driven audio sink
+
+    A feeder thread copies samples into a small ring buffer that the sink's
+    callback drains, so the callback never waits on anything slow. The
+    playhead counts the frames the callback has output, which makes seeking
+    and position reports sample accurate. Buffers can be appended while
+    playing, for streamed synthesis; each loaded or appended buffer can be
+    split into segments (sentences) to seek to.
+
+    Events run on the feeder thread: on_position(seconds) every
+    position_interval while playing, on_segment(index, count) when the
+    playhead enters another segment and on_finished() at the end.
+    """
+
+    def __init__(self, sink=None, block_frames=512, ring_blocks=8, on_position=None, on_segment=None,
+                 on_finished=None, position_interval=0.05):
+        self.sink = sink or default_sink()
+        self.block_frames = block_frames
+        self.ring_blocks = ring_blocks
+        self.on_position = on_position
+        self.on_segment = on_segment
+        self.on_finished = on_finished
+        self.position_interval = position_interval
+
+        # Guards all state below; notified whenever the callback consumes audio
+        self.condition = threading.Condition()
+        self.format = None
+        self.ring = None
+        self.sources = []
+        self.ends = []
+        self.segment_starts = [0]
+        self.complete = True
+        self.feed_position = 0
+        self.playhead = 0
+        self.state = "stopped"
+        self.sink_running = False
+        self.closed = False
+        self.last_report = 0.0
+        self.reported_segment = None
+
+        threading.Thread(target=self._feed, daemon=True).start()
+
+    # Loading audio
+
+    def load(self, buffer, segment_starts=None):
+        """Replace the audio with a buffer; segment_starts are in seconds"""
+        self.open_stream()
+        self.append(buffer, segment_starts)
+        self.end_stream()
+
+    def open_stream(self):
+        """Stop and clear, ready for buffers to be appended"""
+        self.stop()
+        with self.condition:
+            self.sources, self.ends, self.segment_starts = [], [], []
+            self.complete = False
+
+    def append(self, buffer, segment_starts=None):
+        """Add a buffer after the current audio, as one segment unless segment_starts are given"""
+        # An empty buffer (a chunk with nothing to say) must not reopen the sink
+        if len(buffer.samples) or self.format is None:
+            self._configure(buffer.sample_rate, buffer.channels)
+        with self.condition:
+            start = self.total
+            self.sources.append(to_float(buffer.samples))
+            self.ends.append(start + len(buffer.samples))
+            for seconds in segment_starts or [0.0]:
+                self.segment_starts.append(start + int(seconds * buffer.sample_rate))
+            self.condition.notify_all()
+
+    def end_stream(self):
+        """No more buffers will be appended; playback finishes at the end of the last one"""
+        with self.condition:
+            self.complete = True
+            if not self.segment_starts:
+                self.segment_starts = [0]
+            self.condition.notify_all()
+
+    def _configure(self, sample_rate, channels):
+        # The sink is reopened only when the audio format changes
+        if self.format == (sample_rate, channels):
+            return
+        self._stop_sink()
+        if self.format is not None:
+            self.sink.close()
+        self.sink.open(sample_rate, channels, self.block_frames, self._callback)
+        with self.condition:
+            self.format = (sample_rate, channels)
+            self.ring = RingBuffer(self.block_frames * self.ring_blocks, channels)
+
+    # Transport
+
+    def play(self):
+        with self.condition:
+            if not self.sources:
+                return
+            if self.complete and self.playhead >= self.total:
+                self._seek_frame(0)
+            self.state = "playing"
+            self.reported_segment = None
+            self.condition.notify_all()
+        if not self.sink_running:
+            self.sink.start()
+            self.sink_running = True
+
+    def pause(self):
+        with self.condition:
+            if self.state == "playing":
+                self.state = "paused"
+
+    def resume(self):
+        with self.condition:
+            if self.state == "paused":
+                self.state = "playing"
+                self.condition.notify_all()
+
+    def stop(self):
+        """Stop and rewind; on_finished is not called"""
+        with self.condition:
+            self.state = "stopped"
+            self._seek_frame(0)
+        self._stop_sink()
+
+    def seek(self, seconds):
+        with self.condition:
+            if self.format is not None:
+                self._seek_frame(int(seconds * self.format[0]))
+                self.reported_segment = None
+
+    def seek_segment(self, index):
+        with self.condition:
+            index = min(max(0, index), len(self.segment_starts) - 1)
+            self._seek_frame(self.segment_starts[index])
+            self.reported_segment = None
+
+    def _seek_frame(self, frame):
+        self.playhead = self.feed_position = min(max(0, frame), self.total)
+        if self.ring is not None:
+            self.ring.clear()
+        self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self._stop_sink()
+        if self.format is not None:
+            self.sink.close()
+
+    def _stop_sink(self):
+        # Outside the lock: stopping waits for a running callback, which takes the lock
+        if self.sink_running:
+            self.sink.stop()
+            self.sink_running = False
+
+    def wait_for(self, predicate, timeout=None):
+        """Block until predicate() is true, re-checked whenever the playhead moves"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.closed or predicate(), timeout)
+
+    def read(self, start, end):
+        """Float samples (frames, channels) of the loaded audio between two frames, e.g. for meters"""
+        with self.condition:
+            channels = self.format[1] if self.format else 1
+            start, end = max(0, start), min(end, self.total)
+            parts = []
+            index = bisect_right(self.ends, start)
+            while start < end and index < len(self.sources):
+                offset = start - (self.ends[index - 1] if index else 0)
+                part = self.sources[index][offset:offset + end - start]
+                parts.append(part)
+                start += len(part)
+                index += 1
+        return np.concatenate(parts) if parts else np.zeros((0, channels), dtype=np.float32)
+
+    # State
+
+    @property
+    def total(self):
+        return self.ends[-1] if self.ends else 0
+
+    @property
+    def position(self):
+        return self.playhead / self.format[0] if self.format else 0.0
+
+    @property
+    def sample_rate(self):
+        return self.format[0] if self.format else None
+
+    @property
+    def duration(self):
+        return self.total / self.format[0] if self.format else 0.0
+
+    @property
+    def current_segment(self):
+        return max(0, bisect_right(self.segment_starts, self.playhead) - 1)
+
+    @property
+    def is_playing(self):
+        return self.state == "playing"
+
+    @property
+    def is_paused(self):
+        return self.state == "paused"
+
+    # Threads
+
+    def _callback(self, out):
+        """Called by the sink for every block of output"""
+        with self.condition:
+            if self.state != "playing" or self.ring is None:
+                out.fill(0)
+                return
+            # Top up here too if the feeder fell behind; it is only a copy from memory
+            if self.ring.available() < len(out):
+                self._fill()
+            self.playhead += self.ring.read(out)
+            self.condition.notify_all()
+
+    def _feed(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.position_interval if self.state == "playing" else None)
+                if self.closed:
+                    return
+                if self.state == "playing":
+                    self._fill()
+                events = self._events()
+            for event, args in events:
+                event(*args)
+
+    def _fill(self):
+        # Top up the ring from the sources, one source at a time
+        while self.ring.space() and self.feed_position < self.total:
+            index = bisect_right(self.ends, self.feed_position)
+            offset = self.feed_position - (self.ends[index - 1] if index else 0)
+            block = self.sources[index][offset:offset + self.ring.space()]
+            self.feed_position += self.ring.write(block)
+
+    def _events(self):
+        events = []
+        if self.state != "playing":
+            return events
+        now = time.monotonic()
+        if self.on_position is not None and now - self.last_report >= self.position_interval:
+            self.last_report = now
+            events.append((self.on_position, (self.position,)))
+        segment = self.current_segment
+        if segment != self.reported_segment and self.on_segment is not None:
+            events.append((self.on_segment, (segment, len(self.segment_starts))))
+        self.reported_segment = segment
+        if self.complete and self.playhead >= self.total:
+            self.state = "stopped"
+            events.append((self._finished, ()))
+        return events
+
+    def _finished(self):
+        with self.condition:
+            restarted = self.state != "stopped"
+        if not restarted:
+            self._stop_sink()
+        if self.on_finished is not None:
+            self.on_finished()
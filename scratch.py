@@ -0,0 +1,287 @@
+"""Scratch files for rendered audio and export chunks, kept within a size and age budget.
+
+Each process works in its own session directory under the scratch root
+(TTS_SCRATCH_DIR, default <temp dir>/text_to_speech). Session directories
+left behind by runs that crashed or were killed are deleted when the next
+ScratchArea starts.
+
+Files that are memory-mapped by an AudioBuffer are reference counted
+(refs.hold()), so a file is only deleted once no array uses it any more,
+and the cache and the scratch budget never delete audio that is playing or
+being exported.
+"""
+import atexit
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import metrics
+
+DEFAULT_SCRATCH_DIR = os.path.join(tempfile.gettempdir(), "text_to_speech")
+DEFAULT_MAX_MB = 200
+DEFAULT_MAX_AGE = 3600
+
+SESSION_PREFIX = "session-"
+HEARTBEAT_FILE = ".alive"
+HEARTBEAT_INTERVAL = 60
+
+# Where the owner's process can't be checked (Windows), a session is
+# abandoned once its heartbeat stops; elsewhere only after a day, in case
+# the pid was reused
+STALE_AFTER = 10 * 60
+STALE_AFTER_PID_CHECK = 24 * 3600
+
+
+def path_size(path):
+    """Bytes used by a file, or by everything under a directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def delete_path(path):
+    """Delete a file or directory tree; returns False if it is still locked (Windows)"""
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+class FileRefs:
+    """Reference counts of files in use, so they are deleted only when the last user is done"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.doomed = set()
+
+    def acquire(self, path):
+        with self.lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def release(self, path):
+        with self.lock:
+            count = self.counts.get(path, 0) - 1
+            if count > 0:
+                self.counts[path] = count
+                return
+            self.counts.pop(path, None)
+            if path not in self.doomed:
+                return
+            self.doomed.discard(path)
+        delete_path(path)
+
+    def in_use(self, path):
+        with self.lock:
+            return path in self.counts
+
+    def remove_when_unused(self, path):
+        """Delete path now, or when it is released if it is in use; returns True if deleted now"""
+        with self.lock:
+            if path in self.counts:
+                self.doomed.add(path)
+                return False
+        return delete_path(path)
+
+    def hold(self, samples, path):
+        """Keep path in use for as long as the memory-mapped samples (or any view of them) exist"""
+        # Views share the innermost base, the mmap, so that is what is watched
+        base = samples
+        while getattr(base, "base", None) is not None:
+            base = base.base
+        if not isinstance(base, mmap.mmap):
+            return samples  # Read into memory; the file isn't needed
+        self.acquire(path)
+        weakref.finalize(base, self.release, path)
+        return samples
+
+
+refs = FileRefs()
+
+
+def session_alive(session_dir, now):
+    """Whether the run that owns a session directory is still going"""
+    try:
+        heartbeat = os.path.getmtime(os.path.join(session_dir, HEARTBEAT_FILE))
+    except OSError:
+        heartbeat = os.path.getmtime(session_dir)
+    pid = os.path.basename(session_dir)[len(SESSION_PREFIX):].split("-", 1)[0]
+    if os.name != "posix" or not pid.isdigit():
+        return now - heartbeat < STALE_AFTER
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists but belongs to another user
+    return now - heartbeat < STALE_AFTER_PID_CHECK
+
+
+class ScratchArea:
+    """This process's scratch directory, with a size cap and an age limit
+
+    new_file() and new_dir() hand out paths in the session directory;
+    temporary_file() also deletes the file afterwards unless a buffer still
+    maps it. reclaim() runs on every new path and once a minute, deleting
+    unused entries older than max_age and then the oldest ones until the
+    total fits max_bytes, so a long session stays within the budget even if
+    something forgets to clean up.
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_age=None):
+        # Both limits can be overridden from the environment
+        if root is None:
+            root = os.environ.get("TTS_SCRATCH_DIR", DEFAULT_SCRATCH_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("TTS_SCRATCH_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = DEFAULT_MAX_AGE if max_age is None else max_age
+        self.lock = threading.Lock()
+        self.entries = {}  # path -> creation time
+        self.closed = threading.Event()
+
+        os.makedirs(root, exist_ok=True)
+        self.swept = self.sweep_orphans()
+        self.session_dir = tempfile.mkdtemp(prefix=f"{SESSION_PREFIX}{os.getpid()}-", dir=root)
+        self.touch()
+
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        atexit.register(self.close)
+
+    def sweep_orphans(self):
+        """Delete session directories of runs that are no longer alive; returns how many"""
+        now = time.time()
+        swept = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith(SESSION_PREFIX) and not session_alive(path, now):
+                    swept += delete_path(path)
+            except OSError:
+                pass  # Removed by another process meanwhile
+        return swept
+
+    def touch(self):
+        # Recreated if another run swept this session while the machine was asleep
+        os.makedirs(self.session_dir, exist_ok=True)
+        with open(os.path.join(self.session_dir, HEARTBEAT_FILE), "w"):
+            pass
+
+    def new_file(self, suffix="", prefix=""):
+        """Path of a new empty file; delete it with discard() when done"""
+        self.reclaim()
+        try:
+            fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.session_dir)
+        except FileNotFoundError:
+            self.touch()
+            fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.session_dir)
+        os.close(fd)
+        with self.lock:
+            self.entries[path] = time.time()
+        return path
+
+    def new_dir(self, prefix=""):
+        """Path of a new empty directory; delete it with discard() when done"""
+        self.reclaim()
+        try:
+            path = tempfile.mkdtemp(prefix=prefix, dir=self.session_dir)
+        except FileNotFoundError:
+            self.touch()
+            path = tempfile.mkdtemp(prefix=prefix, dir=self.session_dir)
+        with self.lock:
+            self.entries[path] = time.time()
+        return path
+
+    @contextmanager
+    def temporary_file(self, suffix="", prefix=""):
+        """A new file for the duration of a with block
+
+        The file is in use (and safe from reclaim) inside the block, and is
+        deleted after it, or later if a buffer still maps it.
+        """
+        path = self.new_file(suffix, prefix)
+        refs.acquire(path)
+        try:
+            yield path
+        finally:
+            refs.release(path)
+            self.discard(path)
+
+    def discard(self, path):
+        """Delete a file or directory from this area, as soon as nothing uses it"""
+        with self.lock:
+            self.entries.pop(path, None)
+        refs.remove_when_unused(path)
+
+    def reclaim(self):
+        """Delete unused entries that are too old or don't fit the size budget"""
+        now = time.time()
+        with self.lock:
+            entries = sorted(self.entries.items(), key=lambda entry: entry[1])
+        sizes = {}
+        for path, _ in entries:
+            try:
+                sizes[path] = path_size(path)
+            except OSError:
+                sizes[path] = 0
+        total = sum(sizes.values())
+
+        # Oldest first: past their age, or until the rest fits
+        for path, created in entries:
+            if now - created <= self.max_age and total <= self.max_bytes:
+                break
+            if refs.in_use(path):
+                continue
+            with self.lock:
+                self.entries.pop(path, None)
+            if delete_path(path):
+                total -= sizes[path]
+        metrics.set_gauge("tts_scratch_bytes", total)
+        return total
+
+    def close(self):
+        """Delete the session directory; files still mapped are left for the next sweep"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        shutil.rmtree(self.session_dir, ignore_errors=True)
+
+    def _heartbeat(self):
+        while not self.closed.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.touch()
+                self.reclaim()
+            except OSError:
+                pass
+
+
+_default_area = None
+_default_lock = threading.Lock()
+
+
+def default_area():
+    """The process-wide ScratchArea, created (and orphans swept) on first use"""
+    global _default_area
+    with _default_lock:
+        if _default_area is None:
+            _default_area = ScratchArea()
+        return _default_area
@@ -0,0 +1,66 @@
+from difflib import SequenceMatcher
+
+from text_processing import split_into_chunks
+from timing import TimingIndex
+
+
+class SegmentTimeline:
+    """A document as sentence-sized segments with the audio rendered for each
+
+    update() diffs new text against the segments rendered last time and
+    synthesizes only the ones that changed; the audio of the others is kept
+    and the timeline is spliced back together in document order. Audio is at
+    the engine's normal speed and pitch, so effects apply to the whole; each
+    segment already ends with the pause between sentences. Loudness is still
+    normalized per segment (see TTSBackend.apply_effects), like every other path.
+    """
+
+    def __init__(self, backend_name, voice_type, pause_ms=0):
+        self.backend_name = backend_name
+        self.voice_type = voice_type
+        self.pause_ms = pause_ms
+        self.text = None
+        self.segments = []
+        self.buffers = []
+        self.audio = None
+
+    def matches(self, backend_name, voice_type, pause_ms=0):
+        return (self.backend_name, self.voice_type, self.pause_ms) == (backend_name, voice_type, pause_ms)
+
+    def update(self, text, synthesize_batch):
+        """Bring the timeline up to date with text; returns how many segments were synthesized
+
+        synthesize_batch(list_of_texts) must return an AudioBuffer for each.
+        """
+        if text == self.text:
+            return 0
+        segments = split_into_chunks(text)
+
+        # Unchanged runs keep their audio; inserted and replaced runs are rendered again
+        buffers = []
+        changed = []
+        matcher = SequenceMatcher(None, self.segments, segments, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                buffers.extend(self.buffers[i1:i2])
+            else:
+                changed.extend(range(j1, j2))
+                buffers.extend([None] * (j2 - j1))
+
+        if changed:
+            for index, buffer in zip(changed, synthesize_batch([segments[i] for i in changed])):
+                buffers[index] = buffer
+
+        self.text, self.segments, self.buffers = text, segments, buffers
+        self.audio = self.splice()
+        return len(changed)
+
+    def splice(self):
+        """Join the segment buffers into one AudioBuffer"""
+        if not self.buffers:
+            return None
+        return self.buffers[0].concatenate(self.buffers)
+
+    def timing_index(self, speed=1.0):
+        """Sentence and word times of the timeline, played back at speed"""
+        return TimingIndex.build(self.text, self.segments, self.buffers, speed)
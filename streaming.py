@@ -0,0 +1,57 @@
+import threading
+
+
+class ChunkStreamer:
+    """Synthesize text chunks on a background thread and append them to a Player as they are ready
+
+    Playback starts as soon as the first chunk is synthesized, and the player
+    plays the chunks back to back from its ring buffer, so there is no gap
+    between them. The player's own events report progress and the end of
+    playback; on_error(exception) is called if synthesis fails.
+    """
+
+    def __init__(self, synthesize, chunks, player, on_error=None, lookahead=3):
+        # synthesize(text) must return an AudioBuffer for that text
+        self.synthesize = synthesize
+        self.chunks = list(chunks)
+        self.player = player
+        self.on_error = on_error
+
+        # The producer only runs this many chunks ahead of playback
+        self.lookahead = lookahead
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Start synthesizing; each chunk becomes one segment of the player"""
+        self.player.open_stream()
+        threading.Thread(target=self._produce, daemon=True).start()
+
+    def stop(self):
+        """Stop synthesis and playback as soon as possible"""
+        self.stopped.set()
+        self.player.stop()
+
+    def _produce(self):
+        """Synthesize chunks in order and append them to the player"""
+        for index, chunk in enumerate(self.chunks):
+            self.player.wait_for(lambda: self.stopped.is_set()
+                                 or index - self.player.current_segment <= self.lookahead)
+            if self.stopped.is_set():
+                return
+            try:
+                buffer = self.synthesize(chunk)
+            except Exception as e:
+                if not self.stopped.is_set():
+                    self.player.stop()
+                    if self.on_error is not None:
+                        self.on_error(e)
+                return
+            if self.stopped.is_set():
+                return
+
+            self.player.append(buffer)
+            if index == 0:
+                self.player.play()
+
+        # Playback finishes once the last chunk has played
+        self.player.end_stream()
@@ -0,0 +1,172 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+
+import metrics
+
+# Job priorities; lower numbers run first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class SynthesisJob:
+    """A queued unit of work for the synthesis worker
+
+    task(synthesizer, job) runs on the worker thread. Long tasks should call
+    job.report_progress() and check job.cancelled between steps.
+    """
+
+    def __init__(self, task, priority, on_done=None, on_error=None, on_progress=None):
+        self.task = task
+        self.priority = priority
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.future = Future()
+        self.worker = None
+        self.submitted = time.perf_counter()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Cancel the job; a running job stops at its next checkpoint"""
+        self._cancelled.set()
+        self.future.cancel()
+
+    def report_progress(self, message):
+        if self.on_progress is not None:
+            self.worker.dispatch(self.on_progress, message)
+
+    def result(self, timeout=None):
+        """Block until the job finishes and return its result"""
+        return self.future.result(timeout)
+
+
+class SynthesisWorker:
+    """Long-lived thread that owns the synthesizer and runs queued jobs by priority"""
+
+    def __init__(self, synthesizer_factory, root=None, max_jobs=32):
+        # The synthesizer is created on the worker thread, since engines such
+        # as pyttsx3 must be used from the thread that initialized them
+        self.synthesizer_factory = synthesizer_factory
+        self.synthesizer = None
+        self.root = root
+        self.jobs = queue.PriorityQueue(maxsize=max_jobs)
+        self.sequence = itertools.count()  # Keeps FIFO order within a priority
+        self.current_job = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+
+        # Set if the synthesizer couldn't be created; every job then fails with it
+        self.failure = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def dispatch(self, callback, *args):
+        """Run a callback on the Tk thread, or directly when running headless"""
+        if self.root is not None:
+            self.root.after(0, lambda: callback(*args))
+        else:
+            callback(*args)
+
+    def submit(self, task, priority=BACKGROUND, on_done=None, on_error=None, on_progress=None,
+               block=False):
+        """Queue a job; raises queue.Full if the queue is full and block is False"""
+        job = SynthesisJob(task, priority, on_done, on_error, on_progress)
+        job.worker = self
+        self.jobs.put((priority, next(self.sequence), job), block=block)
+        metrics.set_gauge("tts_queue_depth", self.queue_depth(), queue="worker")
+
+        # Nothing will run it; checked after queuing so a job can't slip in unnoticed
+        if self.failure is not None or self.stopped.is_set():
+            self._drain()
+        return job
+
+    def queue_depth(self):
+        return self.jobs.qsize()
+
+    def cancel_all(self, priority=None):
+        """Cancel queued and running jobs, optionally only those of one priority"""
+        with self.lock:
+            pending = list(self.jobs.queue)
+            running = self.current_job
+        for _, _, job in pending:
+            if priority is None or job.priority == priority:
+                job.cancel()
+        if running is not None and (priority is None or running.priority == priority):
+            running.cancel()
+
+    def stop(self):
+        """Cancel everything and let the worker thread exit"""
+        self.stopped.set()
+        self.cancel_all()
+        try:
+            # Wakes the worker if it is idle; if the queue is full it is busy and sees the flag next
+            self.jobs.put_nowait((-1, next(self.sequence), None))
+        except queue.Full:
+            pass
+
+    def _drain(self):
+        """Fail (or cancel, once stopped) every queued job"""
+        while True:
+            try:
+                _, _, job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is None or not job.future.set_running_or_notify_cancel():
+                continue
+            error = self.failure if self.failure is not None else CancelledError()
+            job.future.set_exception(error)
+            if job.on_error is not None and not isinstance(error, CancelledError):
+                self.dispatch(job.on_error, error)
+
+    def _run(self):
+        try:
+            self.synthesizer = self.synthesizer_factory()
+        except BaseException as e:
+            self.failure = e
+            self.ready.set()
+            self._drain()
+            return
+        self.ready.set()
+
+        while True:
+            _, _, job = self.jobs.get()
+            if job is None or self.stopped.is_set():
+                if job is not None:
+                    job.cancel()
+                break
+            metrics.set_gauge("tts_queue_depth", self.queue_depth(), queue="worker")
+            if not job.future.set_running_or_notify_cancel():
+                continue  # Cancelled while still queued
+            metrics.observe("tts_queue_wait_seconds", time.perf_counter() - job.submitted,
+                            priority=job.priority)
+
+            with self.lock:
+                self.current_job = job
+            try:
+                with metrics.span("job", priority=job.priority):
+                    result = job.task(self.synthesizer, job)
+                if job.cancelled:
+                    raise CancelledError()
+            except BaseException as e:
+                job.future.set_exception(e)
+                if job.on_error is not None and not isinstance(e, CancelledError):
+                    self.dispatch(job.on_error, e)
+            else:
+                job.future.set_result(result)
+                if job.on_done is not None:
+                    self.dispatch(job.on_done, result)
+            finally:
+                with self.lock:
+                    self.current_job = None
+        self._drain()
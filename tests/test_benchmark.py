@@ -0,0 +1,52 @@
+"""Quick runs of the cheaper benchmarks, with limits loose enough for slow CI machines
+
+The full suite and the comparison with benchmark_baseline.json run with
+python benchmark.py; these only catch slowdowns of ten times or more.
+"""
+import json
+
+import pytest
+
+import benchmark
+
+
+@pytest.fixture(autouse=True)
+def no_lexicon(monkeypatch, tmp_path):
+    monkeypatch.setenv("TTS_LEXICON", str(tmp_path / "missing.txt"))
+
+
+def test_normalization_throughput():
+    results = {}
+    benchmark.bench_normalization(results, 50000)
+    mixed = results["normalization_mixed_throughput"][0]
+    plain = results["normalization_plain_throughput"][0]
+    assert mixed > 0.1
+    # Text full of numbers is slower, but not by an order of magnitude more than now
+    assert mixed > plain / 30
+
+
+def test_disabled_metrics_cost_next_to_nothing():
+    results = {}
+    benchmark.bench_metrics_overhead(results, calls=20000)
+    assert results["metrics_disabled_span_overhead"][0] < 10000  # ns per span
+
+
+def test_effects_run_much_faster_than_real_time():
+    results = {}
+    benchmark.bench_effects(results, 10)
+    benchmark.bench_postprocess(results, 10)
+    for name, (value, unit, _) in results.items():
+        assert value > 10, name
+
+
+def test_compare_flags_only_regressions_beyond_the_tolerance():
+    baseline = {"fast": {"value": 10.0}, "slow": {"value": 1.0}}
+    results = {"fast": (7.0, "MB/s", True), "slow": (1.1, "s", False), "new": (5.0, "s", False)}
+    assert benchmark.compare(results, baseline, 0.2) == ["fast"]
+
+
+def test_baseline_is_committed():
+    with open(benchmark.DEFAULT_BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    for name in ("normalization_mixed_throughput", "synthesis_throughput", "effects_speed_realtime_factor"):
+        assert set(baseline[name]) == {"value", "unit", "higher_is_better"}
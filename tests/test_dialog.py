@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from backends import BACKENDS, FakeBackend
+from dialog import ScriptRenderer, is_script, parse_script
+
+
+def parse(text, **settings):
+    return parse_script(text, dict(voice_type="Female", **settings), engine="fake")
+
+
+def test_tags_switch_speakers():
+    text = "[Alice] Hello?\n[Bob] It's me.\n[Alice] Where are you?"
+    segments = parse(text)
+    assert [s["speaker"] for s in segments] == ["Alice", "Bob", "Alice"]
+    assert [s["text"].strip() for s in segments] == ["Hello?", "It's me.", "Where are you?"]
+    assert all(text[s["start"]:s["end"]] == s["text"] for s in segments)
+
+
+def test_text_before_the_first_tag_is_narrated():
+    segments = parse("Once upon a time.\n[Alice] Hi.")
+    assert segments[0]["speaker"] is None
+    assert segments[0]["text"].strip() == "Once upon a time."
+
+
+def test_brackets_inside_a_line_are_text():
+    segments = parse("[Alice] That was [laughs] funny.\n[Bob] He wrote teh [sic] twice.")
+    assert [s["speaker"] for s in segments] == ["Alice", "Bob"]
+    assert "[laughs]" in segments[0]["text"]
+    assert "[sic]" in segments[1]["text"]
+
+
+def test_markdown_links_are_not_tags():
+    segments = parse("[Alice] Hi.\n[the docs](https://example.com) say so.")
+    assert len(segments) == 1
+    assert "[the docs]" in segments[0]["text"]
+
+
+def test_is_script():
+    assert is_script("[Alice] Hi.\n[Bob] Hello.")
+    assert is_script("[Narrator voice=Male] It was late.")
+    assert not is_script("[x] done\nmore text")
+    assert not is_script("[Alice] Hi.\n[alice] Again.")
+    assert not is_script("She said [laughs] and [Bob] left.")
+    assert not is_script("[Alice] Hi.\n[pause 500ms]\nBye.")
+    assert not is_script("Plain text without tags.")
+
+
+def test_pauses_add_to_the_previous_segment():
+    segments = parse("[Alice] Hi.\n[pause 500ms]\n[pause 1.5s]\n[Bob] Hello.")
+    assert [s["gap_ms"] for s in segments] == [2000, 0]
+    assert parse("[pause 300]\n[Alice] Hi.\n[Bob] Yo.")[0]["gap_ms"] == 300
+
+
+def test_voices_are_assigned_in_turn():
+    segments = parse("[Alice] Hi.\n[Bob] Hello.\n[Carol] Hey.\n[Male] Yes.")
+    assert [s["settings"]["voice_type"] for s in segments] == ["Female", "Male", "Female", "Male"]
+
+
+def test_tag_settings_stay_with_the_speaker():
+    segments = parse("[Bob voice=Robotic rate=300 pitch=80% pause=1s engine=fake] One.\n"
+                     "[Alice] Two.\n[Bob] Three.")
+    bob = segments[2]
+    assert bob["settings"]["voice_type"] == "Robotic"
+    assert bob["settings"]["rate"] == 200
+    assert bob["settings"]["pitch"] == 80
+    assert bob["settings"]["pause_ms"] == 1000
+    assert bob["engine"] == "fake"
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[Alice voice=Child] Hi.", "voice must be"),
+    ("[Alice rate=fast] Hi.", "rate must be a percentage"),
+    ("[Alice engine=nope] Hi.", "unknown engine"),
+    ("[Alice mood=happy] Hi.", "unknown setting"),
+    ("[Alice] Hi.\n[pause soon]", "not a duration"),
+])
+def test_malformed_tags_are_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse(text)
+
+
+def test_errors_name_the_line():
+    with pytest.raises(ValueError, match="Line 3"):
+        parse("[Alice] Hi.\n[Bob] Hello.\n[Alice pitch=high] Bye.")
+
+
+class SingleThreadedBackend(FakeBackend):
+    """Fails like pyttsx3 when two threads render at once"""
+
+    name = "single-threaded"
+    thread_safe = False
+    running = threading.Lock()
+
+    def __init__(self, cache=None):
+        super().__init__(cache, synthesis_speed=200.0)
+
+    def synthesize_batch(self, requests, effects=True):
+        if not self.running.acquire(blocking=False):
+            raise RuntimeError("run loop already started")
+        try:
+            return super().synthesize_batch(requests, effects)
+        finally:
+            self.running.release()
+
+
+@pytest.fixture
+def single_threaded(monkeypatch):
+    monkeypatch.setitem(BACKENDS, SingleThreadedBackend.name, SingleThreadedBackend)
+    return SingleThreadedBackend.name
+
+
+SCRIPT = "[Alice] Hello there, who is this?\n[Bob] It's me, calling late.\n[Alice] Where are you now?"
+
+
+def test_voices_of_an_engine_that_isnt_thread_safe_share_one_worker(single_threaded):
+    renderer = ScriptRenderer()
+    try:
+        buffer, timing = renderer.render_script(SCRIPT, engine=single_threaded)
+        assert list(renderer.workers) == [(single_threaded, None)]
+    finally:
+        renderer.stop()
+    assert len(timing.sentences) == 3
+    assert len(buffer.samples)
+
+
+def test_the_callers_backend_renders_its_engine_itself(single_threaded):
+    renderer = ScriptRenderer()
+    backend = SingleThreadedBackend()
+    try:
+        # Busy on the caller's thread the whole time, as the app's worker would be
+        segments = parse_script(SCRIPT + "\n[Carol engine=fake] And me.", engine=single_threaded)
+        rendered = renderer.render(segments, backend=backend)
+        assert set(renderer.workers) == {("fake", "Female")}
+    finally:
+        renderer.stop()
+    assert [len(chunks) for chunks, _ in rendered] == [1, 1, 1, 1]
@@ -0,0 +1,39 @@
+import pytest
+
+from text_normalization import LexiconTrie, normalize
+from text_processing import split_into_chunks
+
+
+def speak(text, lexicon=None):
+    return normalize(text, lexicon or LexiconTrie())
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("See https://example.com/x. Next one.", "See link to example dot com. Next one."),
+    ("Go to www.example.com, then stop.", "Go to link to example dot com, then stop."),
+    ("(see https://example.org/a/b) and go", "(see link to example dot org) and go"),
+    ("Is it https://example.com?", "Is it link to example dot com?"),
+])
+def test_punctuation_after_a_url_is_kept(text, spoken):
+    assert speak(text) == spoken
+
+
+def test_a_url_at_a_sentence_end_still_ends_the_sentence():
+    assert split_into_chunks(speak("Read https://example.com/docs. Then try it.")) == [
+        "Read link to example dot com.", "Then try it."]
+
+
+@pytest.mark.parametrize("text, spoken", [
+    ("**bold** and *soft* words", "bold and soft words"),
+    ("2*3*4", "two*three*four"),
+    ("3M and 5 apples", "3M and five apples"),
+    ("call 555-1234", "call five five five, one two three four"),
+    ("123.4567", "one hundred twenty-three point four five six seven"),
+])
+def test_markup_and_numbers(text, spoken):
+    assert speak(text) == spoken
+
+
+def test_lexicon_sees_the_text_as_written():
+    lexicon = LexiconTrie({"3M": "three em", "Dr. Who": "Doctor Who"})
+    assert speak("3M met Dr.\nWho", lexicon) == "three em met Doctor Who"
@@ -0,0 +1,289 @@
+# Clean-up and expansion of text before synthesis. Every pattern is compiled
+# once at import; lexicons are compiled into one trie-shaped regex that is
+# cached until the lexicon file changes.
+import functools
+import html
+import os
+import re
+
+# Lines of "word = how to say it"; multi-word entries are allowed
+DEFAULT_LEXICON = os.path.join(os.path.expanduser("~"), ".config", "text_to_speech", "lexicon.txt")
+
+ABBREVIATIONS = {
+    "Mr.": "Mister", "Mrs.": "Missus", "Ms.": "Miz", "Dr.": "Doctor", "Prof.": "Professor",
+    "St.": "Saint", "Jr.": "Junior", "Sr.": "Senior", "Mt.": "Mount", "Ave.": "Avenue",
+    "vs.": "versus", "e.g.": "for example", "i.e.": "that is", "etc.": "et cetera",
+    "approx.": "approximately", "No.": "number", "Fig.": "figure", "Vol.": "volume",
+}
+
+# Abbreviations that are never the end of a sentence, used by the sentence splitter
+NON_FINAL_ABBREVIATIONS = {a for a in ABBREVIATIONS if a not in ("etc.",)}
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+          "October", "November", "December"]
+
+ONES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+        "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen",
+        "nineteen"]
+TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+SCALES = [(10 ** 12, "trillion"), (10 ** 9, "billion"), (10 ** 6, "million"), (1000, "thousand")]
+IRREGULAR_ORDINALS = {"one": "first", "two": "second", "three": "third", "five": "fifth",
+                      "eight": "eighth", "nine": "ninth", "twelve": "twelfth"}
+CURRENCIES = {"$": ("dollar", "cent"), "£": ("pound", "penny"), "€": ("euro", "cent")}
+
+HTML_TAG = re.compile(r'<[^<>]{1,200}>')
+MARKDOWN_LINK = re.compile(r'!?\[([^\]]*)\]\([^)\s]*\)')
+MARKDOWN_LINE = re.compile(r'(?m)^[ \t]{0,3}(?:#{1,6}|>|[-*+])[ \t]+')
+EMPHASIS = re.compile(r'(?<!\w)(\*\*|__|\*|`+|~~)(?=\S)(.+?)(?<=\S)\1(?!\w)')
+# Punctuation after a URL ends the sentence or clause, not the URL
+URL = re.compile(r'\b(?:https?://|www\.)([^\s/<>"]+)[^\s<>"]*(?<![.,;:!?)])')
+EMAIL = re.compile(r'\b([\w.+-]+)@([\w-]+(?:\.[\w-]+)+)\b')
+SYMBOL_RUN = re.compile(r'([^\w\s])\1{2,}')
+CONTROL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+WHITESPACE = re.compile(r'\s+')
+# Only whitespace that needs changing, so ordinary single spaces aren't rewritten
+EXTRA_WHITESPACE = re.compile(r'\s{2,}|[\t\n\r\f\v]')
+DIGIT = re.compile(r'\d')
+LAST_WORD = re.compile(r'[a-z]+$')
+
+ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+US_DATE = re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{4})\b')
+MONTH_DAY = re.compile(r'\b(' + '|'.join(MONTHS) + r') (\d{1,2})(?:st|nd|rd|th)?\b')
+# A dot alone only separates a full 3-3-4 number; 123.4567 is a decimal
+PHONE = re.compile(r'\b\d{3}(?:-\d{3,4}(?:[-.]\d{4})?|\.\d{3}\.\d{4})\b')
+VERSION = re.compile(r'\b\d+(?:\.\d+){2,}\b')
+CLOCK_TIME = re.compile(r'\b(\d{1,2}):(\d{2})\b(?::\d{2})?')
+CURRENCY = re.compile(r'([$£€])(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{2}))?\b')
+PERCENT = re.compile(r'(\d+(?:\.\d+)?) ?%')
+ORDINAL = re.compile(r'\b(\d+)(?:st|nd|rd|th)\b')
+YEAR = re.compile(r'(?<![\d.,-])(1[1-9]\d\d|20\d\d)(?![\d,]|\.\d)')
+NUMBER = re.compile(r'(?<![\w.])(-?)(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(?!\w)')
+ABBREVIATION = re.compile(r'(?<![\w.])(?:' + '|'.join(re.escape(a) for a in ABBREVIATIONS) + r')(?!\w)')
+
+
+def number_to_words(n):
+    """Spell out an integer, e.g. 1234 -> "one thousand two hundred thirty-four" """
+    if n < 0:
+        return "minus " + number_to_words(-n)
+    if n < 20:
+        return ONES[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return TENS[tens] + (f"-{ONES[ones]}" if ones else "")
+    if n < 1000:
+        hundreds, rest = divmod(n, 100)
+        return f"{ONES[hundreds]} hundred" + (f" {number_to_words(rest)}" if rest else "")
+    if n >= 10 ** 15:
+        return digits_to_words(str(n))
+    for scale, name in SCALES:
+        if n >= scale:
+            high, rest = divmod(n, scale)
+            return f"{number_to_words(high)} {name}" + (f" {number_to_words(rest)}" if rest else "")
+
+
+def digits_to_words(digits):
+    return " ".join(ONES[int(d)] for d in digits)
+
+
+def ordinal_words(n):
+    """e.g. 21 -> "twenty-first" """
+    words = number_to_words(n)
+    head, last = words[:LAST_WORD.search(words).start()], LAST_WORD.search(words).group(0)
+    if last in IRREGULAR_ORDINALS:
+        return head + IRREGULAR_ORDINALS[last]
+    if last.endswith("y"):
+        return head + last[:-1] + "ieth"
+    return head + last + "th"
+
+
+def year_words(year):
+    """e.g. 1984 -> "nineteen eighty-four", 2005 -> "two thousand five" """
+    if 2000 <= year < 2010:
+        return number_to_words(year)
+    high, low = divmod(year, 100)
+    if low == 0:
+        return f"{number_to_words(high)} hundred"
+    if low < 10:
+        return f"{number_to_words(high)} oh {ONES[low]}"
+    return f"{number_to_words(high)} {number_to_words(low)}"
+
+
+def date_words(year, month, day):
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f"{MONTHS[month - 1]} {ordinal_words(day)}, {year_words(year)}"
+
+
+def speak_domain(domain):
+    domain = domain.rstrip(".,;:!?")
+    if domain.lower().startswith("www."):
+        domain = domain[4:]
+    return domain.replace(".", " dot ")
+
+
+def replace_iso_date(match):
+    return date_words(int(match.group(1)), int(match.group(2)), int(match.group(3))) or match.group(0)
+
+
+def replace_us_date(match):
+    return date_words(int(match.group(3)), int(match.group(1)), int(match.group(2))) or match.group(0)
+
+
+def replace_clock_time(match):
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return match.group(0)
+    if minutes == 0:
+        return f"{number_to_words(hours)} o'clock"
+    if minutes < 10:
+        return f"{number_to_words(hours)} oh {ONES[minutes]}"
+    return f"{number_to_words(hours)} {number_to_words(minutes)}"
+
+
+def replace_currency(match):
+    unit, subunit = CURRENCIES[match.group(1)]
+    amount = int(match.group(2).replace(",", ""))
+    words = f"{number_to_words(amount)} {unit}" + ("" if amount == 1 else "s")
+    cents = int(match.group(3) or 0)
+    if cents:
+        plural = "pence" if subunit == "penny" else subunit + "s"
+        words += f" and {number_to_words(cents)} {subunit if cents == 1 else plural}"
+    return words
+
+
+def replace_number(match):
+    sign, whole, fraction = match.groups()
+    words = number_to_words(int(whole.replace(",", "")))
+    if fraction:
+        words += " point " + digits_to_words(fraction)
+    return ("minus " if sign else "") + words
+
+
+class LexiconTrie:
+    """Pronunciation entries in a character trie, compiled into one regex
+
+    The regex has each shared prefix written once, so a lexicon of
+    thousands of entries matches in a single pass instead of trying every
+    entry at every position.
+    """
+
+    def __init__(self, entries=None):
+        self.root = {}
+        self.replacements = {}
+        for word, replacement in (entries or {}).items():
+            self.add(word, replacement)
+
+    def add(self, word, replacement):
+        key = WHITESPACE.sub(" ", word.strip()).lower()
+        if not key:
+            return
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = True
+        self.replacements[key] = replacement
+
+    def _pattern(self, node):
+        # Spaces in entries match any run of whitespace, line breaks included
+        alternatives = [(r"\s+" if char == " " else re.escape(char)) + self._pattern(child)
+                        for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    def compile(self):
+        """Regex matching any entry as whole words, longest entry first; None if empty"""
+        if not self.replacements:
+            return None
+        return re.compile(r'(?<!\w)' + self._pattern(self.root) + r'(?!\w)', re.IGNORECASE)
+
+    def apply(self, text, pattern=None):
+        pattern = pattern or self.compile()
+        if pattern is None:
+            return text
+        return pattern.sub(lambda match: self.replacements[WHITESPACE.sub(" ", match.group(0)).lower()], text)
+
+
+def read_lexicon(path):
+    entries = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                word, _, replacement = line.partition("=")
+                entries[word.strip()] = replacement.strip()
+    return entries
+
+
+@functools.lru_cache(maxsize=8)
+def compiled_lexicon(path, mtime):
+    """The trie and its regex for a lexicon file; cached per file version"""
+    trie = LexiconTrie(read_lexicon(path))
+    return trie, trie.compile()
+
+
+def user_lexicon(path=None):
+    """The (trie, regex) for the lexicon file at path, TTS_LEXICON or the default location"""
+    path = path or os.environ.get("TTS_LEXICON", DEFAULT_LEXICON)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None, None
+    return compiled_lexicon(path, mtime)
+
+
+def strip_markup(text):
+    # The cheap substring checks skip passes that can't match
+    if "&" in text:
+        text = html.unescape(text)
+    if "<" in text:
+        text = HTML_TAG.sub(" ", text)
+    if "](" in text:
+        text = MARKDOWN_LINK.sub(r"\1", text)
+    text = MARKDOWN_LINE.sub("", text)
+    if "*" in text or "`" in text or "~~" in text or "__" in text:
+        text = EMPHASIS.sub(r"\2", text)
+    return text
+
+
+def expand(text):
+    """Spell out URLs, e-mail addresses, dates, times, amounts, numbers and abbreviations"""
+    if "://" in text or "www." in text:
+        text = URL.sub(lambda m: "link to " + speak_domain(m.group(1)), text)
+    if "@" in text:
+        text = EMAIL.sub(lambda m: f"{m.group(1)} at {speak_domain(m.group(2))}", text)
+    if DIGIT.search(text):
+        text = ISO_DATE.sub(replace_iso_date, text)
+        text = US_DATE.sub(replace_us_date, text)
+        text = MONTH_DAY.sub(lambda m: f"{m.group(1)} {ordinal_words(int(m.group(2)))}", text)
+        text = PHONE.sub(lambda m: ", ".join(digits_to_words(part) for part in re.split(r'[-.]', m.group(0))),
+                         text)
+        text = VERSION.sub(lambda m: " point ".join(number_to_words(int(part)) for part in m.group(0).split(".")),
+                           text)
+        text = CLOCK_TIME.sub(replace_clock_time, text)
+        text = CURRENCY.sub(replace_currency, text)
+        text = PERCENT.sub(lambda m: f"{m.group(1)} percent", text)
+        text = ORDINAL.sub(lambda m: ordinal_words(int(m.group(1))), text)
+        text = YEAR.sub(lambda m: year_words(int(m.group(1))), text)
+        text = NUMBER.sub(replace_number, text)
+    return ABBREVIATION.sub(lambda m: ABBREVIATIONS[m.group(0)], text)
+
+
+def normalize(text, lexicon=None):
+    """Clean and expand text for speaking; the result is also the synthesis cache key
+
+    lexicon is a LexiconTrie; by default the user's lexicon file is used.
+    """
+    text = CONTROL.sub("", text)
+    text = strip_markup(text)
+    text = SYMBOL_RUN.sub(" ", text)
+    # The lexicon goes first so entries like "3M" or "Dr. Who" see the text as written
+    if lexicon is None:
+        lexicon, pattern = user_lexicon()
+    else:
+        pattern = lexicon.compile()
+    if lexicon is not None:
+        text = lexicon.apply(text, pattern)
+    text = expand(text)
+    return EXTRA_WHITESPACE.sub(" ", text).strip()
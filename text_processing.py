@@ -0,0 +1,61 @@
+import re
+
+from text_normalization import NON_FINAL_ABBREVIATIONS
+
+# Sentence ends (., ! or ? followed by whitespace) and blank lines between paragraphs
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+
+# Clause breaks used to split sentences that are still too long
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:])\s+')
+
+
+def split_sentences(text):
+    """Split text into sentences, dropping empty pieces
+
+    A period after an abbreviation such as "Dr." does not end the sentence.
+    """
+    sentences = []
+    pending = ""
+    for piece in SENTENCE_BOUNDARY.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        piece = f"{pending} {piece}" if pending else piece
+        if piece.rsplit(None, 1)[-1] in NON_FINAL_ABBREVIATIONS:
+            pending = piece
+        else:
+            sentences.append(piece)
+            pending = ""
+    if pending:
+        sentences.append(pending)
+    return sentences
+
+
+def split_long_piece(piece, max_chars):
+    """Break a piece longer than max_chars at clause breaks, then at spaces"""
+    if len(piece) <= max_chars:
+        return [piece]
+
+    parts = []
+    current = ""
+    for clause in CLAUSE_BOUNDARY.split(piece):
+        # Clauses that are too long on their own are cut at word boundaries
+        words = clause.split() if len(clause) > max_chars else [clause]
+        for word in words:
+            candidate = f"{current} {word}" if current else word
+            if len(candidate) > max_chars and current:
+                parts.append(current)
+                current = word
+            else:
+                current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_chunks(text, max_chars=250):
+    """Split text into sentence/clause sized chunks for streaming synthesis"""
+    chunks = []
+    for sentence in split_sentences(text):
+        chunks.extend(split_long_piece(sentence, max_chars))
+    return chunks
@@ -0,0 +1,143 @@
+import re
+from bisect import bisect_right
+
+WORD = re.compile(r'\S+')
+
+
+def word_spans(text):
+    """(start, end) character offsets of each whitespace-separated word"""
+    return [match.span() for match in WORD.finditer(text)]
+
+
+def estimate_words(text, frames):
+    """Start frame of each word of text, splitting the audio in proportion to word length
+
+    Used for engines without word events, and to fill in words an engine
+    reported no event for.
+    """
+    weights = [end - start + 1 for start, end in word_spans(text)]
+    total = sum(weights) or 1
+    starts = []
+    position = 0
+    for weight in weights:
+        starts.append(int(frames * position / total))
+        position += weight
+    return starts
+
+
+def words_from_events(text, frames, events):
+    """Start frame of each word of text from (char_start, char_end, fraction of the audio) events"""
+    starts = estimate_words(text, frames)
+    word_starts = [start for start, _ in word_spans(text)]
+    for char_start, _, fraction in events:
+        number = bisect_right(word_starts, char_start) - 1
+        if number >= 0:
+            starts[number] = int(fraction * frames)
+    return starts
+
+
+def locate_chunks(text, chunks):
+    """Character span of each chunk in text
+
+    Chunks come from split_into_chunks(), which may have collapsed
+    whitespace, so they are located word by word rather than with find().
+    Returns a list of (start, end, word_spans) with word_spans in text.
+    """
+    spans = word_spans(text)
+    located = []
+    index = 0
+    for chunk in chunks:
+        count = len(chunk.split())
+        chunk_spans = spans[index:index + count]
+        index += count
+        if chunk_spans:
+            located.append((chunk_spans[0][0], chunk_spans[-1][1], chunk_spans))
+        else:
+            position = located[-1][1] if located else 0
+            located.append((position, position, []))
+    return located
+
+
+def format_timestamp(seconds, separator):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+class TimingIndex:
+    """Sentence and word times for a document, for highlighting, seeking and subtitles
+
+    sentences are (start_time, end_time, char_start, char_end) and words
+    (start_time, char_start, char_end), both in document order, with times
+    in seconds and character offsets into the document text. Lookups by time
+    or by character offset are binary searches.
+    """
+
+    def __init__(self, text, sentences, words):
+        self.text = text
+        self.sentences = sentences
+        self.words = words
+        self.sentence_times = [sentence[0] for sentence in sentences]
+        self.sentence_chars = [sentence[2] for sentence in sentences]
+        self.word_times = [word[0] for word in words]
+
+    @classmethod
+    def build(cls, text, chunks, buffers, speed=1.0):
+        """Index a document synthesized as chunks, one AudioBuffer each
+
+        Word timings come from each buffer's words, recorded from the
+        engine, or are estimated. The engine may have spoken a different
+        number of words than the chunk has (after text normalization), so
+        chunk words are matched to spoken words by their relative position.
+        speed is the rate the audio was played back at, which scales every time.
+        """
+        sentences = []
+        words = []
+        offset = 0.0
+        for (start, end, spans), chunk, buffer in zip(locate_chunks(text, chunks), chunks, buffers):
+            duration = len(buffer.samples) / buffer.sample_rate
+            sentences.append((offset / speed, (offset + duration) / speed, start, end))
+
+            spoken = buffer.words if buffer.words is not None else estimate_words(chunk, len(buffer.samples))
+            for number, (char_start, char_end) in enumerate(spans):
+                if spoken:
+                    time = offset + spoken[number * len(spoken) // len(spans)] / buffer.sample_rate
+                    words.append((time / speed, char_start, char_end))
+            offset += duration
+        return cls(text, sentences, words)
+
+    def sentence_at_time(self, seconds):
+        return max(0, bisect_right(self.sentence_times, seconds) - 1)
+
+    def sentence_at_char(self, offset):
+        return max(0, bisect_right(self.sentence_chars, offset) - 1)
+
+    def word_at_time(self, seconds):
+        """Index of the word being spoken at seconds, or None before the first"""
+        index = bisect_right(self.word_times, seconds) - 1
+        return index if index >= 0 else None
+
+    def sentence_text(self, index):
+        _, _, start, end = self.sentences[index]
+        return " ".join(self.text[start:end].split())
+
+    def to_srt(self):
+        cues = []
+        for index, (start, end, _, _) in enumerate(self.sentences):
+            cues.append(f"{index + 1}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n"
+                        f"{self.sentence_text(index)}\n")
+        return "\n".join(cues)
+
+    def to_webvtt(self):
+        cues = [f"{format_timestamp(start, '.')} --> {format_timestamp(end, '.')}\n{self.sentence_text(index)}\n"
+                for index, (start, end, _, _) in enumerate(self.sentences)]
+        return "\n".join(["WEBVTT\n"] + cues)
+
+    def save_subtitles(self, file_path):
+        """Write SRT, or WebVTT for a .vtt path"""
+        content = self.to_webvtt() if file_path.lower().endswith(".vtt") else self.to_srt()
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return file_path
@@ -0,0 +1,389 @@
+"""Local HTTP synthesis service.
+
+Usage:
+    python tts_server.py [--port 8750] [--backend espeak-ng] [--workers 2]
+
+Endpoints:
+    POST /synthesize   JSON {"text": ..., "voice_type", "rate", "pitch", "pause_ms", "loudness",
+                             "format": "wav" | "mp3"}
+                       Streams audio back with chunked transfer encoding,
+                       sentence by sentence as it is synthesized.
+    GET  /voices       Voices of the server's engine, as JSON
+    GET  /health       Queue depth and worker count, as JSON
+    GET  /metrics      Stage timings, cache and queue metrics in the Prometheus
+                       text format (with --metrics)
+
+Sentences from concurrent requests are merged into batches for a pool of
+engine threads, each owning its own engine. Engines that can't run twice in
+one process (pyttsx3) get a single thread. Each client address may have at
+most --per-client requests in flight (429 beyond that), and new requests are
+refused with 503 while --max-queue sentences are already waiting.
+"""
+import argparse
+import asyncio
+import io
+import json
+import queue
+import struct
+import threading
+import time
+
+import metrics
+from audio_cache import AudioCache
+from audio_export import encoder_options
+from backends import BACKENDS, DEFAULT_SETTINGS, VOICE_TYPES, choose_backend, create_backend
+from text_processing import split_into_chunks
+from voice_catalog import get_voices
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+# Accepted range of each integer setting, as in the app
+SETTING_RANGES = {"rate": (50, 200), "pitch": (50, 200), "pause_ms": (0, 5000)}
+
+# Streamed MP3 chunks are concatenated, so leave out per-file tags and headers
+STREAM_MP3_PARAMETERS = ["-write_xing", "0", "-id3v2_version", "0"]
+
+
+class EnginePool:
+    """Threads that each own one engine and synthesize batches of sentences"""
+
+    def __init__(self, backend_name, workers=2, cache=None):
+        self.backend_name = backend_name
+        self.batches = queue.Queue()
+        self.threads = [threading.Thread(target=self._run, args=(cache,), daemon=True)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self, cache):
+        try:
+            backend = create_backend(self.backend_name, cache=cache)
+        except Exception as e:
+            # Fail every batch rather than leave its requests waiting forever
+            backend, error = None, e
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            loop, items, release = batch
+            # Sentences of clients that have gone away are dropped unsynthesized
+            live = [item for item in items if not item[2].cancelled()]
+            try:
+                if not live:
+                    continue
+                if backend is None:
+                    raise error
+                buffers = backend.synthesize_batch([(text, settings) for text, settings, _ in live])
+            except Exception as e:
+                if backend is None or len(live) == 1:
+                    for _, _, future in live:
+                        loop.call_soon_threadsafe(_set_exception, future, e)
+                else:
+                    self._synthesize_each(backend, loop, live)
+            else:
+                for (_, _, future), buffer in zip(live, buffers):
+                    loop.call_soon_threadsafe(_set_result, future, buffer)
+            finally:
+                # The queue only has room again once the engine is done with them
+                loop.call_soon_threadsafe(release, len(items))
+
+    def _synthesize_each(self, backend, loop, items):
+        # A batch mixes sentences from different requests, so after a failure each is
+        # retried alone: the error only reaches the sentence that caused it
+        for text, settings, future in items:
+            try:
+                buffer = backend.synthesize(text, settings)
+            except Exception as e:
+                loop.call_soon_threadsafe(_set_exception, future, e)
+            else:
+                loop.call_soon_threadsafe(_set_result, future, buffer)
+
+    def stop(self):
+        for _ in self.threads:
+            self.batches.put(None)
+
+
+def _set_result(future, result):
+    if not future.cancelled():
+        future.set_result(result)
+
+
+def _set_exception(future, exception):
+    if not future.cancelled():
+        future.set_exception(exception)
+
+
+class Batcher:
+    """Collects sentences from concurrent requests into batches for the engine pool"""
+
+    def __init__(self, pool, batch_size=8, batch_window=0.01, max_queue=256):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.pending = []
+        self.in_flight = 0
+        self.flush_handle = None
+
+    def has_room(self, count):
+        return self.in_flight + count <= self.max_queue
+
+    def submit(self, text, settings):
+        """Queue one sentence; returns an asyncio future for its AudioBuffer"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight += 1
+        metrics.set_gauge("tts_queue_depth", self.in_flight, queue="server")
+        self.pending.append((text, settings, future))
+
+        # Send full batches at once; otherwise wait briefly for more to arrive
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self.flush)
+        return future
+
+    def _release(self, count):
+        # Called by the engine pool when it has finished, or dropped, a batch
+        self.in_flight -= count
+        metrics.set_gauge("tts_queue_depth", self.in_flight, queue="server")
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self.pool.batches.put((asyncio.get_running_loop(), batch, self._release))
+
+
+def parse_request(body):
+    """(text, format, settings) from a /synthesize body; ValueError if anything is invalid"""
+    request = json.loads(body or b"{}")
+    if not isinstance(request, dict):
+        raise ValueError("The body must be a JSON object")
+    text = request.get("text")
+    if not isinstance(text, str):
+        raise ValueError("text must be a string")
+    audio_format = request.get("format", "wav")
+    if audio_format not in ("wav", "mp3"):
+        raise ValueError("format must be wav or mp3")
+
+    settings = {key: request.get(key, value) for key, value in DEFAULT_SETTINGS.items()}
+    if settings["voice_type"] not in VOICE_TYPES:
+        raise ValueError(f"voice_type must be one of {', '.join(VOICE_TYPES)}")
+    for key, (low, high) in SETTING_RANGES.items():
+        value = settings[key]
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError(f"{key} must be an integer from {low} to {high}")
+    loudness = settings["loudness"]
+    if loudness is not None and (not isinstance(loudness, (int, float)) or isinstance(loudness, bool)
+                                 or not -70 <= loudness <= 0):
+        raise ValueError("loudness must be a number of LUFS from -70 to 0, or null")
+    return text.strip(), audio_format, settings
+
+
+def streaming_wav_header(sample_rate, channels):
+    """WAV header with unknown (maximum) lengths, for audio of unknown duration"""
+    byte_rate = sample_rate * channels * 2
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+
+def encode_mp3(buffer, bitrate):
+    options = encoder_options("mp3", bitrate)
+    options["parameters"] = STREAM_MP3_PARAMETERS
+    mp3 = io.BytesIO()
+    buffer.to_segment().export(mp3, **options)
+    return mp3.getvalue()
+
+
+class TTSServer:
+    def __init__(self, batcher, backend_name, per_client=4, bitrate="128k"):
+        self.batcher = batcher
+        self.backend_name = backend_name
+        self.per_client = per_client
+        self.bitrate = bitrate
+        self.clients = {}
+        self.voices = None
+
+    async def handle(self, reader, writer):
+        client = writer.get_extra_info("peername")[0]
+        try:
+            method, path, body = await self.read_request(reader)
+            if method == "GET" and path == "/health":
+                await self.send_json(writer, 200, {"backend": self.backend_name,
+                                                   "queue_depth": self.batcher.in_flight,
+                                                   "workers": len(self.batcher.pool.threads)})
+            elif method == "GET" and path == "/metrics" and metrics.enabled:
+                await self.send_text(writer, 200, metrics.registry.render(), PROMETHEUS_CONTENT_TYPE)
+            elif method == "GET" and path == "/voices":
+                await self.send_json(writer, 200, await self.list_voices())
+            elif method == "POST" and path == "/synthesize":
+                with metrics.span("request", path=path):
+                    await self.synthesize(client, body, writer)
+            else:
+                await self.send_json(writer, 404, {"error": "Not found"})
+        except (ValueError, KeyError) as e:
+            await self.send_json(writer, 400, {"error": str(e)})
+        except ConnectionError:
+            pass
+        except Exception as e:
+            # Failures once audio is streaming are handled in synthesize(), so no response has started
+            metrics.count("tts_errors_total", stage="server")
+            try:
+                await self.send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            raise ValueError("Malformed request")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return request_line[0].upper(), request_line[1].split("?")[0], body
+
+    async def list_voices(self):
+        # From the on-disk voice catalog; an engine is only created if it is stale
+        if self.voices is None:
+            backend = BACKENDS[self.backend_name]
+            voices = await asyncio.to_thread(get_voices, backend.catalog_key(),
+                                             lambda: create_backend(self.backend_name).list_voices(),
+                                             backend.capabilities())
+            self.voices = [voice._asdict() for voice in voices]
+        return self.voices
+
+    async def send_json(self, writer, status, payload):
+        await self.send_text(writer, status, json.dumps(payload), "application/json")
+
+    async def send_text(self, writer, status, text, content_type):
+        body = text.encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    async def write_chunk(self, writer, data):
+        writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def synthesize(self, client, body, writer):
+        text, audio_format, settings = parse_request(body)
+        chunks = split_into_chunks(text)
+        if not chunks:
+            raise ValueError("No text to synthesize")
+
+        # Per-client concurrency limit and queue-depth backpressure
+        if self.clients.get(client, 0) >= self.per_client:
+            await self.send_json(writer, 429, {"error": "Too many concurrent requests"})
+            return
+        if not self.batcher.has_room(len(chunks)):
+            await self.send_json(writer, 503, {"error": "Server busy, retry later"})
+            return
+
+        self.clients[client] = self.clients.get(client, 0) + 1
+        received = time.perf_counter()
+        futures = [self.batcher.submit(chunk, settings) for chunk in chunks]
+        try:
+            # Wait for the first sentence so errors can still be reported with a status code
+            try:
+                first = await futures[0]
+            except Exception as e:
+                metrics.count("tts_errors_total", stage="synthesize")
+                await self.send_json(writer, 500, {"error": str(e)})
+                return
+            metrics.observe("tts_time_to_audio_seconds", time.perf_counter() - received, mode="server")
+
+            content_type = "audio/wav" if audio_format == "wav" else "audio/mpeg"
+            writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                         f"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n".encode("latin-1"))
+            if audio_format == "wav":
+                await self.write_chunk(writer, streaming_wav_header(first.sample_rate, first.channels))
+
+            # Write each sentence as soon as it is ready, in order
+            try:
+                for future in futures:
+                    buffer = await future
+                    if audio_format == "wav":
+                        data = buffer.pcm16().tobytes()
+                    else:
+                        data = await asyncio.to_thread(encode_mp3, buffer, self.bitrate)
+                    await self.write_chunk(writer, data)
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            except ConnectionError:
+                pass
+            except Exception:
+                # The status has been sent; closing without the final chunk tells the client it failed
+                metrics.count("tts_errors_total", stage="synthesize")
+        finally:
+            for future in futures:
+                future.cancel()
+            self.clients[client] -= 1
+            if not self.clients[client]:
+                del self.clients[client]
+
+
+async def serve(args):
+    backend_name = args.backend or choose_backend()
+    workers = args.workers if BACKENDS[backend_name].thread_safe else 1
+    cache = AudioCache() if not args.no_cache else None
+    pool = EnginePool(backend_name, workers=workers, cache=cache)
+    batcher = Batcher(pool, batch_size=args.batch_size, batch_window=args.batch_window_ms / 1000,
+                      max_queue=args.max_queue)
+    server = TTSServer(batcher, backend_name, per_client=args.per_client, bitrate=args.bitrate)
+
+    listener = await asyncio.start_server(server.handle, args.host, args.port)
+    print(f"Serving {backend_name} on http://{args.host}:{args.port} with {workers} engine workers")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        pool.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP text-to-speech service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="TTS engine (default: the first one available on this host)")
+    parser.add_argument("--workers", type=int, default=2,
+                        help="Engine threads, one engine each; always 1 for engines that aren't "
+                             "thread-safe, such as pyttsx3")
+    parser.add_argument("--batch-size", type=int, default=8, help="Most sentences per engine batch")
+    parser.add_argument("--batch-window-ms", type=float, default=10.0,
+                        help="How long to wait for more sentences before sending a partial batch")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="Sentences allowed to wait before new requests get 503")
+    parser.add_argument("--per-client", type=int, default=4, help="Concurrent requests per client address")
+    parser.add_argument("--bitrate", default="128k", help="Bitrate for streamed MP3")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the synthesis cache")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Collect stage timings and serve them at GET /metrics")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help=f"Append a Chrome trace of every stage to FILE (default: ${metrics.TRACE_FILE_ENV})")
+    args = parser.parse_args(argv)
+    metrics.configure(trace_path=args.trace, collect=args.metrics)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from audio_cache import DEFAULT_CACHE_DIR
+
+Voice = namedtuple("Voice", "id name gender language")
+
+# Voice lists rarely change, so they are only re-enumerated after a week
+MAX_AGE = 7 * 24 * 3600
+
+lock = threading.Lock()
+
+
+def catalog_file():
+    return os.path.join(os.environ.get("TTS_CACHE_DIR", DEFAULT_CACHE_DIR), "voices.json")
+
+
+def load_catalog():
+    try:
+        with open(catalog_file(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_catalog(catalog):
+    path = catalog_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temp file first so a crash never leaves a half-written catalog
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def get_voices(key, list_voices, capabilities=None, refresh=False):
+    """Voices for a backend from the on-disk catalog
+
+    list_voices() is only called (and the result stored under key) when the
+    catalog has no fresh entry, so the engine isn't queried on every start.
+    """
+    with lock:
+        entry = load_catalog().get(key)
+        if entry and not refresh and time.time() - entry["created"] < MAX_AGE:
+            return [Voice(**voice) for voice in entry["voices"]]
+
+        voices = list_voices()
+        catalog = load_catalog()
+        catalog[key] = {"voices": [voice._asdict() for voice in voices],
+                        "capabilities": capabilities or {},
+                        "created": time.time()}
+        try:
+            save_catalog(catalog)
+        except OSError:
+            pass  # The catalog is only an optimization
+        return voices
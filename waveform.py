@@ -0,0 +1,120 @@
+import numpy as np
+from matplotlib.patches import Polygon
+
+from audio_analysis import min_max_envelope, peak_and_rms
+
+
+class WaveformView:
+    """Waveform plot drawn as a min/max envelope, one value pair per pixel column
+
+    A vertical line marks the playhead; clicking the plot calls on_seek(seconds).
+    Given a Blitter, the playhead is one of its animated artists and moving it
+    doesn't redraw the plot.
+    """
+
+    def __init__(self, ax, canvas, on_seek=None, blitter=None):
+        self.ax = ax
+        self.canvas = canvas
+        self.on_seek = on_seek
+        self.blitter = blitter
+        self.data = None
+        self.sample_rate = 1
+        self.scale = 1.0
+        self.envelope = None
+        self.playhead = None
+
+        self.reset_axes()
+
+        # Scroll to zoom around the cursor, double-click to show the whole clip
+        self.canvas.mpl_connect("scroll_event", self.on_scroll)
+        self.canvas.mpl_connect("button_press_event", self.on_click)
+
+    def reset_axes(self):
+        self.ax.clear()
+        self.ax.set_title("Audio Waveform")
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_ylabel("Amplitude")
+        self.ax.set_ylim(-1, 1)
+        self.ax.grid(True)
+
+        # A single filled polygon that is updated in place on every redraw
+        self.envelope = Polygon(np.zeros((1, 2)), closed=True, linewidth=0.5)
+        self.ax.add_patch(self.envelope)
+        self.playhead = self.ax.axvline(0, color="red", linewidth=1, visible=False)
+        if self.blitter is not None:
+            self.blitter.add(self.playhead)
+
+    @property
+    def duration(self):
+        return 0 if self.data is None else len(self.data) / self.sample_rate
+
+    def set_audio(self, data, sample_rate):
+        """Show a new clip, fully zoomed out"""
+        # data may be memory-mapped; it is only ever read block by block
+        self.data = data
+        self.sample_rate = sample_rate
+
+        # Normalize for display using the peak of the whole clip
+        peak, _ = peak_and_rms(data)
+        self.scale = 1.0 / (peak + 1e-10)
+
+        self.set_window(0, self.duration)
+
+    def set_window(self, start_time, end_time):
+        """Recompute the envelope for the visible time window only"""
+        if self.data is None or len(self.data) == 0:
+            return
+
+        start = max(0, int(start_time * self.sample_rate))
+        end = min(len(self.data), int(np.ceil(end_time * self.sample_rate)))
+        if end - start < 2:
+            return
+
+        columns = max(1, int(self.ax.get_window_extent().width))
+        low, high, step = min_max_envelope(self.data[start:end], columns)
+
+        # Outline: along the maxima left to right, back along the minima
+        times = (start + np.arange(len(low)) * step) / self.sample_rate
+        xy = np.empty((2 * len(low), 2))
+        xy[:len(low), 0] = times
+        xy[:len(low), 1] = high * self.scale
+        xy[len(low):, 0] = times[::-1]
+        xy[len(low):, 1] = low[::-1] * self.scale
+
+        self.envelope.set_xy(xy)
+        self.ax.set_xlim(start / self.sample_rate, end / self.sample_rate)
+        self.canvas.draw_idle()
+
+    def set_playhead(self, seconds, draw=True):
+        """Move the playhead line; None hides it. draw=False leaves the redraw to the caller"""
+        if seconds is None:
+            self.playhead.set_visible(False)
+        else:
+            self.playhead.set_xdata([seconds, seconds])
+            self.playhead.set_visible(True)
+        if not draw:
+            return
+        if self.blitter is not None:
+            self.blitter.update()
+        else:
+            self.canvas.draw_idle()
+
+    def on_scroll(self, event):
+        """Zoom in or out around the mouse position"""
+        if event.inaxes is not self.ax or self.data is None:
+            return
+
+        start, end = self.ax.get_xlim()
+        factor = 0.5 if event.button == "up" else 2.0
+        width = min(self.duration, (end - start) * factor)
+        center = event.xdata
+        start = min(max(0, center - (center - start) * factor), self.duration - width)
+        self.set_window(start, start + width)
+
+    def on_click(self, event):
+        if event.inaxes is not self.ax:
+            return
+        if event.dblclick:
+            self.set_window(0, self.duration)
+        elif self.on_seek is not None and event.xdata is not None:
+            self.on_seek(event.xdata)